@@ -298,6 +298,23 @@ def analyze_trend(history):
     else:
         return "Estável"
 
+def analyze_trend_from_rollups(rollups):
+    """Analisa tendência pelos rollups horários (score médio dos 3 buckets mais recentes)"""
+    scores = []
+    for bucket in rollups[:3]:
+        stats = bucket.get("params", {}).get("score", {})
+        if stats.get("count"):
+            scores.append(stats["sum"] / stats["count"])
+    if len(scores) < 3:
+        return "Dados insuficientes"
+    
+    if scores[0] > scores[-1]:
+        return "Melhorando"
+    elif scores[0] < scores[-1]:
+        return "Declinando"
+    else:
+        return "Estável"
+
 def calculate_sustainability(soil_data, profile):
     """Calcula nível de sustentabilidade"""
     if not soil_data:
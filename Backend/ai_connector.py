@@ -1,10 +1,19 @@
 import requests
 import json
 import time
+import threading
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from ollama_config import *
 
+# Sessão única do processo: conexões keep-alive reaproveitadas entre chamadas
+_session = None
+_session_lock = threading.Lock()
+
 def create_session_with_retries():
     session = requests.Session()
     retry_strategy = Retry(
@@ -12,21 +21,238 @@ def create_session_with_retries():
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy,
+        pool_connections=1,  # um único host (Ollama)
+        pool_maxsize=OLLAMA_POOL_SIZE
+    )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session_with_retries()
+    return _session
+
+class OllamaHealthMonitor:
+    """
+    Consulta /api/tags em segundo plano e guarda o resultado, para que o
+    caminho quente (chat, títulos, dicas) faça uma única requisição.
+    As próprias chamadas também atualizam o estado (sucesso ou falha de conexão).
+    """
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self.alive = None  # None: ainda não verificado
+        self.last_check = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self) -> bool:
+        try:
+            response = get_session().get(OLLAMA_TAGS_URL, timeout=HEALTH_CHECK_TIMEOUT)
+            self.mark(response.status_code == 200, None if response.status_code == 200 else f"HTTP {response.status_code}")
+        except Exception as e:
+            self.mark(False, str(e))
+        return self.alive
+
+    def mark(self, alive: bool, error=None):
+        if alive != self.alive:
+            print(f"--- CONECTOR IA: Ollama {'disponível' if alive else 'indisponível'}{f' ({error})' if error else ''} ---")
+        self.alive = alive
+        self.last_error = error
+        self.last_check = time.time()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {
+            "alive": self.alive,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "interval": self.interval
+        }
+
+health_monitor = OllamaHealthMonitor()
+
+class LLMQueueFullError(Exception):
+    """Fila de gerações cheia: a requisição é recusada sem esperar"""
+
+class LLMTicket:
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.changed = asyncio.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class LLMScheduler:
+    """
+    Fila de prioridade na frente do Ollama (que atende bem uma geração por vez).
+    No máximo `max_in_flight` gerações em andamento; quem espera é ordenado por
+    prioridade e chegada, e acima de `max_queue` na espera a entrada é recusada.
+    Roda no loop do asyncio da API; a geração em si continua em to_thread.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, max_queue: int = LLM_MAX_QUEUE):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self.served = 0
+        self.rejected = 0
+
+    def enter(self, priority: int) -> LLMTicket:
+        """Entra na fila (ou recebe a vaga na hora); LLMQueueFullError se a fila estiver cheia"""
+        ticket = LLMTicket(priority, next(self._seq))
+        if self.in_flight < self.max_in_flight and not self._waiting:
+            self._grant(ticket)
+            return ticket
+        if self.is_full():
+            self.rejected += 1
+            raise LLMQueueFullError(f"Fila da IA cheia ({len(self._waiting)} aguardando)")
+        heapq.heappush(self._waiting, ticket)
+        self._notify()
+        return ticket
+
+    def is_full(self) -> bool:
+        """Admissão: uma nova entrada agora seria recusada?"""
+        return self.in_flight >= self.max_in_flight and len(self._waiting) >= self.max_queue
+
+    def position(self, ticket: LLMTicket) -> int:
+        """Posição na fila (1 = próximo); 0 se já tem a vaga"""
+        if ticket.granted:
+            return 0
+        return sum(1 for other in self._waiting if other < ticket) + 1
+
+    async def wait_turn(self, ticket: LLMTicket):
+        """Gera a posição na fila sempre que ela muda, até receber a vaga"""
+        last = None
+        while True:
+            # Limpa antes de ler o estado: um aviso que chegar depois fica marcado
+            ticket.changed.clear()
+            if ticket.granted:
+                return
+            position = self.position(ticket)
+            if position != last:
+                last = position
+                yield position
+            # A vaga pode ter saído enquanto o consumidor processava o yield
+            if ticket.granted:
+                return
+            await ticket.changed.wait()
+
+    def release(self, ticket: LLMTicket):
+        """Libera a vaga (ou sai da fila, se ainda esperava) e chama o próximo"""
+        if ticket.granted:
+            ticket.granted = False
+            self.in_flight -= 1
+            self.served += 1
+        elif ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+        while self._waiting and self.in_flight < self.max_in_flight:
+            self._grant(heapq.heappop(self._waiting))
+        self._notify()
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        """Espera a vaga sem reportar posição (títulos, dicas)"""
+        ticket = self.enter(priority)
+        try:
+            async for _ in self.wait_turn(ticket):
+                pass
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _grant(self, ticket: LLMTicket):
+        ticket.granted = True
+        self.in_flight += 1
+        ticket.changed.set()
+
+    def _notify(self):
+        for ticket in self._waiting:
+            ticket.changed.set()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiting),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "served": self.served,
+            "rejected": self.rejected
+        }
+
+scheduler = LLMScheduler()
+
+class GenerationStats:
+    """
+    Gerações concluídas e canceladas (cliente desconectou).
+    Tokens economizados são estimados: média de tokens das respostas completas
+    (ou o limite num_predict, se ainda não houver nenhuma) menos o já gerado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.completed_tokens = 0
+        self.cancelled = 0
+        self.tokens_saved = 0
+
+    def record_completed(self, tokens: int):
+        with self._lock:
+            self.completed += 1
+            self.completed_tokens += tokens
+
+    def record_cancelled(self, tokens_generated: int) -> int:
+        with self._lock:
+            expected = self.completed_tokens / self.completed if self.completed else MODEL_OPTIONS["num_predict"]
+            saved = max(int(min(expected, MODEL_OPTIONS["num_predict"])) - tokens_generated, 0)
+            self.cancelled += 1
+            self.tokens_saved += saved
+            return saved
+
+    def stats(self):
+        return {
+            "completed": self.completed,
+            "avg_tokens": round(self.completed_tokens / self.completed, 1) if self.completed else None,
+            "cancelled": self.cancelled,
+            "tokens_saved": self.tokens_saved
+        }
+
+generation_stats = GenerationStats()
+
 def test_ollama_connection():
-    try:
-        session = create_session_with_retries()
-        response = session.get(OLLAMA_TAGS_URL, timeout=CONNECTION_TIMEOUT)
-        return response.status_code == 200
-    except:
-        return False
+    """Estado em cache do monitor; verifica na hora só se ainda não houve checagem"""
+    if health_monitor.alive is None:
+        return health_monitor.check()
+    return health_monitor.alive
 
 def get_ollama_response(prompt: str, stream: bool = False):
-    if not test_ollama_connection():
+    if health_monitor.alive is False:
         raise Exception("Ollama não está rodando! Execute: ollama serve")
     
     print(f"--- CONECTOR IA: Enviando para llama3.2 (Stream: {stream}) ---")
@@ -48,16 +274,21 @@ def get_ollama_response(prompt: str, stream: bool = False):
         try:
             print(f"Tentativa {attempt + 1}/{max_retries} - Timeout: {base_timeout}s")
             
-            session = create_session_with_retries()
-            response = session.post(
+            response = get_session().post(
                 OLLAMA_CHAT_URL, 
                 json=payload, 
                 stream=stream, 
-                timeout=base_timeout
+                timeout=(CONNECTION_TIMEOUT, base_timeout)
             )
             response.raise_for_status()
+            health_monitor.mark(True)
             return response
             
+        except requests.exceptions.ConnectionError as e:
+            # Ollama fora do ar: não adianta insistir, o monitor avisa quando voltar
+            health_monitor.mark(False, str(e))
+            raise Exception("Ollama não está rodando! Execute: ollama serve")
+            
         except requests.exceptions.ReadTimeout as e:
             print(f"Timeout na tentativa {attempt + 1}: {e}")
             if attempt < max_retries - 1:
@@ -74,4 +305,4 @@ def get_ollama_response(prompt: str, stream: bool = False):
             if attempt < max_retries - 1:
                 time.sleep(1)
             else:
-                raise
\ No newline at end of file
+                raise
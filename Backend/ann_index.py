@@ -0,0 +1,118 @@
+"""
+Tipos de Índice FAISS - EKKO
+Busca aproximada para quando a base de conhecimento crescer (RAG_INDEX_TYPE)
+
+- flat:  força bruta exata; ótima até dezenas de milhares de trechos. No
+         servidor não há arquivo FAISS: a busca é feita direto no vectors.npy mapeado
+- hnsw:  grafo HNSW; latência quase constante, memória ~ vetores + grafo.
+         Não suporta remoção: cada atualização reconstrói a partir de vectors.npy
+- ivfpq: listas invertidas + quantização por produto; vetores comprimidos
+         (pq_m bytes por trecho). Exige treino; é retreinado quando a base
+         cresce IVF_RETRAIN_GROWTH vezes além do que foi usado no treino
+
+Os parâmetros usados ficam no manifesto da versão ("index") e são reaplicados
+(efSearch / nprobe) ao abrir o índice.
+"""
+
+import math
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+DEFAULT_PARAMS = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 80, "ef_search": 64},
+    # nlist None: ~4 * sqrt(n); pq_m precisa dividir a dimensão (384 / 48 = 8)
+    "ivfpq": {"nlist": None, "nprobe": 8, "pq_m": 48, "pq_bits": 8},
+}
+# Abaixo disso o IVF-PQ não tem pontos para treinar: usa flat
+IVF_MIN_TRAIN = 2000
+IVF_RETRAIN_GROWTH = 4.0
+# O k-means do FAISS pede ~39 pontos por centróide
+IVF_POINTS_PER_LIST = 39
+
+def supports_remove(index_type: str) -> bool:
+    return index_type in ("flat", "ivfpq")
+
+def resolve_params(index_type: str, n: int, dim: int, overrides: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    """(tipo efetivo, parâmetros); corpus pequeno demais para IVF-PQ vira flat"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"RAG_INDEX_TYPE inválido: {index_type} (use {', '.join(INDEX_TYPES)})")
+    params = dict(DEFAULT_PARAMS[index_type], **(overrides or {}))
+    if index_type == "ivfpq":
+        if n < IVF_MIN_TRAIN:
+            return "flat", {}
+        if dim % params["pq_m"]:
+            raise ValueError(f"pq_m={params['pq_m']} não divide a dimensão {dim}")
+        nlist = params["nlist"] or int(4 * math.sqrt(n))
+        params["nlist"] = max(1, min(nlist, n // IVF_POINTS_PER_LIST))
+    return index_type, params
+
+def flat_meta(requested: str) -> Dict[str, Any]:
+    return {"type": "flat", "requested": requested, "params": {}, "trained_on": None, "build_s": 0.0}
+
+def build(index_type: str, vectors: np.ndarray, ids: np.ndarray,
+          overrides: Optional[Dict[str, Any]] = None) -> Tuple[Any, Dict[str, Any]]:
+    """Índice novo com todos os vetores (já normalizados) -> (índice, metadados do manifesto)"""
+    n, dim = vectors.shape
+    effective, params = resolve_params(index_type, n, dim, overrides)
+    start = time.perf_counter()
+    if effective == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, params["m"], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = params["ef_construction"]
+        index = faiss.IndexIDMap2(hnsw)
+    elif effective == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["pq_bits"],
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    else:
+        # Produto interno em vetores normalizados = similaridade de cosseno
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    if n:
+        index.add_with_ids(vectors, ids)
+    meta = {"type": effective, "requested": index_type, "params": params,
+            "trained_on": n if effective == "ivfpq" else None,
+            "build_s": round(time.perf_counter() - start, 3)}
+    configure_search(index, meta)
+    return index, meta
+
+def needs_rebuild(meta: Optional[Dict[str, Any]], index_type: str, n: int) -> bool:
+    """Atualização incremental não serve: tipo mudou, sem remoção, ou IVF-PQ cresceu demais"""
+    if not meta or meta.get("requested") != index_type:
+        return True
+    if not supports_remove(meta["type"]):
+        return True
+    if meta["type"] == "ivfpq":
+        return n > meta["trained_on"] * IVF_RETRAIN_GROWTH
+    # flat no lugar de ivfpq (corpus pequeno): reconstrói quando der para treinar
+    return index_type == "ivfpq" and n >= IVF_MIN_TRAIN
+
+def configure_search(index, meta: Optional[Dict[str, Any]]):
+    """Parâmetros de busca não são gravados pelo FAISS: reaplica os do manifesto"""
+    if not meta:
+        return
+    params = meta.get("params", {})
+    if meta["type"] == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = params["ef_search"]
+    elif meta["type"] == "ivfpq":
+        index.nprobe = params["nprobe"]
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Posições dos k vizinhos exatos (referência para o recall)"""
+    scores = queries @ vectors.T
+    k = min(k, vectors.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+def recall_at_k(index, ids: np.ndarray, vectors: np.ndarray, queries: np.ndarray, k: int) -> float:
+    """Fração dos k vizinhos exatos (flat) que o índice também devolve"""
+    expected = ids[exact_top_k(vectors, queries, k)]
+    _, found = index.search(queries, k)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected.tolist(), found.tolist()))
+    return hits / (len(queries) * min(k, len(ids)))
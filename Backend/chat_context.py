@@ -0,0 +1,99 @@
+"""
+Contexto do Chat - EKKO
+Recolhe as fontes de contexto do /api/chat em paralelo, cada uma com seu prazo
+
+O tempo até o primeiro token passa a ser o da fonte mais lenta dentro do
+prazo, e não a soma de todas. Ferramentas síncronas (RAG, web, INMET,
+memórias) rodam em threads; ao estourar o prazo o resultado é descartado
+(a thread termina sozinha em segundo plano).
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, Tuple
+
+import soil_store
+import tool
+from ai_analyzer import get_main_crop
+from constants import CHAT_CONTEXT_DEADLINES
+from database import async_unity_profiles
+
+NO_PLAYER_DATA = "Nenhum dado disponível para este agricultor."
+
+async def load_player(unity_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Perfil e leitura mais recente (as duas consultas em paralelo)"""
+    return await asyncio.gather(
+        async_unity_profiles.find_one({"_id": unity_id}),
+        soil_store.find_latest(unity_id)
+    )
+
+def profile_crop(profile: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Cultivo principal do perfil (lista cultivos_principais ou o campo antigo cultivo_principal)"""
+    propriedade = (profile or {}).get("propriedade", {})
+    if propriedade.get("cultivos_principais"):
+        return get_main_crop(profile)
+    return propriedade.get("cultivo_principal") or None
+
+def player_crop(profile: Optional[Dict[str, Any]], latest_soil: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Cultivo da leitura mais recente; senão o cultivo principal do perfil"""
+    return (latest_soil or {}).get("cultivo_atual") or profile_crop(profile)
+
+async def player_context(player: Awaitable) -> str:
+    """`player`: tarefa de load_player, compartilhada com local_knowledge"""
+    # shield: o prazo desta fonte não cancela a consulta que a busca local também espera
+    profile, latest_soil = await asyncio.shield(player)
+
+    context = ""
+    if profile:
+        context += f"AGRICULTOR: {profile.get('dados_pessoais', {}).get('nome', 'N/A')}\n"
+        context += f"PROPRIEDADE: {profile.get('propriedade', {}).get('nome', 'N/A')}\n"
+        context += f"ÁREA: {profile.get('propriedade', {}).get('area_hectares', 0)} hectares\n"
+        context += f"CULTIVO: {profile_crop(profile) or 'N/A'}\n\n"
+
+    if latest_soil:
+        context += f"DADOS DO SOLO (mais recente):\n"
+        context += f"- pH: {latest_soil.get('soil_parameters', {}).get('ph', 'N/A')}\n"
+        context += f"- Umidade: {latest_soil.get('soil_parameters', {}).get('umidade', 'N/A')}%\n"
+        context += f"- Temperatura: {latest_soil.get('soil_parameters', {}).get('temperatura', 'N/A')}°C\n"
+        context += f"- NPK: N={latest_soil.get('nutrients', {}).get('nitrogenio', 'N/A')}, "
+        context += f"P={latest_soil.get('nutrients', {}).get('fosforo', 'N/A')}, "
+        context += f"K={latest_soil.get('nutrients', {}).get('potassio', 'N/A')}\n"
+        context += f"- Cultivo atual: {latest_soil.get('cultivo_atual', 'N/A')}\n"
+
+    return context or NO_PLAYER_DATA
+
+async def local_knowledge(player: Awaitable, message: str) -> str:
+    """Busca na base local filtrada pelo cultivo do jogador (sem filtro se o Mongo falhar)"""
+    try:
+        crop = player_crop(*await asyncio.shield(player))
+    except Exception:
+        crop = None
+    return await asyncio.to_thread(tool.local_database_search, message, crop)
+
+async def _run_source(name: str, source: Awaitable, deadline: float) -> Tuple[str, Optional[Any], str, float]:
+    """Executa uma fonte: (nome, resultado ou None, "ok"/"timeout"/"erro", segundos)"""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(source, timeout=deadline)
+        return name, result, "ok", time.perf_counter() - start
+    except asyncio.TimeoutError:
+        return name, None, "timeout", time.perf_counter() - start
+    except Exception as e:
+        print(f"!!! ERRO na fonte de contexto '{name}': {e}")
+        return name, None, "erro", time.perf_counter() - start
+
+async def gather_context(sources: Dict[str, Awaitable],
+                         deadlines: Dict[str, float] = CHAT_CONTEXT_DEADLINES) -> AsyncIterator[Tuple[str, Optional[Any], str, float]]:
+    """
+    Roda todas as fontes ao mesmo tempo e entrega cada uma assim que termina
+    (ou estoura o prazo), para o chat enviar um status por fonte.
+    """
+    tasks = [asyncio.ensure_future(_run_source(name, source, deadlines.get(name, 5.0)))
+             for name, source in sources.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Cliente desconectou no meio da recolha
+        for task in tasks:
+            task.cancel()
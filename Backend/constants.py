@@ -86,4 +86,21 @@ MESSAGES = {
         STATUS_ATENCAO: "Os níveis de potássio estão fora da faixa ideal, podendo afetar regulação hídrica e resistência das plantas. Deficiência causa queima das bordas das folhas, maior suscetibilidade a doenças e frutos de qualidade inferior. Excesso pode interferir na absorção de cálcio e magnésio. A eficiência no uso da água pode estar comprometida. Ajustes na adubação potássica são recomendados.",
         STATUS_CRITICO: "Os níveis de potássio estão críticos, comprometendo severamente a regulação hídrica e resistência das plantas. Deficiência extrema causa necrose foliar generalizada, alta suscetibilidade a doenças e frutos de péssima qualidade. Excesso crítico pode causar deficiências induzidas de outros nutrientes essenciais. As plantas ficam extremamente vulneráveis a estresses. Correção urgente da adubação potássica é essencial."
     }
-}
\ No newline at end of file
+}
+
+# Prazos (segundos) das fontes de contexto do /api/chat, recolhidas em paralelo.
+# Fonte que estoura o prazo fica fora do prompt em vez de atrasar a resposta.
+CHAT_CONTEXT_DEADLINES = {
+    "mongo": 2.0,
+    "rag": 3.0,
+    "web": 5.0,
+    "clima": 4.0
+}
+
+# Texto do evento de status enviado quando cada fonte termina
+CHAT_CONTEXT_LABELS = {
+    "mongo": "Dados da fazenda",
+    "rag": "Base de conhecimento",
+    "web": "Busca na web",
+    "clima": "Previsão do tempo"
+}
@@ -0,0 +1,151 @@
+"""
+Conversas do Chat - EKKO
+Estado das conversas no servidor, por unity_id + conversation_id
+
+As últimas KEEP_VERBATIM_MESSAGES mensagens ficam na íntegra; as mais antigas
+são condensadas em um resumo corrente, gerado em segundo plano (fora do
+caminho da resposta) com prioridade baixa no agendador da IA. Assim o
+prompt não cresce com o tamanho da conversa.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+import ai_connector
+from database import async_unity_conversations
+from ollama_config import KEEP_VERBATIM_MESSAGES, SUMMARY_BATCH_MESSAGES, SUMMARY_MAX_WORDS, PRIORITY_SUMMARY
+
+ROLE_LABELS = {"user": "Agricultor", "assistant": "Ekko"}
+# Mensagens enviadas pelo cliente ao criar a conversa (já vêm como texto pronto)
+ROLE_SEED = "seed"
+
+SUMMARY_PROMPT = """Resuma a conversa entre um agricultor e o assistente Ekko em no máximo {max_words} palavras.
+Mantenha fatos sobre a fazenda, cultivos, problemas relatados e recomendações já dadas.
+
+Resumo anterior: {summary}
+
+Novas mensagens:
+{messages}
+
+Resumo atualizado:"""
+
+# Conversas com resumo em andamento (um por vez por conversa)
+_summarizing = set()
+_tasks = set()
+
+def conversation_key(unity_id: str, conversation_id: str) -> str:
+    return f"{unity_id}:{conversation_id}"
+
+async def load(unity_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+    return await async_unity_conversations.find_one({"_id": conversation_key(unity_id, conversation_id)})
+
+def turn_text(turn: Dict[str, Any]) -> str:
+    label = ROLE_LABELS.get(turn["role"])
+    return f"{label}: {turn['content']}" if label else turn["content"]
+
+def prompt_history(conversation: Optional[Dict[str, Any]]) -> List[str]:
+    """Resumo (se houver) + mensagens na íntegra, no formato de ChatRequest.history"""
+    if not conversation:
+        return []
+    history = []
+    if conversation.get("summary"):
+        history.append(f"Resumo da conversa até aqui: {conversation['summary']}")
+    history.extend(turn_text(turn) for turn in conversation.get("turns", []))
+    return history
+
+async def create(unity_id: str, conversation_id: str, seed: List[str]) -> Dict[str, Any]:
+    """
+    Cria a conversa com o histórico que o cliente tinha antes dela existir no
+    servidor. Se outra requisição criou primeiro, mantém a existente.
+    """
+    now = datetime.utcnow()
+    turns = [{"seq": i, "role": ROLE_SEED, "content": str(text), "at": now} for i, text in enumerate(seed, 1)]
+    return await async_unity_conversations.find_one_and_update(
+        {"_id": conversation_key(unity_id, conversation_id)},
+        {
+            "$setOnInsert": {"unity_id": unity_id, "conversation_id": conversation_id,
+                             "summary": "", "summarized_seq": 0, "created_at": now,
+                             "seq": len(turns), "turns": turns},
+            "$set": {"updated_at": now},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+async def append_exchange(unity_id: str, conversation_id: str, question: str, answer: str):
+    """Grava pergunta + resposta e agenda o resumo se a parte antiga cresceu"""
+    now = datetime.utcnow()
+    conversation = await async_unity_conversations.find_one_and_update(
+        {"_id": conversation_key(unity_id, conversation_id)},
+        {
+            "$setOnInsert": {"unity_id": unity_id, "conversation_id": conversation_id,
+                             "summary": "", "summarized_seq": 0, "created_at": now},
+            "$inc": {"seq": 2},
+            "$set": {"updated_at": now},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    seq = conversation["seq"]
+    await async_unity_conversations.update_one(
+        {"_id": conversation["_id"]},
+        {"$push": {"turns": {"$each": [
+            {"seq": seq - 1, "role": "user", "content": question, "at": now},
+            {"seq": seq, "role": "assistant", "content": answer, "at": now},
+        ]}}}
+    )
+    if len(conversation.get("turns", [])) + 2 >= KEEP_VERBATIM_MESSAGES + SUMMARY_BATCH_MESSAGES:
+        schedule_summary(conversation["_id"])
+
+def schedule_summary(key: str):
+    if key in _summarizing:
+        return
+    _summarizing.add(key)
+    task = asyncio.create_task(_summarize(key))
+    # Referência forte até terminar (create_task sozinho pode ser coletado)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _summarize(key: str):
+    try:
+        conversation = await async_unity_conversations.find_one({"_id": key})
+        turns = sorted((conversation or {}).get("turns", []), key=lambda turn: turn["seq"])
+        older = turns[:-KEEP_VERBATIM_MESSAGES]
+        if not older:
+            return
+
+        prompt = SUMMARY_PROMPT.format(
+            max_words=SUMMARY_MAX_WORDS,
+            summary=conversation.get("summary") or "(nenhum)",
+            messages="\n".join(turn_text(turn) for turn in older)
+        )
+        async with ai_connector.scheduler.slot(PRIORITY_SUMMARY):
+            response = await asyncio.to_thread(ai_connector.get_ollama_response, prompt, stream=False)
+        summary = response.json().get("message", {}).get("content", "").strip()
+        if not summary:
+            return
+
+        # Só aplica se ninguém resumiu no meio tempo; remove exatamente as mensagens resumidas
+        last_seq = older[-1]["seq"]
+        result = await async_unity_conversations.update_one(
+            {"_id": key, "summarized_seq": conversation.get("summarized_seq", 0)},
+            {
+                "$set": {"summary": summary, "summarized_seq": last_seq},
+                "$pull": {"turns": {"seq": {"$lte": last_seq}}},
+            }
+        )
+        if result.modified_count:
+            print(f"-> Conversa {key}: {len(older)} mensagens condensadas no resumo")
+    except ai_connector.LLMQueueFullError:
+        print(f"-> Conversa {key}: fila da IA cheia, resumo fica para a próxima mensagem")
+    except Exception as e:
+        print(f"!!! ERRO ao resumir conversa {key}: {e}")
+    finally:
+        _summarizing.discard(key)
+
+async def delete(unity_id: str, conversation_id: str) -> bool:
+    result = await async_unity_conversations.delete_one({"_id": conversation_key(unity_id, conversation_id)})
+    return result.deleted_count > 0
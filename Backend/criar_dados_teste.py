@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from database import unity_profiles, unity_soil_data
+from soil_ids import new_soil_id
 from datetime import datetime
 
 def criar_usuario_teste(unity_id):
@@ -39,7 +40,7 @@ def criar_usuario_teste(unity_id):
     
     # Criar dados de solo
     soil = {
-        "_id": f"soil_{unity_id}_{int(datetime.utcnow().timestamp())}",
+        "_id": new_soil_id(unity_id),
         "unity_id": unity_id,
         "timestamp": datetime.utcnow(),
         "soil_parameters": {
@@ -5,6 +5,7 @@ MongoDB Atlas
 
 import os
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
 # Carregar .env
@@ -16,14 +17,79 @@ DB_NAME = os.getenv("UNITY_MONGO_DB_NAME", "EKKOnUnity")
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8002"))
 API_DEBUG = os.getenv("API_DEBUG", "False").lower() == "true"
+# Processos do uvicorn; o índice RAG é mapeado do disco e compartilhado entre eles
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+# Workers quando a API é iniciada por fora (uvicorn/gunicorn --workers); o
+# processo não enxerga esse número, então ele precisa vir pelo ambiente
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0") or "0")
+
+# Write-behind (opcional): leituras de solo enfileiradas e gravadas em lote
+SOIL_WRITE_BEHIND = os.getenv("SOIL_WRITE_BEHIND", "False").lower() == "true"
+SOIL_BUFFER_MAX_SIZE = int(os.getenv("SOIL_BUFFER_MAX_SIZE", "10000"))
+SOIL_BUFFER_FLUSH_MS = int(os.getenv("SOIL_BUFFER_FLUSH_MS", "500"))
+SOIL_BUFFER_FLUSH_DOCS = int(os.getenv("SOIL_BUFFER_FLUSH_DOCS", "500"))
+# Fila cheia: "reject" responde 429, "wait" aguarda até SOIL_BUFFER_WAIT_MS
+SOIL_BUFFER_FULL_POLICY = os.getenv("SOIL_BUFFER_FULL_POLICY", "reject").lower()
+SOIL_BUFFER_WAIT_MS = int(os.getenv("SOIL_BUFFER_WAIT_MS", "2000"))
+# Falha no flush: novas tentativas com backoff e, depois, o arquivo de dead letter
+SOIL_BUFFER_MAX_RETRIES = int(os.getenv("SOIL_BUFFER_MAX_RETRIES", "3"))
+SOIL_BUFFER_RETRY_MS = int(os.getenv("SOIL_BUFFER_RETRY_MS", "500"))
+SOIL_DEAD_LETTER_FILE = os.getenv("SOIL_DEAD_LETTER_FILE", "data/soil_dead_letter.jsonl")
+
+# Armazenamento das leituras: "classic" (Unity_soilData) ou "timeseries"
+SOIL_STORAGE_MODE = os.getenv("SOIL_STORAGE_MODE", "classic").lower()
+# Horário enviado pelo cliente em cada leitura: tolerância para relógio adiantado
+# e idade máxima (leituras feitas offline e enviadas depois)
+SOIL_CLIENT_TS_MAX_SKEW_S = float(os.getenv("SOIL_CLIENT_TS_MAX_SKEW_S", "300"))
+SOIL_CLIENT_TS_MAX_AGE_H = float(os.getenv("SOIL_CLIENT_TS_MAX_AGE_H", "168"))
+# Time-series: por quanto tempo uma chave de idempotência segura reenvios
+SOIL_IDEMPOTENCY_WINDOW_H = float(os.getenv("SOIL_IDEMPOTENCY_WINDOW_H", "48"))
+
+# Atualizações ao vivo (/unity/stream): eventos por assinante e change streams
+SOIL_STREAM_QUEUE_SIZE = int(os.getenv("SOIL_STREAM_QUEUE_SIZE", "100"))
+SOIL_STREAM_HEARTBEAT_S = float(os.getenv("SOIL_STREAM_HEARTBEAT_S", "15"))
+# true: eventos vêm do change stream (replica set, vários processos da API)
+SOIL_CHANGE_STREAMS = os.getenv("SOIL_CHANGE_STREAMS", "False").lower() == "true"
+
+# Base de conhecimento: observar data/dados_plantacoes e reindexar ao vivo
+RAG_WATCH = os.getenv("RAG_WATCH", "False").lower() == "true"
+RAG_WATCH_INTERVAL_S = float(os.getenv("RAG_WATCH_INTERVAL_S", "10"))
+# Tipo do índice FAISS: flat (exato), hnsw ou ivfpq (ann_index.py)
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat").lower()
+
+# Embeddings da base de conhecimento: torch, onnx ou onnx-int8 (embedding_backends.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "data/models/all-MiniLM-L6-v2-onnx")
+
+# Conversas do chat guardadas no servidor: apagadas após N dias sem uso
+CHAT_CONVERSATION_TTL_DAYS = int(os.getenv("CHAT_CONVERSATION_TTL_DAYS", "30"))
 
 if not MONGO_URI:
     raise ValueError("MONGO_URI não configurada. Configure o arquivo .env")
 
-# Conexão MongoDB
+# Nomes das collections (compartilhados pelas duas conexões)
+PROFILES_COLLECTION = "Python_userData"
+SOIL_COLLECTION = "Unity_soilData"
+SOIL_TS_COLLECTION = "Unity_soilData_ts"
+SOIL_ROLLUPS_COLLECTION = "Unity_soilRollups"
+SOIL_KEYS_COLLECTION = "Unity_soilKeys"
+CONVERSATIONS_COLLECTION = "Unity_chatConversations"
+
+# Conexão assíncrona (Motor) - usada pelas rotas da API
+async_client = AsyncIOMotorClient(MONGO_URI)
+async_db = async_client[DB_NAME]
+async_unity_profiles = async_db[PROFILES_COLLECTION]
+async_unity_soil_data = async_db[SOIL_COLLECTION]
+async_unity_soil_ts = async_db[SOIL_TS_COLLECTION]
+async_unity_soil_rollups = async_db[SOIL_ROLLUPS_COLLECTION]
+async_unity_soil_keys = async_db[SOIL_KEYS_COLLECTION]
+async_unity_conversations = async_db[CONVERSATIONS_COLLECTION]
+
+# Conexão síncrona - shim para scripts (tools/monitor_simple.py, criar_dados_teste.py)
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
+unity_profiles = db[PROFILES_COLLECTION]
+unity_soil_data = db[SOIL_COLLECTION]
+unity_soil_ts = db[SOIL_TS_COLLECTION]
+unity_soil_rollups = db[SOIL_ROLLUPS_COLLECTION]
 
-# Collections
-unity_profiles = db["Python_userData"]
-unity_soil_data = db["Unity_soilData"]
\ No newline at end of file
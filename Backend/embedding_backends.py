@@ -0,0 +1,87 @@
+"""
+Backends de Embeddings - EKKO
+Mesmo modelo (all-MiniLM-L6-v2) em PyTorch ou ONNX Runtime, escolhido por
+EMBEDDING_BACKEND
+
+- torch:     SentenceTransformer (padrão; precisa de torch, ~centenas de MB por worker)
+- onnx:      ONNX Runtime em fp32, mesmos vetores do torch (diferença ~1e-6)
+- onnx-int8: pesos quantizados em int8; menor e mais rápido em CPU, vetores
+             levemente diferentes (o índice é reconstruído com eles)
+
+Os arquivos ONNX são gerados uma vez com tools/exportar_embeddings_onnx.py;
+tools/paridade_embeddings.py confere se a busca continua equivalente.
+"""
+
+import os
+from typing import List
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+TOKENIZER_FILE = "tokenizer.json"
+# Mesmo limite do SentenceTransformer para o all-MiniLM-L6-v2
+MAX_SEQ_LENGTH = 256
+
+class TorchBackend:
+    def __init__(self, model_name: str):
+        # Import aqui: sentence_transformers puxa o torch, que leva segundos
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+class OnnxBackend:
+    """
+    Tokenizer (biblioteca tokenizers) + sessão ONNX + mean pooling com a
+    máscara de atenção + normalização L2, como o pipeline do SentenceTransformer.
+    """
+
+    def __init__(self, model_dir: str, variant: str = "onnx"):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        path = os.path.join(model_dir, ONNX_FILES[variant])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} não encontrado; gere com tools/exportar_embeddings_onnx.py")
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: value for name, value in inputs.items()
+                                                   if name in self.input_names})[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        return np.concatenate(batches).astype(np.float32)
+
+def model_id(model_name: str, backend: str) -> str:
+    """
+    Nome gravado no manifesto do índice. torch e onnx (fp32) geram os mesmos
+    vetores e compartilham o índice; int8 tem o seu.
+    """
+    return f"{model_name}:int8" if backend == "onnx-int8" else model_name
+
+def load_backend(backend: str, model_name: str, onnx_dir: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND inválido: {backend} (use {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return TorchBackend(model_name)
+    return OnnxBackend(onnx_dir, backend)
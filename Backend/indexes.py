@@ -0,0 +1,198 @@
+"""
+Índices do MongoDB - EKKO
+Criação dos índices na inicialização e verificação dos planos de consulta
+
+Uso:
+    python indexes.py          # cria os índices
+    python indexes.py --check  # roda explain() nas consultas, agregações e upserts das rotas
+"""
+
+import sys
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Todas as rotas filtram por unity_id e ordenam por timestamp desc
+SOIL_INDEXES = [
+    IndexModel([("unity_id", ASCENDING), ("timestamp", DESCENDING)], name="unity_id_timestamp"),
+    # Histórico paginado: cursor (timestamp, _id) de soil_store.HISTORY_SORT
+    IndexModel([("unity_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="unity_id_timestamp_id"),
+    # Idempotência: reenvio com a mesma chave viola o índice (E11000 -> duplicado)
+    IndexModel([("unity_id", ASCENDING), ("idempotency_key", ASCENDING)], name="unity_id_idempotency_key",
+               unique=True, partialFilterExpression={"idempotency_key": {"$exists": True}}),
+    # find_one(sort=timestamp) global de tools/monitor_simple.py
+    IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+]
+
+# Estágios que indicam varredura completa ou ordenação em memória
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+# Rollups: consultas por jogador + granularidade, ordenadas pelo início do bucket
+ROLLUP_INDEXES = [
+    IndexModel([("unity_id", ASCENDING), ("granularity", ASCENDING), ("bucket_start", DESCENDING)], name="unity_id_granularity_bucket_start"),
+]
+
+# Conversas do chat: lidas por _id; o TTL apaga as abandonadas
+def conversation_indexes():
+    from database import CHAT_CONVERSATION_TTL_DAYS
+    return [
+        IndexModel([("updated_at", ASCENDING)], name="updated_at_ttl", expireAfterSeconds=CHAT_CONVERSATION_TTL_DAYS * 86400),
+    ]
+
+# Modo time-series: o índice de jogador fica em meta.unity_id
+SOIL_TS_INDEXES = [
+    IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+]
+
+async def ensure_indexes():
+    """Cria os índices (idempotente). Chamada no startup da API."""
+    import soil_store
+    from database import async_unity_soil_data, async_unity_soil_rollups, async_unity_conversations
+    try:
+        names = await async_unity_soil_data.create_indexes(SOIL_INDEXES)
+        names += await async_unity_soil_rollups.create_indexes(ROLLUP_INDEXES)
+        names += await async_unity_conversations.create_indexes(conversation_indexes())
+        if soil_store.TIMESERIES:
+            await soil_store.ensure_timeseries_collection()
+            names += await soil_store.soil_collection().create_indexes(SOIL_TS_INDEXES)
+        print(f"-> Índices de solo garantidos: {', '.join(names)}")
+    except Exception as e:
+        print(f"!!! ERRO ao criar índices: {e}")
+
+def route_queries(unity_id: str):
+    """Consultas usadas pelas rotas de main.py: nome -> (filtro, sort ou None, limit)"""
+    from soil_store import HISTORY_SORT, soil_filter
+
+    last_week = datetime.utcnow() - timedelta(days=7)
+    return {
+        "get_dashboard/latest": (soil_filter(unity_id), [("timestamp", -1)], 1),
+        "get_dashboard/history": (soil_filter(unity_id), HISTORY_SORT, 100),
+        "get_dashboard/history_page": (soil_filter(unity_id, before=datetime.utcnow(), before_id=f"soil_{unity_id}"), HISTORY_SORT, 100),
+        "get_monitoring_data": (soil_filter(unity_id, since=last_week), HISTORY_SORT, 0),
+        # max_points: o $match do pipeline de downsampling não ordena
+        "get_monitoring_data/max_points": (soil_filter(unity_id, since=last_week), None, 0),
+        "analise_ia/history": (soil_filter(unity_id), HISTORY_SORT, 10),
+        "chat/latest": (soil_filter(unity_id), [("timestamp", -1)], 1),
+        "monitor_simple/latest": ({}, [("timestamp", -1)], 1),
+    }
+
+def rollup_queries(unity_id: str):
+    """Consultas de soil_rollups (monitoramento longo e tendência)"""
+    last_week = datetime.utcnow() - timedelta(days=7)
+    return {
+        "rollups/monitoring_7d": ({"unity_id": unity_id, "granularity": "hour", "bucket_start": {"$gte": last_week}}, [("bucket_start", -1)], 0),
+        "rollups/analise_ia_trend": ({"unity_id": unity_id, "granularity": "hour"}, [("bucket_start", -1)], 3),
+    }
+
+def aggregate_queries(unity_id: str):
+    """Pipelines de agregação das rotas: nome -> pipeline"""
+    from soil_monitoring import downsample_pipeline
+
+    now = datetime.utcnow()
+    pipeline, _ = downsample_pipeline(unity_id, now - timedelta(hours=24), now, 100)
+    return {"get_monitoring_data/downsample": pipeline}
+
+def rollup_updates(unity_id: str):
+    """Formatos dos upserts de soil_rollups.apply_rollups: nome -> (filtro, atualização)"""
+    from soil_rollups import build_rollup_updates
+
+    sample = {
+        "unity_id": unity_id,
+        "timestamp": datetime.utcnow(),
+        "soil_parameters": {"ph": 6.5},
+    }
+    updates = {}
+    for query, update in build_rollup_updates([sample]):
+        granularity = update["$setOnInsert"]["granularity"]
+        updates[f"rollups/upsert_{granularity}"] = (query, update)
+    return updates
+
+def winning_plans(explain) -> list:
+    """Planos vencedores do explain (em time-series ficam dentro de $cursor)"""
+    plans = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                plans.append(value)
+            else:
+                plans.extend(winning_plans(value))
+    elif isinstance(explain, list):
+        for item in explain:
+            plans.extend(winning_plans(item))
+    return plans
+
+def find_bad_stages(plan) -> list:
+    """Percorre o plano (explain) e devolve os estágios problemáticos"""
+    found = []
+    if isinstance(plan, dict):
+        if plan.get("stage") in BAD_STAGES:
+            found.append(plan["stage"])
+        if plan.get("stage") == "GROUP":
+            # $group levado para o plano: só importa o que o alimenta
+            # (ordenar os buckets já agrupados é barato)
+            return found + find_bad_stages(plan.get("inputStage"))
+        for value in plan.values():
+            found.extend(find_bad_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            found.extend(find_bad_stages(item))
+    return found
+
+def check_query_plans() -> bool:
+    """Roda explain() em cada consulta e falha se houver COLLSCAN ou SORT em memória"""
+    from database import unity_soil_rollups
+    from soil_store import from_storage, sync_soil_collection
+
+    collection = sync_soil_collection()
+    sample = from_storage(collection.find_one({})) or {}
+    unity_id = sample.get("unity_id", "unity_check")
+
+    ok = True
+    for target, queries in [(collection, route_queries(unity_id)), (unity_soil_rollups, rollup_queries(unity_id))]:
+        ok = check_collection(target, queries) and ok
+    ok = check_aggregates(collection, aggregate_queries(unity_id)) and ok
+    ok = check_updates(unity_soil_rollups, rollup_updates(unity_id)) and ok
+    return ok
+
+def report(name: str, explain) -> bool:
+    bad = find_bad_stages(winning_plans(explain))
+    status = "OK" if not bad else f"FALHA ({', '.join(sorted(set(bad)))})"
+    print(f"{name:<28} {status}")
+    return not bad
+
+def check_collection(collection, queries) -> bool:
+    """explain() de cada consulta de uma collection"""
+    ok = True
+    for name, (query, sort, limit) in queries.items():
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        ok = report(name, cursor.explain()) and ok
+    return ok
+
+def check_aggregates(collection, pipelines) -> bool:
+    """explain do aggregate: o $match precisa usar índice antes do $group"""
+    ok = True
+    for name, pipeline in pipelines.items():
+        explain = collection.database.command("aggregate", collection.name, pipeline=pipeline, explain=True)
+        ok = report(name, explain) and ok
+    return ok
+
+def check_updates(collection, updates) -> bool:
+    """explain dos upserts (sem gravar nada): o filtro precisa achar o documento por índice"""
+    ok = True
+    for name, (query, update) in updates.items():
+        explain = collection.database.command({
+            "explain": {"update": collection.name, "updates": [{"q": query, "u": update, "upsert": True}]},
+            "verbosity": "queryPlanner"
+        })
+        ok = report(name, explain) and ok
+    return ok
+
+if __name__ == "__main__":
+    import asyncio
+
+    if "--check" in sys.argv:
+        sys.exit(0 if check_query_plans() else 1)
+    asyncio.run(ensure_indexes())
@@ -0,0 +1,162 @@
+"""
+Buffer de Ingestão (write-behind) - EKKO
+Leituras de solo são enfileiradas em memória e gravadas em lote no Atlas
+
+O cliente já recebeu a confirmação quando o documento entra na fila, então
+nada é descartado em silêncio: documentos que falham são regravados com
+backoff (até `max_retries` vezes) e, se ainda assim não entrarem, ou se o
+shutdown estourar o prazo, vão para o `dead_letter` (arquivo JSON Lines).
+"""
+
+import asyncio
+from typing import Any, Dict, List
+
+
+class BufferFullError(Exception):
+    """A fila de ingestão atingiu o limite configurado"""
+
+
+class SoilWriteBuffer:
+    """
+    Fila limitada + task de flush no event loop. O flush acontece a cada
+    `flush_ms` ou quando `flush_docs` documentos se acumulam, o que vier primeiro.
+    """
+
+    def __init__(self, writer, max_size: int, flush_ms: int, flush_docs: int,
+                 max_retries: int = 3, retry_ms: int = 500, dead_letter=None):
+        # writer(docs) -> (índices duplicados, {índice: erro}), ex.: soil_store.insert_soil_docs
+        self.writer = writer
+        self.flush_interval = flush_ms / 1000
+        self.flush_docs = flush_docs
+        self.max_size = max_size
+        # Backoff exponencial: retry_ms, 2x, 4x...
+        self.max_retries = max_retries
+        self.retry_delay = retry_ms / 1000
+        # dead_letter(docs): guarda o que não pôde ser gravado (síncrono)
+        self.dead_letter = dead_letter
+        self._queue = None
+        self._stopping = False
+        self._task = None
+        # Lote sendo gravado agora (vai para o dead_letter se o shutdown cancelar)
+        self._inflight = []
+        self._counters = {
+            "queued": 0,
+            "flushed": 0,
+            "failed": 0,
+            "duplicates": 0,
+            "rejected": 0,
+            "batches": 0,
+            "retried": 0,
+            "dead_lettered": 0
+        }
+
+    def start(self):
+        """Cria a fila e a task de flush (precisa do event loop ativo)"""
+        if self._task and not self._task.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        print(f"-> Write-behind ativo (flush: {int(self.flush_interval * 1000)}ms / {self.flush_docs} docs)")
+
+    async def stop(self, timeout: float = 30):
+        """
+        Para a task após esvaziar a fila (drenagem no shutdown). Se o prazo
+        estourar, o lote em andamento e o resto da fila vão para o dead_letter.
+        """
+        if not self._task:
+            return
+        self._stopping = True
+        try:
+            # wait_for cancela a task ao estourar o prazo
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            leftover = list(self._inflight)
+            while not self._queue.empty():
+                leftover.append(self._queue.get_nowait())
+            self._inflight = []
+            if leftover:
+                self._give_up(leftover, f"shutdown após {timeout:g}s")
+        self._task = None
+        print(f"-> Write-behind finalizado. Pendentes: {self._queue.qsize()}")
+
+    async def put(self, doc: Dict[str, Any], wait_seconds: float = 0):
+        """Enfileira um documento. Levanta BufferFullError se a fila estiver cheia."""
+        try:
+            if wait_seconds > 0:
+                await asyncio.wait_for(self._queue.put(doc), wait_seconds)
+            else:
+                self._queue.put_nowait(doc)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self._counters["rejected"] += 1
+            raise BufferFullError("Fila de ingestão cheia")
+        self._counters["queued"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._counters)
+        stats["pending"] = self._queue.qsize() if self._queue else 0
+        stats["capacity"] = self.max_size
+        return stats
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._collect_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def _collect_batch(self) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        # Já fica em _inflight: um cancelamento no meio da coleta não perde o lote parcial
+        batch = self._inflight = []
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.flush_docs:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        """Grava o lote; o que falhar é regravado com backoff e, no fim, vai para o dead_letter"""
+        pending = self._inflight = batch
+        attempt = 0
+        while pending:
+            try:
+                duplicate_idx, errors = await self.writer(pending)
+                failed = [pending[i] for i in sorted(errors)]
+                reason = f"{len(errors)} documentos rejeitados pelo Atlas"
+                self._counters["flushed"] += len(pending) - len(errors) - len(duplicate_idx)
+                self._counters["duplicates"] += len(duplicate_idx)
+            except Exception as e:
+                # Falha do lote inteiro (rede, eleição no replica set...): tudo é regravado
+                failed, reason = pending, str(e)
+            if not failed:
+                break
+            if attempt >= self.max_retries:
+                self._give_up(failed, reason)
+                break
+            delay = self.retry_delay * 2 ** attempt
+            attempt += 1
+            self._counters["retried"] += len(failed)
+            print(f"!!! Write-behind: {len(failed)} documentos falharam ({reason}); "
+                  f"tentativa {attempt}/{self.max_retries} em {delay:.1f}s")
+            await asyncio.sleep(delay)
+            # Regravar é seguro: o _id fixo torna o reenvio de um documento já gravado um duplicado
+            pending = self._inflight = failed
+        self._inflight = []
+        self._counters["batches"] += 1
+
+    def _give_up(self, docs: List[Dict[str, Any]], reason: str):
+        self._counters["failed"] += len(docs)
+        if not self.dead_letter:
+            print(f"!!! Write-behind: {len(docs)} documentos perdidos ({reason}); sem dead letter configurado")
+            return
+        try:
+            self.dead_letter(docs)
+            self._counters["dead_lettered"] += len(docs)
+            print(f"!!! Write-behind: {len(docs)} documentos enviados ao dead letter ({reason})")
+        except Exception as e:
+            print(f"!!! ERRO ao gravar o dead letter ({len(docs)} documentos perdidos): {e}")
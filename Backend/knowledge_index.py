@@ -0,0 +1,673 @@
+"""
+Índice da Base de Conhecimento - EKKO
+Trechos (chunks) dos .txt de data/dados_plantacoes indexados no FAISS e salvos em disco
+
+- Chunking por seção (títulos "Tópico:" e linhas **...**) e parágrafo, com sobreposição
+- Metadados de cada trecho: cultivo (pasta), arquivo e seção
+- Índice + trechos gravados em data/rag_index/vNNNNN; na inicialização são
+  abertos via mmap
+- Atualização incremental: hash por arquivo; só trechos de arquivos novos ou
+  alterados são re-embedados, e os de arquivos removidos saem do índice
+  (IndexIDMap2, um ID por trecho)
+- Cada atualização grava uma versão nova e troca o ponteiro CURRENT com
+  os.replace; a busca em andamento continua na versão antiga até terminar
+- Opcional: observador por polling aplica mudanças da pasta ao vivo
+- Tipo do índice FAISS configurável (ann_index.py: flat, hnsw, ivfpq); os
+  vetores ficam em vectors.npy, então trocar o tipo ou retreinar não re-embeda
+- Busca híbrida: cosseno (FAISS) + BM25 (lexical_index.py), só nos trechos do
+  cultivo do jogador e das pastas gerais, descartando os abaixo de RAG_MIN_SCORE
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+import ann_index
+import lexical_index
+
+DOC_PATH = "data/dados_plantacoes"
+INDEX_DIR = "data/rag_index"
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.jsonl"
+IDS_FILE = "ids.npy"
+VECTORS_FILE = "vectors.npy"
+OFFSETS_FILE = "offsets.npy"
+MANIFEST_FILE = "manifest.json"
+# Trava entre processos: só um worker da API grava versões por vez
+LOCK_FILE = ".lock"
+# A cada quantos segundos a busca confere se outro worker publicou versão nova
+FOLLOW_INTERVAL_S = 2.0
+
+# Tamanho dos trechos em caracteres (~200 tokens) e sobreposição entre vizinhos
+CHUNK_MAX_CHARS = 800
+CHUNK_OVERLAP_CHARS = 150
+# Mudou algum destes? O índice é reconstruído
+INDEX_VERSION = 5
+
+# Busca híbrida: nota = peso * cosseno + (1 - peso) * BM25 saturado em [0, 1)
+RAG_TOP_K = 3
+RAG_VECTOR_WEIGHT = 0.6
+# BM25 igual a este valor vale 0.5 na nota lexical
+RAG_BM25_SATURATION = 5.0
+# Trechos abaixo desta nota não entram no prompt
+RAG_MIN_SCORE = 0.3
+# Candidatos de cada busca antes do filtro por cultivo e da fusão
+RAG_CANDIDATES = 50
+# Pastas que valem para qualquer cultivo (geral_ciencia_agricola, ...)
+GENERAL_CROP_PREFIX = "geral"
+
+_HEADING = re.compile(r"^\s*(Tópico:.*|\*\*[^*]+\*\*:?)\s*$")
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_source_files(doc_path: str = DOC_PATH) -> List[str]:
+    """Caminhos relativos a doc_path, em ordem estável"""
+    files = []
+    for root, _, names in os.walk(doc_path):
+        for name in names:
+            if name.endswith(".txt"):
+                files.append(os.path.relpath(os.path.join(root, name), doc_path).replace(os.sep, "/"))
+    return sorted(files)
+
+def corpus_hashes(doc_path: str = DOC_PATH) -> Dict[str, str]:
+    return {rel: file_hash(os.path.join(doc_path, rel)) for rel in list_source_files(doc_path)}
+
+def crop_of(rel_path: str) -> str:
+    """Pasta de primeiro nível: 'Milho', 'geral_ciencia_agricola'..."""
+    return rel_path.split("/", 1)[0] if "/" in rel_path else ""
+
+def is_general_crop(crop: str) -> bool:
+    return not crop or crop.lower().startswith(GENERAL_CROP_PREFIX)
+
+def clean_heading(line: str) -> str:
+    return line.strip().strip("*").rstrip(":").strip()
+
+def split_sections(text: str) -> List[Tuple[str, List[str]]]:
+    """Texto -> [(título da seção, parágrafos)]"""
+    sections = [("", [])]
+    paragraph = []
+    for line in text.splitlines() + [""]:
+        if _HEADING.match(line):
+            if paragraph:
+                sections[-1][1].append("\n".join(paragraph))
+                paragraph = []
+            sections.append((clean_heading(line), []))
+        elif not line.strip():
+            if paragraph:
+                sections[-1][1].append("\n".join(paragraph))
+                paragraph = []
+        else:
+            paragraph.append(line.rstrip())
+    return [(title, paragraphs) for title, paragraphs in sections if paragraphs]
+
+def _split_long(paragraph: str, max_chars: int) -> List[str]:
+    """Parágrafo maior que o trecho: quebra por linhas e, se preciso, por frases"""
+    if len(paragraph) <= max_chars:
+        return [paragraph]
+    pieces, current = [], ""
+    units = paragraph.splitlines() if "\n" in paragraph else re.split(r"(?<=[.!?])\s+", paragraph)
+    for unit in units:
+        if len(unit) > max_chars:
+            unit_pieces = [unit[i:i + max_chars] for i in range(0, len(unit), max_chars)]
+        else:
+            unit_pieces = [unit]
+        for piece in unit_pieces:
+            if current and len(current) + len(piece) + 1 > max_chars:
+                pieces.append(current)
+                current = piece
+            else:
+                current = f"{current}\n{piece}" if current else piece
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> List[Tuple[str, str]]:
+    """
+    Agrupa parágrafos da mesma seção até max_chars. Cada trecho novo começa
+    com o final (overlap caracteres) do anterior, para não cortar contexto.
+    """
+    topic = ""
+    chunks = []
+    for title, paragraphs in split_sections(text):
+        if title.startswith("Tópico:"):
+            topic = title.split(":", 1)[1].strip()
+        section = title if not title.startswith("Tópico:") else topic
+        current = ""
+        for paragraph in paragraphs:
+            for piece in _split_long(paragraph, max_chars):
+                if current and len(current) + len(piece) + 2 > max_chars:
+                    chunks.append((section, current))
+                    tail = current[-overlap:]
+                    tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+                    current = f"{tail}\n\n{piece}" if overlap else piece
+                else:
+                    current = f"{current}\n\n{piece}" if current else piece
+        if current:
+            chunks.append((section, current))
+    return chunks
+
+def chunk_file(rel_path: str, doc_path: str = DOC_PATH) -> List[Dict[str, Any]]:
+    with open(os.path.join(doc_path, rel_path), "r", encoding="utf-8") as f:
+        text = f.read()
+    return [{"crop": crop_of(rel_path), "file": rel_path, "section": section, "text": chunk}
+            for section, chunk in chunk_text(text)]
+
+class ChunkStore:
+    """
+    Trechos em JSON Lines abertos via mmap: só os trechos retornados pela
+    busca são lidos e decodificados. ids.npy (ordenado), offsets.npy e
+    vectors.npy (mesma ordem dos ids) também são mapeados; o trecho de um ID
+    é achado por busca binária.
+    """
+
+    def __init__(self, version_dir: str):
+        self._file = open(os.path.join(version_dir, CHUNKS_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._ids = np.load(os.path.join(version_dir, IDS_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(version_dir, OFFSETS_FILE), mmap_mode="r")
+        self.vectors = np.load(os.path.join(version_dir, VECTORS_FILE), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    def _position(self, chunk_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self._ids, chunk_id))
+        if pos >= len(self._ids) or int(self._ids[pos]) != chunk_id:
+            return None
+        return pos
+
+    def get(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        pos = self._position(chunk_id)
+        if pos is None:
+            return None
+        start, end = int(self._offsets[pos]), int(self._offsets[pos + 1])
+        return json.loads(self._mmap[start:end].decode("utf-8"))
+
+    def vector(self, chunk_id: int) -> Optional[np.ndarray]:
+        pos = self._position(chunk_id)
+        return None if pos is None else np.asarray(self.vectors[pos])
+
+    def vectors_for(self, chunk_ids: List[int]) -> np.ndarray:
+        positions = np.searchsorted(self._ids, np.asarray(chunk_ids, dtype=np.int64))
+        return np.asarray(self.vectors[positions], dtype=np.float32)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+        # Arrays do np.load(mmap_mode="r"): o mapeamento fecha com a última referência
+        self._ids = self._offsets = self.vectors = None
+
+def write_store(items: List[Tuple[int, Dict[str, Any]]], vectors: np.ndarray, version_dir: str):
+    """[(id, trecho)] + vetores na mesma ordem -> chunks.jsonl + ids/offsets/vectors.npy, em ordem de ID"""
+    order = sorted(range(len(items)), key=lambda i: items[i][0])
+    items = [items[i] for i in order]
+    np.save(os.path.join(version_dir, VECTORS_FILE), np.ascontiguousarray(vectors[order], dtype=np.float32))
+    offsets = [0]
+    with open(os.path.join(version_dir, CHUNKS_FILE), "wb") as f:
+        for _, chunk in items:
+            line = (json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(version_dir, IDS_FILE), np.array([i for i, _ in items], dtype=np.int64))
+    np.save(os.path.join(version_dir, OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+
+def read_manifest(version_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(version_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_index(version_dir: str):
+    """
+    Abre o índice via mmap quando o tipo permite; senão carrega em memória.
+    Índice flat não tem arquivo: a busca é feita direto em vectors.npy (None).
+    """
+    path = os.path.join(version_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except Exception:
+        return faiss.read_index(path)
+
+def compatible(manifest: Optional[Dict[str, Any]], model_name: str) -> bool:
+    """Versão do formato, modelo e chunking iguais: dá para atualizar incrementalmente"""
+    return bool(manifest) and manifest.get("version") == INDEX_VERSION and manifest.get("model") == model_name \
+        and manifest.get("chunk_max_chars") == CHUNK_MAX_CHARS and manifest.get("chunk_overlap") == CHUNK_OVERLAP_CHARS
+
+def diff_files(manifest: Optional[Dict[str, Any]], hashes: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """(arquivos novos ou alterados, arquivos removidos)"""
+    files = (manifest or {}).get("files", {})
+    changed = [rel for rel, digest in hashes.items() if files.get(rel, {}).get("hash") != digest]
+    removed = [rel for rel in files if rel not in hashes]
+    return changed, removed
+
+@contextmanager
+def process_lock(path: str):
+    """Trava exclusiva num arquivo (fcntl no Linux, msvcrt no Windows)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK desiste após ~10s; outro worker ainda está indexando
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class KnowledgeIndex:
+    """
+    Uma versão imutável do índice (FAISS + BM25 + trechos + manifesto).
+    Tudo que é lido por busca fica em arquivos mapeados (vectors.npy, trechos,
+    arrays do BM25): com vários workers da API o sistema guarda uma cópia só
+    no cache de páginas. HNSW é a exceção (o grafo é carregado por worker).
+
+    Buscas seguram a versão com acquire()/release(); depois de substituída
+    (retire), ela é fechada quando a última busca em andamento termina.
+    """
+
+    def __init__(self, version_dir: str):
+        self.version_dir = version_dir
+        self.manifest = read_manifest(version_dir)
+        self.index = read_index(version_dir)
+        self.store = ChunkStore(version_dir)
+        self.lexical = lexical_index.BM25Index.load(version_dir)
+        if self.index is not None:
+            ann_index.configure_search(self.index, self.manifest.get("index"))
+        self._users = 0
+        self._retired = False
+        self.closed = False
+        self._guard = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Reserva a versão para uma busca; False se ela já foi substituída"""
+        with self._guard:
+            if self._retired:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._guard:
+            self._users -= 1
+            done = self._retired and self._users == 0
+        if done:
+            self.close()
+
+    def retire(self):
+        """Versão substituída: fecha agora ou quando a última busca terminar"""
+        with self._guard:
+            self._retired = True
+            done = self._users == 0
+        if done:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.store.close()
+        self.lexical.close()
+        self.index = None
+
+    def crop_mask(self, crop: Optional[str]) -> Optional[np.ndarray]:
+        """
+        Trechos das pastas gerais + da pasta do cultivo (sem diferenciar
+        maiúsculas/acentos). Sem cultivo informado: todos (None).
+        """
+        if not crop:
+            return None
+        wanted = lexical_index.fold(crop).strip()
+        return self.lexical.crop_mask(lambda name: is_general_crop(name) or lexical_index.fold(name) == wanted)
+
+    def _vector_candidates(self, vector: np.ndarray, mask: Optional[np.ndarray]) -> List[int]:
+        n = min(RAG_CANDIDATES, len(self.store))
+        if self.index is None:
+            # Flat: produto interno direto nos vetores mapeados, já filtrado por cultivo
+            scores = self.store.vectors @ vector[0]
+            if mask is not None:
+                scores = np.where(self.lexical.allowed(self.store.ids, mask), scores, -np.inf)
+            top = np.argpartition(-scores, n - 1)[:n]
+            return [int(self.store.ids[pos]) for pos in top if np.isfinite(scores[pos])]
+        # HNSW/IVF-PQ: o filtro por cultivo roda depois da busca, então pede
+        # vizinhos na proporção inversa da fatia do cultivo e dobra se faltar
+        share = self.lexical.mask_share(mask)
+        if share == 0:
+            return []
+        k = min(len(self.store), int(np.ceil(n / share)))
+        while True:
+            _, ids = self.index.search(vector, k)
+            found = ids[0][ids[0] >= 0]
+            kept = found[self.lexical.allowed(found, mask)]
+            # Para quando bastar, quando o índice não tiver mais vizinhos (nprobe) ou já pediu tudo
+            if len(kept) >= n or len(found) < k or k >= len(self.store):
+                return [int(chunk_id) for chunk_id in kept[:n]]
+            k = min(len(self.store), k * 2)
+
+    def _vector_scores(self, vector: np.ndarray, ids: List[int]) -> Dict[int, float]:
+        """Cosseno exato dos candidatos (vetores de vectors.npy)"""
+        scores = {}
+        for chunk_id in ids:
+            stored = self.store.vector(chunk_id)
+            scores[chunk_id] = float(np.dot(stored, vector[0])) if stored is not None else 0.0
+        return scores
+
+    def search(self, query_vector: np.ndarray, k: int = RAG_TOP_K, query: str = "", crop: Optional[str] = None,
+               min_score: float = RAG_MIN_SCORE) -> List[Dict[str, Any]]:
+        if len(self.store) == 0:
+            return []
+        mask = self.crop_mask(crop)
+        vector = np.asarray(query_vector, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+
+        # Vetorial: candidatos a mais, para sobrar depois do filtro por cultivo
+        candidates = self._vector_candidates(vector, mask)
+        # Lexical: BM25 só nos trechos permitidos
+        bm25 = dict(self.lexical.top(query, RAG_CANDIDATES, mask)) if query else {}
+        # Cosseno exato de todos os candidatos: com HNSW/IVF-PQ a nota do índice
+        # é aproximada, e o limiar RAG_MIN_SCORE precisa valer igual para todos
+        cosine = self._vector_scores(vector, list(dict.fromkeys(candidates + list(bm25))))
+
+        fused = []
+        for chunk_id, cos in cosine.items():
+            lexical = bm25.get(chunk_id, 0.0)
+            score = RAG_VECTOR_WEIGHT * cos + (1 - RAG_VECTOR_WEIGHT) * lexical / (lexical + RAG_BM25_SATURATION)
+            if score >= min_score:
+                fused.append((score, chunk_id, cos, lexical))
+
+        results = []
+        for score, chunk_id, cos, lexical in sorted(fused, reverse=True)[:k]:
+            chunk = self.store.get(chunk_id)
+            if chunk is None:
+                continue
+            chunk.update(id=chunk_id, score=score, vector_score=cos, bm25=lexical)
+            results.append(chunk)
+        return results
+
+class KnowledgeBase:
+    """
+    Versão atual do índice + atualizações incrementais.
+    `current` é trocado numa única atribuição, então a busca nunca vê um
+    índice pela metade; atualizações são serializadas por um lock (threads)
+    e por process_lock (workers). Um worker que não gravou a versão nova a
+    encontra pelo ponteiro CURRENT (_follow_current) e passa a mapeá-la.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], model_name: str,
+                 doc_path: str = DOC_PATH, index_dir: str = INDEX_DIR, index_type: str = "flat"):
+        self.encode = encode
+        self.model_name = model_name
+        self.index_type = index_type
+        self.doc_path = doc_path
+        self.index_dir = index_dir
+        self.current: Optional[KnowledgeIndex] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._snapshot = None
+        self._next_follow = 0.0
+        # Versões substituídas ainda abertas por buscas em andamento
+        self._retired: List[KnowledgeIndex] = []
+
+    def load(self) -> Dict[str, Any]:
+        """Abre a versão gravada (se houver) e aplica o que mudou nos arquivos"""
+        return self.update()
+
+    def _follow_current(self) -> bool:
+        """Passa a usar a versão apontada por CURRENT, se for outra (ex.: gravada por outro worker)"""
+        version_dir = self._current_dir()
+        if not version_dir or (self.current and self.current.version_dir == version_dir) or not read_manifest(version_dir):
+            return False
+        try:
+            opened = KnowledgeIndex(version_dir)
+        except Exception as e:
+            print(f"!!! Índice em disco ilegível ({e}): será reconstruído")
+            return False
+        self._swap(opened)
+        print(f"-> Índice da base local aberto do disco: {os.path.basename(version_dir)} "
+              f"({opened.manifest['chunks']} trechos)")
+        return True
+
+    def _swap(self, new: KnowledgeIndex):
+        """Publica a versão nova (com o _lock) e aposenta a anterior"""
+        previous = self.current
+        self.current = new
+        if previous is not None:
+            previous.retire()
+            self._retired.append(previous)
+        self._retired = [index for index in self._retired if not index.closed]
+
+    def search(self, query_vector: np.ndarray, k: int = RAG_TOP_K, query: str = "", crop: Optional[str] = None,
+               min_score: float = RAG_MIN_SCORE) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        # Sem bloquear a busca: se uma atualização está em andamento, confere depois
+        if now >= self._next_follow and self._lock.acquire(blocking=False):
+            try:
+                self._next_follow = now + FOLLOW_INTERVAL_S
+                self._follow_current()
+            finally:
+                self._lock.release()
+        while True:
+            current = self.current
+            if current is None:
+                return []
+            # Falha só se a versão foi trocada entre a leitura e o acquire: relê
+            if current.acquire():
+                break
+        try:
+            return current.search(query_vector, k, query, crop, min_score)
+        finally:
+            current.release()
+
+    def update(self) -> Dict[str, Any]:
+        """Re-embeda só arquivos novos/alterados e remove os apagados"""
+        with self._lock, process_lock(os.path.join(self.index_dir, LOCK_FILE)):
+            # Outro worker pode ter acabado de gravar a versão com estas mesmas mudanças
+            self._follow_current()
+            hashes = corpus_hashes(self.doc_path)
+            old = self.current if self.current and compatible(self.current.manifest, self.model_name) else None
+            changed, removed = diff_files(old.manifest if old else None, hashes)
+            # Tipo de índice trocado na configuração: reconstrói com os vetores gravados
+            retype = bool(old) and old.manifest.get("index", {}).get("requested") != self.index_type
+            if old and not changed and not removed and not retype:
+                return {"changed": [], "removed": [], "chunks": old.manifest["chunks"]}
+
+            if not old:
+                print(f"-> Reconstruindo o índice da base local ({len(hashes)} arquivos)...")
+            previous = self.current
+            new = self._build_version(old, hashes, changed, removed)
+            self._swap(new)
+            self._write_current(os.path.basename(new.version_dir))
+            self._cleanup(keep={new.version_dir, previous.version_dir if previous else None})
+            print(f"-> Índice da base local atualizado: {len(changed)} arquivo(s) novo(s)/alterado(s), "
+                  f"{len(removed)} removido(s), {new.manifest['chunks']} trechos")
+            return {"changed": changed, "removed": removed, "chunks": new.manifest["chunks"]}
+
+    def _build_version(self, old: Optional[KnowledgeIndex], hashes: Dict[str, str],
+                       changed: List[str], removed: List[str]) -> KnowledgeIndex:
+        old_manifest = old.manifest if old else {}
+        old_files = old_manifest.get("files", {})
+        next_id = old_manifest.get("next_id", 0)
+
+        files = {rel: entry for rel, entry in old_files.items() if rel in hashes and rel not in changed}
+        drop_ids = [chunk_id for rel in changed + removed for chunk_id in old_files.get(rel, {}).get("ids", [])]
+
+        new_items = []
+        for rel in changed:
+            chunks = chunk_file(rel, self.doc_path)
+            ids = list(range(next_id, next_id + len(chunks)))
+            next_id += len(chunks)
+            files[rel] = {"hash": hashes[rel], "ids": ids}
+            new_items.extend(zip(ids, chunks))
+
+        new_vectors = None
+        if new_items:
+            new_vectors = np.asarray(self.encode([chunk["text"] for _, chunk in new_items]), dtype=np.float32)
+            faiss.normalize_L2(new_vectors)
+        dim = int(new_vectors.shape[1]) if new_vectors is not None else old_manifest.get("dim")
+        if dim is None:
+            raise ValueError(f"Nenhum trecho encontrado em {self.doc_path}")
+        new_ids = np.array([i for i, _ in new_items], dtype=np.int64)
+        if new_vectors is None:
+            new_vectors = np.zeros((0, dim), dtype=np.float32)
+
+        kept = {chunk_id for entry in files.values() for chunk_id in entry["ids"]}
+        kept_ids = sorted(kept - set(new_ids.tolist())) if old else []
+        items = [(chunk_id, old.store.get(chunk_id)) for chunk_id in kept_ids] + new_items
+        vectors = np.vstack([old.store.vectors_for(kept_ids) if kept_ids else np.zeros((0, dim), dtype=np.float32),
+                             new_vectors])
+        ids = np.array([i for i, _ in items], dtype=np.int64)
+
+        index_meta = old_manifest.get("index")
+        index = None
+        effective, _ = ann_index.resolve_params(self.index_type, len(items), dim)
+        if effective == "flat":
+            # Flat não tem arquivo FAISS: a busca usa vectors.npy mapeado (compartilhado entre workers)
+            index_meta = ann_index.flat_meta(self.index_type)
+        elif old and old.index is not None and not ann_index.needs_rebuild(index_meta, self.index_type, len(items)):
+            try:
+                # Cópia em memória da versão atual: a antiga segue servindo buscas
+                index = faiss.clone_index(old.index)
+                if drop_ids:
+                    index.remove_ids(np.array(drop_ids, dtype=np.int64))
+                if len(new_ids):
+                    index.add_with_ids(new_vectors, new_ids)
+            except Exception as e:
+                print(f"-> Atualização incremental do índice falhou ({e}); reconstruindo")
+                index = None
+        if index is None and effective != "flat":
+            index, index_meta = ann_index.build(self.index_type, vectors, ids)
+            print(f"-> Índice {index_meta['type']} construído em {index_meta['build_s']}s ({len(items)} trechos)")
+
+        generation = self._next_generation()
+        version_dir = os.path.join(self.index_dir, f"v{generation:05d}")
+        os.makedirs(version_dir)
+        if index is not None:
+            faiss.write_index(index, os.path.join(version_dir, INDEX_FILE))
+        write_store(items, vectors, version_dir)
+        lexical_index.BM25Index.build(items).save(version_dir)
+        manifest = {
+            "version": INDEX_VERSION,
+            "generation": generation,
+            "model": self.model_name,
+            "dim": dim,
+            "chunks": len(items),
+            "next_id": next_id,
+            "index": index_meta,
+            "chunk_max_chars": CHUNK_MAX_CHARS,
+            "chunk_overlap": CHUNK_OVERLAP_CHARS,
+            "files": files
+        }
+        with open(os.path.join(version_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return KnowledgeIndex(version_dir)
+
+    def _next_generation(self) -> int:
+        os.makedirs(self.index_dir, exist_ok=True)
+        generations = [int(name[1:]) for name in os.listdir(self.index_dir) if re.fullmatch(r"v\d+", name)]
+        return max(generations, default=0) + 1
+
+    def _current_dir(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return os.path.join(self.index_dir, f.read().strip())
+        except OSError:
+            return None
+
+    def _write_current(self, version_name: str):
+        """Troca atômica do ponteiro em disco (o próximo startup abre esta versão)"""
+        tmp = os.path.join(self.index_dir, CURRENT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version_name)
+        os.replace(tmp, os.path.join(self.index_dir, CURRENT_FILE))
+
+    def _cleanup(self, keep):
+        """
+        Apaga versões antigas. A anterior fica para outros workers que ainda
+        não seguiram o CURRENT, e as substituídas com busca em andamento também.
+        """
+        keep = set(keep) | {index.version_dir for index in self._retired if not index.closed}
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if re.fullmatch(r"v\d+", name) and os.path.isdir(path) and path not in keep:
+                # No Windows, arquivos ainda mapeados não apagam: fica para a próxima
+                shutil.rmtree(path, ignore_errors=True)
+
+    # --- Observador da pasta (opcional) ---
+
+    def _file_snapshot(self) -> Dict[str, Tuple[float, int]]:
+        snapshot = {}
+        for rel in list_source_files(self.doc_path):
+            stat = os.stat(os.path.join(self.doc_path, rel))
+            snapshot[rel] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def _watch(self, interval: float):
+        self._snapshot = self._file_snapshot()
+        while not self._stop.wait(interval):
+            try:
+                snapshot = self._file_snapshot()
+                if snapshot != self._snapshot:
+                    self._snapshot = snapshot
+                    self.update()
+            except Exception as e:
+                print(f"!!! ERRO ao atualizar o índice da base local: {e}")
+
+    def start_watcher(self, interval: float):
+        """Verifica mtime/tamanho dos .txt a cada `interval` segundos"""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="rag-watcher", daemon=True)
+        self._watcher.start()
+        print(f"-> Observando {self.doc_path} a cada {interval:g}s")
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        manifest = self.current.manifest if self.current else {}
+        return {
+            "generation": manifest.get("generation"),
+            "chunks": manifest.get("chunks", 0),
+            "files": len(manifest.get("files", {})),
+            "index": manifest.get("index"),
+            "watching": bool(self._watcher and self._watcher.is_alive())
+        }
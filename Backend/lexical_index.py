@@ -0,0 +1,174 @@
+"""
+Índice Lexical (BM25) - EKKO
+Busca por palavras nos mesmos trechos do índice FAISS (knowledge_index.py)
+
+O embedding all-MiniLM-L6-v2 é treinado em inglês e confunde termos técnicos
+em português; o BM25 garante que trechos com os termos da pergunta
+(ex.: "cigarrinha", "calagem") apareçam. Gravado em cada versão do índice,
+junto com o cultivo de cada trecho para o filtro por cultura.
+
+Formato em arrays .npy (vocabulário ordenado + listas invertidas contíguas),
+abertos via mmap: vários workers da API compartilham a mesma cópia no cache
+de páginas do sistema em vez de cada um montar seus dicionários.
+"""
+
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_META_FILE = "bm25.json"
+# Vocabulário ordenado, início de cada lista, (id, frequência) das listas,
+# e por trecho (em ordem de id): tamanho e índice do cultivo
+BM25_ARRAYS = ("terms", "offsets", "postings_ids", "postings_tfs", "doc_ids", "doc_len", "doc_crop")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Sem acento: tokens passam por fold() antes da comparação
+_STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "uns", "umas", "para", "pra", "por", "com", "sem", "que", "qual", "quais", "como",
+    "meu", "minha", "meus", "minhas", "se", "ao", "aos", "mais", "menos", "sobre", "ser", "esta",
+    "isso", "isto", "ele", "ela", "eles", "elas", "seu", "sua", "seus", "suas", "ou", "mas", "nao",
+    "sim", "ja", "muito", "pode", "devo", "fazer", "quando", "onde", "entre", "the", "of", "and"
+}
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Calagem É" -> "calagem e")"""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in normalized if not unicodedata.combining(char))
+
+def tokenize(text: str) -> List[str]:
+    """Termos sem acento e sem stopwords; plural simples vira singular (pragas -> praga)"""
+    tokens = []
+    for word in _WORD.findall(fold(text)):
+        if len(word) < 2 or word in _STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+def _array_path(version_dir: str, name: str) -> str:
+    return os.path.join(version_dir, f"bm25_{name}.npy")
+
+class BM25Index:
+    """Listas invertidas termo -> (ids dos trechos, frequências), em arrays"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], crop_names: List[str],
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.arrays = arrays
+        self.crop_names = crop_names
+        self.k1 = k1
+        self.b = b
+        doc_len = arrays["doc_len"]
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[int, Dict[str, Any]]]) -> "BM25Index":
+        postings: Dict[str, Dict[int, int]] = {}
+        docs = []
+        crop_names: List[str] = []
+        for chunk_id, chunk in sorted(items, key=lambda item: item[0]):
+            # A seção entra no texto indexado: títulos costumam ter o termo-chave
+            tokens = tokenize(f"{chunk.get('section', '')}\n{chunk['text']}")
+            crop = chunk.get("crop", "")
+            if crop not in crop_names:
+                crop_names.append(crop)
+            docs.append((chunk_id, len(tokens), crop_names.index(crop)))
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, {})[chunk_id] = count
+
+        terms = sorted(postings)
+        offsets = [0]
+        for term in terms:
+            offsets.append(offsets[-1] + len(postings[term]))
+        arrays = {
+            "terms": np.array(terms, dtype=f"<U{max((len(t) for t in terms), default=1)}"),
+            "offsets": np.array(offsets, dtype=np.int64),
+            "postings_ids": np.array([i for term in terms for i in postings[term]], dtype=np.int64),
+            "postings_tfs": np.array([tf for term in terms for tf in postings[term].values()], dtype=np.int32),
+            "doc_ids": np.array([d[0] for d in docs], dtype=np.int64),
+            "doc_len": np.array([d[1] for d in docs], dtype=np.int32),
+            "doc_crop": np.array([d[2] for d in docs], dtype=np.int16),
+        }
+        return cls(arrays, crop_names)
+
+    def save(self, version_dir: str):
+        for name in BM25_ARRAYS:
+            np.save(_array_path(version_dir, name), self.arrays[name])
+        with open(os.path.join(version_dir, BM25_META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "crops": self.crop_names}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, version_dir: str) -> "BM25Index":
+        with open(os.path.join(version_dir, BM25_META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(_array_path(version_dir, name), mmap_mode="r") for name in BM25_ARRAYS}
+        return cls(arrays, meta["crops"], meta.get("k1", BM25_K1), meta.get("b", BM25_B))
+
+    def close(self):
+        """Solta os arrays mapeados (o mmap fecha quando a última referência sai)"""
+        self.arrays = {}
+
+    def crop_mask(self, accept) -> np.ndarray:
+        """Máscara sobre crop_names: accept(nome do cultivo) -> bool"""
+        return np.array([bool(accept(name)) for name in self.crop_names], dtype=bool)
+
+    def mask_share(self, mask: Optional[np.ndarray]) -> float:
+        """Fração dos trechos que passam na máscara (1.0 sem máscara)"""
+        doc_crop = self.arrays["doc_crop"]
+        if mask is None or not len(doc_crop):
+            return 1.0
+        counts = np.bincount(doc_crop, minlength=len(mask))[:len(mask)]
+        return float(counts[mask].sum()) / len(doc_crop)
+
+    def allowed(self, chunk_ids: np.ndarray, mask: Optional[np.ndarray]) -> np.ndarray:
+        """Quais chunk_ids passam na máscara de cultivos (todos se mask for None)"""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if mask is None or not len(chunk_ids):
+            return np.ones(len(chunk_ids), dtype=bool)
+        doc_ids = self.arrays["doc_ids"]
+        positions = np.clip(np.searchsorted(doc_ids, chunk_ids), 0, max(len(doc_ids) - 1, 0))
+        known = doc_ids[positions] == chunk_ids
+        return known & mask[self.arrays["doc_crop"][positions]]
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        terms = self.arrays["terms"]
+        pos = int(np.searchsorted(terms, term))
+        if pos >= len(terms) or terms[pos] != term:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        start, end = int(self.arrays["offsets"][pos]), int(self.arrays["offsets"][pos + 1])
+        return self.arrays["postings_ids"][start:end], self.arrays["postings_tfs"][start:end]
+
+    def scores(self, query: str, mask: Optional[np.ndarray] = None) -> Dict[int, float]:
+        """BM25 de cada trecho com ao menos um termo da pergunta"""
+        n = len(self.arrays["doc_ids"])
+        all_ids, all_scores = [], []
+        for term in set(tokenize(query)):
+            ids, tfs = self._postings(term)
+            # Frequência nos documentos: conta a base toda, antes do filtro de cultivo
+            df = len(ids)
+            keep = self.allowed(ids, mask)
+            ids, tfs = ids[keep], tfs[keep].astype(np.float64)
+            if not len(ids):
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            doc_len = self.arrays["doc_len"][np.searchsorted(self.arrays["doc_ids"], ids)]
+            norm = 1 - self.b + self.b * doc_len / (self.avgdl or 1)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + self.k1 * norm))
+        if not all_ids:
+            return {}
+        unique, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(all_scores))
+        return dict(zip(unique.tolist(), totals.tolist()))
+
+    def top(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        return sorted(self.scores(query, mask).items(), key=lambda item: item[1], reverse=True)[:k]
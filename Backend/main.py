@@ -4,12 +4,13 @@ FastAPI com MongoDB Atlas
 """
 
 # Imports do sistema e de bibliotecas
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import iterate_in_threadpool
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-from datetime import datetime
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta, timezone
 import uuid
 import uvicorn
 from dotenv import load_dotenv
@@ -18,12 +19,34 @@ import requests
 import json
 import re
 import random
+import asyncio
 # Imports locais
-from database import unity_profiles, unity_soil_data, API_HOST, API_PORT, API_DEBUG, client, DB_NAME
-from ai_analyzer import analyze_soil_complete, get_main_crop, count_ideal_parameters, analyze_trend, calculate_sustainability, calculate_soil_health
+from database import async_unity_profiles as unity_profiles
+from database import async_client as client, API_HOST, API_PORT, API_DEBUG, API_WORKERS, WEB_CONCURRENCY, DB_NAME
+from database import SOIL_WRITE_BEHIND, SOIL_BUFFER_MAX_SIZE, SOIL_BUFFER_FLUSH_MS, SOIL_BUFFER_FLUSH_DOCS, SOIL_BUFFER_FULL_POLICY, SOIL_BUFFER_WAIT_MS
+from database import SOIL_BUFFER_MAX_RETRIES, SOIL_BUFFER_RETRY_MS, SOIL_DEAD_LETTER_FILE
+from database import SOIL_STREAM_QUEUE_SIZE, SOIL_STREAM_HEARTBEAT_S, SOIL_CHANGE_STREAMS
+from database import SOIL_CLIENT_TS_MAX_SKEW_S, SOIL_CLIENT_TS_MAX_AGE_H
+from database import RAG_WATCH, RAG_WATCH_INTERVAL_S
+from ingest_buffer import SoilWriteBuffer, BufferFullError
+from soil_ids import new_soil_id
+from indexes import ensure_indexes
+import soil_store
+import soil_monitoring
+import soil_rollups
+import chat_context
+import conversations
+from soil_pubsub import SoilPubSub, watch_soil_inserts
+from constants import CHAT_CONTEXT_LABELS
+from ai_analyzer import analyze_soil_complete, get_main_crop, count_ideal_parameters, analyze_trend, analyze_trend_from_rollups, calculate_sustainability, calculate_soil_health
 import tool
 import prompts
+import prompt_builder
 import ai_connector
+from ai_connector import LLMQueueFullError
+from ollama_config import PRIORITY_CHAT, PRIORITY_TIPS, PRIORITY_TITLE, LLM_RETRY_AFTER, LLM_MAX_IN_FLIGHT, OLLAMA_NUM_PARALLEL
+from ollama_config import TIPS_CACHE_SIZE, TIPS_CACHE_TTL, CHAT_SEMANTIC_CACHE, CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_THRESHOLD
+from response_cache import ResponseCache, SemanticCache, tips_cache_key, tips_value_context
 
 load_dotenv()
 app = FastAPI(title="EKKO API ", version="Debug")
@@ -35,6 +58,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Limite de leituras aceitas por requisição em /unity/soil/save-batch
+MAX_SOIL_BATCH = 1000
+
+# Dashboard: campos realmente exibidos pelo unity-dashboard.js
+DASHBOARD_PROFILE_PROJECTION = {
+    "dados_pessoais": 1,
+    "propriedade": 1,
+    "experiencia": 1,
+    "unity_stats": 1,
+    "auditoria": 1
+}
+DASHBOARD_SUMMARY_PROJECTION = {
+    "dados_pessoais.nome": 1,
+    "propriedade.nome": 1,
+    "propriedade.area_hectares": 1
+}
+SOIL_HISTORY_FIELDS = ["timestamp", "soil_parameters", "nutrients", "game_metrics", "cultivo_atual", "estacao"]
+DASHBOARD_HISTORY_LIMIT = 100
+DASHBOARD_HISTORY_MAX = 500
+
+# Write-behind (opcional): save_soil apenas enfileira e responde
+soil_buffer = SoilWriteBuffer(
+    lambda docs: persist_readings(docs), SOIL_BUFFER_MAX_SIZE, SOIL_BUFFER_FLUSH_MS, SOIL_BUFFER_FLUSH_DOCS,
+    max_retries=SOIL_BUFFER_MAX_RETRIES, retry_ms=SOIL_BUFFER_RETRY_MS,
+    dead_letter=lambda docs: soil_store.write_dead_letter(SOIL_DEAD_LETTER_FILE, docs)
+) if SOIL_WRITE_BEHIND else None
+# Perfis já confirmados (evita um find_one por leitura no modo write-behind)
+verified_profiles = set()
+# Assinantes das atualizações ao vivo (/unity/stream)
+soil_events = SoilPubSub(SOIL_STREAM_QUEUE_SIZE)
+change_stream_task = None
+
+# Respostas da IA já geradas (dicas por parâmetro/cultivo/faixa; chat por similaridade)
+tips_cache = ResponseCache(TIPS_CACHE_SIZE, TIPS_CACHE_TTL)
+# O modelo de embeddings só existe depois do aquecimento; até lá o cache fica de fora
+chat_cache = (SemanticCache(tool.encode_query, CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_THRESHOLD)
+              if CHAT_SEMANTIC_CACHE else None)
+# Carregamento do modelo de embeddings e do índice da base local
+warmup_task = None
+
+async def warm_up_rag():
+    await asyncio.to_thread(tool.warm_up)
+    if RAG_WATCH and tool.knowledge:
+        tool.knowledge.start_watcher(RAG_WATCH_INTERVAL_S)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # python main.py já recusa a configuração; aqui cobre uvicorn/gunicorn iniciados por fora
+    workers = configured_workers()
+    if workers > 1:
+        for problem in multi_worker_problems(workers):
+            print(f"!!! AVISO ({workers} workers): {problem}")
+    await ensure_indexes()
+    # Modelo de embeddings + índice da base local em segundo plano: as demais
+    # rotas respondem já; o progresso fica em /api/ready
+    global warmup_task
+    warmup_task = asyncio.create_task(warm_up_rag())
+    ai_connector.health_monitor.start()
+    if soil_buffer:
+        soil_buffer.start()
+    if SOIL_CHANGE_STREAMS:
+        global change_stream_task
+        if soil_store.TIMESERIES:
+            print("!!! SOIL_CHANGE_STREAMS ignorado: collections time-series não têm change streams")
+        else:
+            change_stream_task = asyncio.create_task(watch_soil_inserts(soil_events))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    if soil_buffer:
+        await soil_buffer.stop()
+    if change_stream_task:
+        change_stream_task.cancel()
+    ai_connector.health_monitor.stop()
+    if warmup_task:
+        warmup_task.cancel()
+    if tool.knowledge:
+        tool.knowledge.stop_watcher()
+
 
 # Modelos
 class UnityProfile(BaseModel):
@@ -69,21 +171,27 @@ class SoilData(BaseModel):
     game_metrics: Optional[Dict[str, Any]] = None
     cultivo_atual: Optional[str] = "Milho"
     estacao: Optional[str] = "Crescimento"
+    # Chave enviada pelo cliente para que reenvios não dupliquem a leitura
+    idempotency_key: Optional[str] = None
+    # Momento da leitura no cliente (ISO 8601); sem ele vale a hora do servidor
+    timestamp: Optional[datetime] = None
 
 @app.get("/unity/status")
-def get_status():
+async def get_status():
     try:
         # Testar conexão
-        client.admin.command('ping')
+        await client.admin.command('ping')
         
         # Contar documentos
-        profiles_count = unity_profiles.count_documents({})
-        soil_count = unity_soil_data.count_documents({})
+        profiles_count = await unity_profiles.count_documents({})
+        soil_count = await soil_store.soil_collection().count_documents({})
         
         return {
             "status": "online",
             "database": "connected",
             "db_name": DB_NAME,
+            "soil_storage": "timeseries" if soil_store.TIMESERIES else "classic",
+            "rag": tool.warmup_state["stage"],
             "profiles": profiles_count,
             "soil_data": soil_count
         }
@@ -95,7 +203,7 @@ def get_status():
         }
 
 @app.post("/unity/profile/create")
-def create_profile(profile: UnityProfile):
+async def create_profile(profile: UnityProfile):
     unity_id = f"unity_{uuid.uuid4().hex[:12]}"
     
     profile_doc = {
@@ -116,7 +224,7 @@ def create_profile(profile: UnityProfile):
         "status": "active"
     }
     
-    unity_profiles.insert_one(profile_doc)
+    await unity_profiles.insert_one(profile_doc)
     
     return {
         "status": "success",
@@ -125,8 +233,8 @@ def create_profile(profile: UnityProfile):
     }
 
 @app.get("/unity/login/{unity_id}")
-def login(unity_id: str):
-    profile = unity_profiles.find_one({"_id": unity_id})
+async def login(unity_id: str):
+    profile = await unity_profiles.find_one({"_id": unity_id})
     
     if not profile:
         raise HTTPException(status_code=404, detail="ID não encontrado")
@@ -137,11 +245,26 @@ def login(unity_id: str):
         "profile": profile
     }
 
-@app.post("/unity/soil/save/{unity_id}")
-def save_soil(unity_id: str, soil: SoilData):
-    # Verificar se perfil existe
-    if not unity_profiles.find_one({"_id": unity_id}):
-        raise HTTPException(status_code=404, detail="ID não encontrado")
+def reading_timestamp(soil: SoilData) -> datetime:
+    """Hora da leitura em UTC (sem fuso, como o resto do Atlas); rejeita relógios fora da tolerância"""
+    now = datetime.utcnow()
+    if soil.timestamp is None:
+        return now
+    sent = soil.timestamp
+    if sent.tzinfo is not None:
+        sent = sent.astimezone(timezone.utc).replace(tzinfo=None)
+    if sent > now + timedelta(seconds=SOIL_CLIENT_TS_MAX_SKEW_S):
+        raise ValueError(f"timestamp no futuro ({sent.isoformat()}); verifique o relógio do dispositivo")
+    if sent < now - timedelta(hours=SOIL_CLIENT_TS_MAX_AGE_H):
+        raise ValueError(f"timestamp com mais de {SOIL_CLIENT_TS_MAX_AGE_H:g}h ({sent.isoformat()})")
+    return sent
+
+def build_soil_doc(unity_id: str, soil: SoilData) -> Dict[str, Any]:
+    """Monta o documento de solo no formato salvo no Atlas"""
+    try:
+        timestamp = reading_timestamp(soil)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     
     # Valores padrão para campos não enviados pelo Unity
     default_actions = {
@@ -163,9 +286,11 @@ def save_soil(unity_id: str, soil: SoilData):
     }
     
     soil_doc = {
-        "_id": f"soil_{unity_id}_{int(datetime.utcnow().timestamp())}",
+        "_id": new_soil_id(unity_id),
         "unity_id": unity_id,
-        "timestamp": datetime.utcnow(),
+        "timestamp": timestamp,
+        # Hora do servidor: o timestamp pode vir do cliente (corte de tools/reconstruir_rollups.py)
+        "received_at": datetime.utcnow(),
         "soil_parameters": {
             "ph": round(soil.ph, 2),
             "umidade": round(soil.umidade, 2),
@@ -193,32 +318,163 @@ def save_soil(unity_id: str, soil: SoilData):
         "estacao": soil.estacao,
         "health_score": int((soil.ph * 10) + (soil.umidade * 0.5) + 30)
     }
+    if soil.idempotency_key:
+        soil_doc["idempotency_key"] = soil.idempotency_key
+    return soil_doc
+
+async def persist_readings(soil_docs: List[Dict[str, Any]], ordered: bool = False):
+    """Grava as leituras e atualiza os rollups das que entraram de fato"""
+    duplicates, errors = await soil_store.insert_soil_docs(soil_docs, ordered=ordered)
+    saved = [doc for i, doc in enumerate(soil_docs) if i not in duplicates and i not in errors]
+    await soil_rollups.apply_rollups(saved)
+    if not change_stream_task:
+        # Sem change stream, os assinantes são avisados direto pela ingestão
+        for doc in saved:
+            soil_events.publish_reading(doc)
+    return duplicates, errors
+
+@app.post("/unity/soil/save/{unity_id}")
+async def save_soil(unity_id: str, soil: SoilData, idempotency_key: Optional[str] = Header(None)):
+    # A chave pode vir no corpo ou no header Idempotency-Key
+    if idempotency_key and not soil.idempotency_key:
+        soil.idempotency_key = idempotency_key
+    
+    if soil_buffer:
+        return await enqueue_soil(unity_id, soil)
     
-    result = unity_soil_data.insert_one(soil_doc)
+    # Verificar se perfil existe
+    if not await unity_profiles.find_one({"_id": unity_id}):
+        raise HTTPException(status_code=404, detail="ID não encontrado")
+    
+    soil_doc = build_soil_doc(unity_id, soil)
+    duplicates, errors = await persist_readings([soil_doc])
+    if errors:
+        raise HTTPException(status_code=500, detail=errors[0])
+    if duplicates:
+        # Reenvio com a mesma chave de idempotência: leitura já gravada
+        existing = await soil_store.find_ids_by_key(unity_id, [soil.idempotency_key])
+        return {
+            "status": "success",
+            "soil_id": existing.get(soil.idempotency_key, soil_doc["_id"]),
+            "duplicate": True,
+            "message": "Leitura já registrada"
+        }
     
     return {
         "status": "success",
-        "soil_id": str(result.inserted_id),
+        "soil_id": soil_doc["_id"],
         "message": "Dados salvos no Atlas"
     }
 
+async def enqueue_soil(unity_id: str, soil: SoilData):
+    """Modo write-behind: valida, enfileira e confirma sem esperar o Atlas"""
+    if unity_id not in verified_profiles:
+        if not await unity_profiles.find_one({"_id": unity_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="ID não encontrado")
+        verified_profiles.add(unity_id)
+    
+    soil_doc = build_soil_doc(unity_id, soil)
+    wait_seconds = SOIL_BUFFER_WAIT_MS / 1000 if SOIL_BUFFER_FULL_POLICY == "wait" else 0
+    try:
+        await soil_buffer.put(soil_doc, wait_seconds=wait_seconds)
+    except BufferFullError:
+        raise HTTPException(status_code=429, detail="Fila de ingestão cheia. Tente novamente em instantes.")
+    
+    return {
+        "status": "success",
+        "soil_id": soil_doc["_id"],
+        "queued": True,
+        "message": "Dados enfileirados para o Atlas"
+    }
+
+@app.get("/unity/ingest/stats")
+async def ingest_stats():
+    if not soil_buffer:
+        return {"status": "success", "write_behind": False, "rollups": soil_rollups.rollup_stats()}
+    return {"status": "success", "write_behind": True, "buffer": soil_buffer.stats(), "rollups": soil_rollups.rollup_stats()}
+
+@app.post("/unity/soil/save-batch/{unity_id}")
+async def save_soil_batch(unity_id: str, readings: List[SoilData], ordered: bool = False):
+    """Salva várias leituras de uma vez (um único bulk write no Atlas)"""
+    if not readings:
+        raise HTTPException(status_code=400, detail="Lote vazio")
+    if len(readings) > MAX_SOIL_BATCH:
+        raise HTTPException(status_code=413, detail=f"Lote excede o limite de {MAX_SOIL_BATCH} leituras")
+    
+    # Verificar perfil uma única vez para o lote inteiro
+    if not await unity_profiles.find_one({"_id": unity_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="ID não encontrado")
+    
+    soil_docs = []
+    for i, soil in enumerate(readings):
+        try:
+            soil_docs.append(build_soil_doc(unity_id, soil))
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Leitura {i}: {e.detail}")
+    
+    # Erros por item (índice -> mensagem); ordered=True para no primeiro erro
+    duplicates, errors = await persist_readings(soil_docs, ordered=ordered)
+    
+    # Duplicados respondem com o _id da leitura gravada antes
+    existing = await soil_store.find_ids_by_key(unity_id, list({soil_docs[i]["idempotency_key"] for i in duplicates}))
+    
+    results = []
+    for i, doc in enumerate(soil_docs):
+        if i in errors:
+            results.append({"index": i, "status": "error", "error": errors[i]})
+        elif i in duplicates:
+            results.append({"index": i, "status": "duplicate", "soil_id": existing.get(doc["idempotency_key"], doc["_id"])})
+        else:
+            results.append({"index": i, "status": "success", "soil_id": doc["_id"]})
+    
+    saved = len(soil_docs) - len(errors) - len(duplicates)
+    return {
+        "status": "success" if not errors else ("partial" if saved else "error"),
+        "total": len(soil_docs),
+        "saved": saved,
+        "duplicates": len(duplicates),
+        "failed": len(errors),
+        "results": results,
+        "message": f"{saved} leituras salvas no Atlas"
+    }
+
 @app.get("/unity/dashboard/{unity_id}")
-def get_dashboard(unity_id: str):
-    # Buscar perfil
-    profile = unity_profiles.find_one({"_id": unity_id})
+async def get_dashboard(unity_id: str, summary: bool = False, before: Optional[datetime] = None,
+                        before_id: Optional[str] = None, limit: int = DASHBOARD_HISTORY_LIMIT):
+    if not 1 <= limit <= DASHBOARD_HISTORY_MAX:
+        raise HTTPException(status_code=400, detail=f"limit deve estar entre 1 e {DASHBOARD_HISTORY_MAX}")
+    
+    # Buscar perfil (só os campos exibidos; no modo summary, apenas o cabeçalho)
+    profile = await unity_profiles.find_one({"_id": unity_id}, DASHBOARD_SUMMARY_PROJECTION if summary else DASHBOARD_PROFILE_PROJECTION)
     if not profile:
         raise HTTPException(status_code=404, detail="Unity ID não encontrado")
     
     # Buscar dados solo mais recentes
-    latest_soil = unity_soil_data.find_one(
-        {"unity_id": unity_id},
-        sort=[("timestamp", -1)]
-    )
+    latest_soil = await soil_store.find_latest(unity_id)
     
-    # Buscar histórico de solo para mapas
-    soil_history = list(unity_soil_data.find(
-        {"unity_id": unity_id}
-    ).sort("timestamp", -1).limit(100))
+    dashboard_data = {
+        "nome": profile["dados_pessoais"]["nome"],
+        "propriedade": profile["propriedade"].get("nome", "N/A"),
+        "area": profile["propriedade"].get("area_hectares", 0),
+        "soil_health": calculate_soil_health(latest_soil) if latest_soil else 50
+    }
+    
+    if summary:
+        # Modo leve para atualizações periódicas: sem perfil completo e sem histórico
+        return {
+            "status": "success",
+            "unity_id": unity_id,
+            "summary": True,
+            "latest_soil_data": latest_soil,
+            "dashboard_data": dashboard_data
+        }
+    
+    # Buscar histórico de solo para mapas (paginação por keyset em `before` + `before_id`)
+    soil_history = await soil_store.find_history(unity_id, limit=limit, before=before, before_id=before_id, fields=SOIL_HISTORY_FIELDS)
+    next_before = next_before_id = None
+    if len(soil_history) == limit:
+        next_before = soil_history[-1]["timestamp"].isoformat()
+        next_before_id = soil_history[-1]["_id"]
     
     return {
         "status": "success",
@@ -226,17 +482,14 @@ def get_dashboard(unity_id: str):
         "profile": profile,
         "latest_soil_data": latest_soil,
         "soil_history": soil_history,
-        "dashboard_data": {
-            "nome": profile["dados_pessoais"]["nome"],
-            "propriedade": profile["propriedade"].get("nome", "N/A"),
-            "area": profile["propriedade"].get("area_hectares", 0),
-            "soil_health": calculate_soil_health(latest_soil) if latest_soil else 50
-        }
+        "next_before": next_before,
+        "next_before_id": next_before_id,
+        "dashboard_data": dashboard_data
     }
 
 @app.get("/unity/ids")
-def list_ids():
-    profiles = list(unity_profiles.find({}, {"_id": 1}))
+async def list_ids():
+    profiles = await unity_profiles.find({}, {"_id": 1}).to_list(length=None)
     unity_ids = [p["_id"] for p in profiles]
     
     return {
@@ -246,12 +499,14 @@ def list_ids():
     }
 
 @app.get("/unity/monitoring/{unity_id}")
-def get_monitoring_data(unity_id: str, period: str = "24h"):
+async def get_monitoring_data(unity_id: str, period: str = "24h", max_points: Optional[int] = None):
     from datetime import datetime, timedelta
     
     # Validar usuário
-    if not unity_profiles.find_one({"_id": unity_id}):
+    if not await unity_profiles.find_one({"_id": unity_id}):
         raise HTTPException(status_code=404, detail="Unity ID não encontrado")
+    if max_points is not None and not 1 <= max_points <= soil_monitoring.MAX_POINTS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"max_points deve estar entre 1 e {soil_monitoring.MAX_POINTS_LIMIT}")
     
     # Calcular data limite baseada no período real
     now = datetime.utcnow()
@@ -259,40 +514,23 @@ def get_monitoring_data(unity_id: str, period: str = "24h"):
         "1h": timedelta(hours=1),
         "6h": timedelta(hours=6), 
         "24h": timedelta(hours=24),
-        "7d": timedelta(days=7)
+        "7d": timedelta(days=7),
+        "30d": timedelta(days=30)
     }
     
     time_limit = now - time_deltas.get(period, timedelta(hours=24))
     
-    # Buscar dados filtrados por timestamp real
-    soil_data = list(unity_soil_data.find({
-        "unity_id": unity_id,
-        "timestamp": {"$gte": time_limit}
-    }).sort("timestamp", -1))
-    
-    # Converter formato para frontend
-    monitoring_data = []
-    for item in soil_data:
-        # Calcular status baseado nos parâmetros
-        ph = item["soil_parameters"]["ph"]
-        status = "ideal" if 6.0 <= ph <= 7.0 else "atencao" if 5.5 <= ph <= 7.5 else "critico"
-        
-        monitoring_data.append({
-            "hora": item["timestamp"].strftime("%H:%M"),
-            "ph": float(item["soil_parameters"]["ph"]),
-            "umidade": float(item["soil_parameters"]["umidade"]),
-            "temp": float(item["soil_parameters"]["temperatura"]),
-            "salinidade": float(item["soil_parameters"]["salinidade"]),
-            "condutividade": float(item["soil_parameters"]["condutividade"]),
-            "drenagem": float(item["soil_parameters"].get("drenagem", 50)),
-            "aeracao": float(item["soil_parameters"].get("aeracao", 50)),
-            "compactacao": float(item["soil_parameters"].get("compactacao", 50)),
-            "atividadeMicrobiana": float(item["soil_parameters"].get("atividadeMicrobiana", 50)),
-            "n": float(item["nutrients"]["nitrogenio"]),
-            "p": float(item["nutrients"]["fosforo"]),
-            "k": float(item["nutrients"]["potassio"]),
-            "status": status
-        })
+    if period in soil_rollups.ROLLUP_PERIODS:
+        # Janelas longas: lidas dos rollups (O(buckets) em vez de O(leituras))
+        granularity = soil_rollups.ROLLUP_PERIODS[period]
+        monitoring_data = await soil_rollups.monitoring_rows(unity_id, granularity, time_limit, max_points)
+    elif max_points:
+        # Downsampling no servidor: min/média/max por bucket + pior status
+        monitoring_data = await soil_monitoring.downsample(unity_id, time_limit, now, max_points)
+    else:
+        # Buscar dados filtrados por timestamp real e converter para o frontend
+        soil_data = await soil_store.find_history(unity_id, since=time_limit)
+        monitoring_data = [soil_monitoring.reading_to_row(item) for item in soil_data]
     
     return {
         "status": "success",
@@ -303,25 +541,60 @@ def get_monitoring_data(unity_id: str, period: str = "24h"):
             "to": now.isoformat(),
             "total_found": len(monitoring_data)
         },
+        "max_points": max_points,
         "data": monitoring_data
     }
 
+@app.get("/unity/stream/{unity_id}")
+async def stream_soil(unity_id: str, request: Request):
+    """
+    Server-Sent Events com as leituras novas do jogador (linha do monitoramento + status).
+    Substitui o polling: o custo passa a ser proporcional às gravações.
+    """
+    if not await unity_profiles.find_one({"_id": unity_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Unity ID não encontrado")
+
+    queue = soil_events.subscribe(unity_id)
+
+    async def event_stream():
+        try:
+            yield f"event: ready\ndata: {json.dumps({'unity_id': unity_id})}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SOIL_STREAM_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentário SSE: mantém a conexão viva em proxies
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            soil_events.unsubscribe(unity_id, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.get("/unity/stream-stats")
+async def stream_stats():
+    return {"status": "success", "change_streams": change_stream_task is not None, **soil_events.stats()}
+
 @app.get("/unity/analise-ia/{unity_id}")
-def analise_ia(unity_id: str):
-    profile = unity_profiles.find_one({"_id": unity_id})
+async def analise_ia(unity_id: str):
+    profile = await unity_profiles.find_one({"_id": unity_id})
     if not profile:
         raise HTTPException(status_code=404, detail="Unity ID não encontrado")
     
     # Buscar dados de solo mais recentes
-    latest_soil = unity_soil_data.find_one(
-        {"unity_id": unity_id},
-        sort=[("timestamp", -1)]
-    )
+    latest_soil = await soil_store.find_latest(unity_id)
     
     # Buscar histórico para análise de tendências
-    soil_history = list(unity_soil_data.find(
-        {"unity_id": unity_id}
-    ).sort("timestamp", -1).limit(10))
+    soil_history = await soil_store.find_history(unity_id, limit=10)
+    # Tendência pelos rollups horários; sem buckets suficientes, usa as leituras
+    hourly_rollups = await soil_rollups.find_rollups(unity_id, "hour", limit=3)
+    tendencia = analyze_trend_from_rollups(hourly_rollups) if len(hourly_rollups) >= 3 else analyze_trend(soil_history)
     
     # Análise completa
     diagnostico = analyze_soil_complete(latest_soil, soil_history, profile)
@@ -334,7 +607,7 @@ def analise_ia(unity_id: str):
         "resumo": {
             "parametros_ideais": count_ideal_parameters(diagnostico["parametros"]),
             "total_parametros": len(diagnostico["parametros"]),
-            "tendencia_geral": analyze_trend(soil_history),
+            "tendencia_geral": tendencia,
             "nivel_sustentabilidade": calculate_sustainability(latest_soil, profile)
         }
     }
@@ -344,90 +617,153 @@ class ChatRequest(BaseModel):
     message: str
     history: Optional[list] = []
     coordinates: Optional[Dict[str, float]] = None
+    # Com conversation_id o histórico fica no servidor (conversations.py)
+    conversation_id: Optional[str] = None
 
 class TitleRequest(BaseModel):
     message: str
 
 @app.post("/api/chat/{unity_id}")
-def chat(unity_id: str, request: ChatRequest):
+async def chat(unity_id: str, request: ChatRequest, http_request: Request):
     user_message = request.message
     
-    def stream_generation():
+    async def stream_generation():
         try:
             print("\n\n--- ROTA /api/chat ACIONADA ---")
             print(f"-> Pergunta Recebida: '{user_message}'")
             
-            # ETAPA 1: RECOLHA DE CONTEXTO
-            yield f'data: {json.dumps({"type": "status", "message": "Recolhendo dados..."})}\n\n'
-            
-            print("--> A recolher contexto do MongoDB...")
-            profile = unity_profiles.find_one({"_id": unity_id})
-            latest_soil = unity_soil_data.find_one({"unity_id": unity_id}, sort=[("timestamp", -1)])
-            
-            player_context = ""
-            if profile:
-                player_context += f"AGRICULTOR: {profile.get('dados_pessoais', {}).get('nome', 'N/A')}\n"
-                player_context += f"PROPRIEDADE: {profile.get('propriedade', {}).get('nome', 'N/A')}\n"
-                player_context += f"ÁREA: {profile.get('propriedade', {}).get('area_hectares', 0)} hectares\n"
-                player_context += f"CULTIVO: {profile.get('propriedade', {}).get('cultivo_principal', 'N/A')}\n\n"
+            # Admissão: com a fila da IA cheia, recusa antes de recolher contexto
+            if ai_connector.scheduler.is_full():
+                print("-> Fila da IA cheia, pedido recusado")
+                yield f'data: {json.dumps({"type": "busy", "message": "Estou atendendo muitas perguntas agora. Tente novamente em alguns segundos.", "retry_after": LLM_RETRY_AFTER})}\n\n'
+                return
             
-            if latest_soil:
-                player_context += f"DADOS DO SOLO (mais recente):\n"
-                player_context += f"- pH: {latest_soil.get('soil_parameters', {}).get('ph', 'N/A')}\n"
-                player_context += f"- Umidade: {latest_soil.get('soil_parameters', {}).get('umidade', 'N/A')}%\n"
-                player_context += f"- Temperatura: {latest_soil.get('soil_parameters', {}).get('temperatura', 'N/A')}°C\n"
-                player_context += f"- NPK: N={latest_soil.get('nutrients', {}).get('nitrogenio', 'N/A')}, "
-                player_context += f"P={latest_soil.get('nutrients', {}).get('fosforo', 'N/A')}, "
-                player_context += f"K={latest_soil.get('nutrients', {}).get('potassio', 'N/A')}\n"
-                player_context += f"- Cultivo atual: {latest_soil.get('cultivo_atual', 'N/A')}\n"
+            # Histórico: estado do servidor (resumo + últimas mensagens) ou o enviado pelo cliente
+            history = request.history or []
+            if request.conversation_id:
+                conversation = await conversations.load(unity_id, request.conversation_id)
+                if not conversation and history:
+                    # Conversa nova no servidor: o histórico que o cliente já tinha vira o início dela
+                    conversation = await conversations.create(unity_id, request.conversation_id, history)
+                if conversation:
+                    history = conversations.prompt_history(conversation)
             
-            if not player_context:
-                player_context = "Nenhum dado disponível para este agricultor."
+            # Pergunta repetida (sem histórico): responde do cache sem chamar o Ollama
+            question_vector = None
+            if chat_cache and tool.query_encoder is not None and not history:
+                question_vector = await asyncio.to_thread(chat_cache.embed, user_message)
+                cached = chat_cache.lookup(unity_id, question_vector)
+                if cached:
+                    print("-> Resposta servida do cache semântico")
+                    yield f'data: {json.dumps({"type": "chunk", "message": cached, "cached": True})}\n\n'
+                    if request.conversation_id:
+                        await conversations.append_exchange(unity_id, request.conversation_id, user_message, cached)
+                        yield f'data: {json.dumps({"type": "saved", "conversation_id": request.conversation_id})}\n\n'
+                    return
             
-            print(f"--> Contexto MongoDB: {player_context[:150]}...")
-
-            print("--> A recolher contexto da base local (RAG)...")
-            local_context = tool.local_database_search(user_message)
-            print(f"--> Contexto RAG: {local_context[:100]}...")
+            # ETAPA 1: RECOLHA DE CONTEXTO
+            yield f'data: {json.dumps({"type": "status", "message": "Recolhendo dados..."})}\n\n'
             
-            print("--> A recolher contexto da Web...")
-            web_context = tool.focused_web_search(user_message)
-            print(f"--> Contexto Web: {web_context[:100]}...")
-
-            weather_context = ""
+            # Todas as fontes em paralelo, cada uma com seu prazo (CHAT_CONTEXT_DEADLINES)
+            # Perfil + última leitura: uma consulta só, usada pelo contexto e pelo filtro de cultivo do RAG
+            player = asyncio.ensure_future(chat_context.load_player(unity_id))
+            sources = {
+                "mongo": chat_context.player_context(player),
+                "rag": chat_context.local_knowledge(player, user_message),
+                "web": asyncio.to_thread(tool.focused_web_search, user_message),
+            }
             weather_keywords = ["clima", "tempo", "chuva", "geada", "temperatura", "previsão"]
             if request.coordinates and any(keyword in user_message.lower() for keyword in weather_keywords):
-                print("--> A recolher contexto de Clima (INMET)...")
-                weather_context = tool.get_inmet_forecast(lat=request.coordinates['latitude'], lon=request.coordinates['longitude'])
-                print(f"--> Contexto Clima: {weather_context[:100]}...")
-                
-            long_term_memory = tool.recall_memories()
+                sources["clima"] = asyncio.to_thread(tool.get_inmet_forecast, lat=request.coordinates['latitude'], lon=request.coordinates['longitude'])
+
+            context = {}
+            async for name, result, outcome, elapsed in chat_context.gather_context(sources):
+                label = CHAT_CONTEXT_LABELS.get(name, name)
+                if outcome == "ok":
+                    context[name] = result
+                    print(f"--> Contexto {name} ({elapsed:.2f}s): {str(result)[:100]}...")
+                    status = f"{label}: pronto"
+                else:
+                    print(f"--> Contexto {name} descartado ({outcome} após {elapsed:.2f}s)")
+                    status = f"{label}: indisponível, seguindo sem"
+                yield f'data: {json.dumps({"type": "status", "message": status, "source": name, "outcome": outcome})}\n\n'
+
+            player_context = context.get("mongo", chat_context.NO_PLAYER_DATA)
+            local_context = context.get("rag", "")
+            web_context = context.get("web", "")
+            weather_context = context.get("clima", "")
 
             # ETAPA 2: MONTAGEM DO PROMPT
             print("-> A montar o prompt mestre...")
-            final_prompt = prompts.MASTER_PROMPT.format(
-                player_context=player_context, 
+            final_prompt, prompt_report = prompt_builder.build_master_prompt(
+                user_message,
+                player_context=player_context,
                 local_context=local_context,
-                web_context=web_context, 
+                web_context=web_context,
                 weather_context=weather_context,
-                history="\n".join(request.history), 
-                user_message=user_message
+                history=history
             )
+            print(f"-> Prompt: ~{prompt_report['total']} tokens (orçamento {prompt_report['budget']}) {prompt_report}")
+            yield f'data: {json.dumps({"type": "prompt_info", "tokens": prompt_report["total"], "sections": prompt_report})}\n\n'
+
+            # ETAPA 3: FILA DA IA
+            try:
+                ticket = ai_connector.scheduler.enter(PRIORITY_CHAT)
+            except LLMQueueFullError:
+                yield f'data: {json.dumps({"type": "busy", "message": "Estou atendendo muitas perguntas agora. Tente novamente em alguns segundos.", "retry_after": LLM_RETRY_AFTER})}\n\n'
+                return
+
+            response = None
+            answer = []
+            done = disconnected = False
+            try:
+                async for position in ai_connector.scheduler.wait_turn(ticket):
+                    yield f'data: {json.dumps({"type": "status", "message": f"Aguardando a IA (posição {position} na fila)...", "queue_position": position})}\n\n'
 
-            # ETAPA 3: EXECUÇÃO E STREAMING
-            print("-> A enviar prompt para a IA via conector...")
-            response = ai_connector.get_ollama_response(final_prompt, stream=True)
+                # ETAPA 4: EXECUÇÃO E STREAMING
+                print("-> A enviar prompt para a IA via conector...")
+                response = await asyncio.to_thread(ai_connector.get_ollama_response, final_prompt, stream=True)
+                
+                print("-> A receber streaming da IA e a enviar para o frontend...")
+                async for chunk in iterate_in_threadpool(response.iter_lines()):
+                    # Aba fechada: para de consumir e derruba a geração no Ollama
+                    if await http_request.is_disconnected():
+                        disconnected = True
+                        break
+                    if chunk:
+                        try:
+                            json_chunk = json.loads(chunk)
+                            message = json_chunk.get("message", {}).get("content", "")
+                            if message:
+                                answer.append(message)
+                                yield f'data: {json.dumps({"type": "chunk", "message": message})}\n\n'
+                            if json_chunk.get("done"):
+                                done = True
+                                print(f"-> Tokens do prompt: estimado {prompt_report['total']}, Ollama {json_chunk.get('prompt_eval_count')}")
+                                ai_connector.generation_stats.record_completed(json_chunk.get("eval_count", len(answer)))
+                        except json.JSONDecodeError:
+                            continue
+            except (asyncio.CancelledError, GeneratorExit):
+                # O servidor cancela o gerador quando o cliente desconecta
+                disconnected = True
+                raise
+            finally:
+                if response is not None:
+                    # Fechar a conexão faz o Ollama abortar a geração
+                    response.close()
+                    if disconnected and not done:
+                        saved = ai_connector.generation_stats.record_cancelled(len(answer))
+                        print(f"-> Cliente desconectou: geração cancelada após {len(answer)} tokens (~{saved} economizados)")
+                # Libera o modelo para o próximo da fila
+                ai_connector.scheduler.release(ticket)
             
-            print("-> A receber streaming da IA e a enviar para o frontend...")
-            for chunk in response.iter_lines():
-                if chunk:
-                    try:
-                        json_chunk = json.loads(chunk)
-                        message = json_chunk.get("message", {}).get("content", "")
-                        if message:
-                            yield f'data: {json.dumps({"type": "chunk", "message": message})}\n\n'
-                    except json.JSONDecodeError:
-                        continue
+            if question_vector is not None and done and answer:
+                chat_cache.add(unity_id, question_vector, "".join(answer))
+            if request.conversation_id and done and answer:
+                # Resumo das mensagens antigas é agendado em segundo plano
+                await conversations.append_exchange(unity_id, request.conversation_id, user_message, "".join(answer))
+                # O cliente para de enviar o histórico só depois desta confirmação
+                yield f'data: {json.dumps({"type": "saved", "conversation_id": request.conversation_id})}\n\n'
             
             print("--- FIM DO FLUXO DE CHAT ---")
         
@@ -436,15 +772,60 @@ def chat(unity_id: str, request: ChatRequest):
             print(f"!!! TIPO DE ERRO: {type(e).__name__}")
             print(f"!!! MENSAGEM: {e}")
             print(f"!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-            yield f'data: {json.dumps({"type": "chunk", "message": "Ocorreu um erro crítico no meu processamento. Verifique o terminal do servidor."})}\n\n'
+            yield f'data: {json.dumps({"type": "error", "message": "Ocorreu um erro crítico no meu processamento. Verifique o terminal do servidor."})}\n\n'
 
     return StreamingResponse(stream_generation(), media_type='text/event-stream')
 
+@app.delete("/api/chat/{unity_id}/conversations/{conversation_id}")
+async def delete_conversation(unity_id: str, conversation_id: str):
+    deleted = await conversations.delete(unity_id, conversation_id)
+    return {"status": "success", "deleted": deleted}
+
+@app.get("/api/ready")
+async def readiness():
+    """
+    200 quando modelo de embeddings e índice terminaram de carregar; 503 enquanto aquecem.
+    Se a carga falhou, 200 com status "degraded": o chat segue sem a base local.
+    """
+    warmup = tool.warmup_status()
+    if not warmup["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "warmup": warmup})
+    if warmup["stage"] == "failed":
+        return {"status": "degraded", "warmup": warmup}
+    return {"status": "ready", "warmup": warmup}
+
+@app.post("/api/rag/reindex")
+async def rag_reindex():
+    """Re-embeda só os arquivos novos/alterados e remove os apagados"""
+    if not tool.rag_ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up", "warmup": tool.warmup_status()})
+    result = await asyncio.to_thread(tool.reindex_local_database)
+    return {"status": "success", **result}
+
+@app.get("/api/rag/status")
+async def rag_status():
+    return {
+        "status": "success",
+        "index": tool.knowledge.stats() if tool.knowledge else None,
+        "query_encoder": tool.query_encoder.stats() if tool.query_encoder else None
+    }
+
+@app.get("/api/ollama/status")
+async def ollama_status():
+    return {
+        "status": "success",
+        "ollama": ai_connector.health_monitor.status(),
+        "scheduler": ai_connector.scheduler.stats(),
+        "generations": ai_connector.generation_stats.stats(),
+        "cache": {"tips": tips_cache.stats(), "chat": chat_cache.stats() if chat_cache else None}
+    }
+
 @app.post("/api/generate_title")
-def generate_title(request: TitleRequest):
+async def generate_title(request: TitleRequest):
     try:
         prompt = f"Gere um título de 2-3 palavras para: '{request.message[:50]}'"
-        response = ai_connector.get_ollama_response(prompt, stream=False)
+        async with ai_connector.scheduler.slot(PRIORITY_TITLE):
+            response = await asyncio.to_thread(ai_connector.get_ollama_response, prompt, stream=False)
         data = response.json()
         title = data.get('message', {}).get('content', 'Nova Conversa')
         
@@ -462,12 +843,18 @@ class SoilTipRequest(BaseModel):
     cultivo: str
 
 @app.post("/api/soil-tips/{unity_id}")
-def get_soil_tips(unity_id: str, request: SoilTipRequest):
+async def get_soil_tips(unity_id: str, request: SoilTipRequest):
     try:
-        profile = unity_profiles.find_one({"_id": unity_id})
+        profile = await unity_profiles.find_one({"_id": unity_id})
         cultivo = request.cultivo or profile.get('propriedade', {}).get('cultivo_principal', 'cultivo geral')
         
-        prompt = f"""Você é um especialista em agricultura. Dê 3 dicas práticas de como melhorar o {request.parametro} do solo para cultivo de {cultivo}. Valor atual: {request.valor}.
+        # Mesma combinação parâmetro/cultivo/faixa já respondida: não chama o Ollama
+        cache_key = tips_cache_key(request.parametro, cultivo, request.valor)
+        cached = tips_cache.get(cache_key)
+        if cached:
+            return {"tips": cached, "cached": True}
+        
+        prompt = f"""Você é um especialista em agricultura. Dê 3 dicas práticas de como melhorar o {request.parametro} do solo para cultivo de {cultivo}. {tips_value_context(request.parametro, request.valor)}
 
 Formate assim:
 1. [Dica 1]
@@ -476,16 +863,24 @@ Formate assim:
 
 Seja direto e prático. Máximo 150 palavras."""
         
-        response = ai_connector.get_ollama_response(prompt, stream=False)
+        async with ai_connector.scheduler.slot(PRIORITY_TIPS):
+            response = await asyncio.to_thread(ai_connector.get_ollama_response, prompt, stream=False)
         data = response.json()
-        tips = data.get('message', {}).get('content', 'Dicas não disponíveis')
+        tips = data.get('message', {}).get('content')
+        if not tips:
+            return {"tips": "Dicas não disponíveis"}
         
+        tips_cache.set(cache_key, tips)
         return {"tips": tips}
+    except LLMQueueFullError:
+        return JSONResponse(status_code=503, headers={"Retry-After": str(LLM_RETRY_AFTER)},
+                            content={"tips": "Muitas solicitações no momento. Tente novamente em alguns segundos."})
     except Exception as e:
         return {"tips": "Erro ao gerar dicas. Tente novamente."}
 
 @app.get("/unity/recreate-test-data")
 def recreate_test_data():
+    # Rota síncrona de propósito: usa o shim síncrono de database.py
     from criar_dados_teste import criar_dados_teste
     try:
         criar_dados_teste()
@@ -493,6 +888,26 @@ def recreate_test_data():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def configured_workers() -> int:
+    """API_WORKERS ou WEB_CONCURRENCY (definido por quem inicia uvicorn/gunicorn), o maior"""
+    return max(API_WORKERS, WEB_CONCURRENCY)
+
+def multi_worker_problems(workers: int = API_WORKERS) -> List[str]:
+    """
+    Estado que é por processo e quebra com mais de um worker: o pub/sub do SSE
+    (só vê as leituras do próprio worker sem change streams) e o agendador da IA
+    (cada worker libera LLM_MAX_IN_FLIGHT gerações).
+    """
+    problems = []
+    if not SOIL_CHANGE_STREAMS:
+        problems.append("SOIL_CHANGE_STREAMS=true é obrigatório: sem ele o /unity/stream de um worker não vê leituras gravadas pelos outros")
+    elif soil_store.TIMESERIES:
+        problems.append("SOIL_STORAGE_MODE=timeseries não tem change streams: o /unity/stream ficaria restrito a cada worker")
+    if workers * LLM_MAX_IN_FLIGHT > OLLAMA_NUM_PARALLEL:
+        problems.append(f"workers ({workers}) x LLM_MAX_IN_FLIGHT ({LLM_MAX_IN_FLIGHT}) excede OLLAMA_NUM_PARALLEL "
+                        f"({OLLAMA_NUM_PARALLEL}): aumente o paralelismo do Ollama (e em ollama_config.py) ou use menos workers")
+    return problems
+
 if __name__ == "__main__":
     print("EKKO API - MongoDB Atlas")
     print(f"Banco: {DB_NAME}")
@@ -501,4 +916,14 @@ if __name__ == "__main__":
     print("Status: http://127.0.0.1:8002/unity/status")
     print("=" * 50)
     
-    uvicorn.run(app, host=API_HOST, port=API_PORT, reload=API_DEBUG)
\ No newline at end of file
+    if API_WORKERS > 1:
+        problems = multi_worker_problems()
+        if problems:
+            print(f"!!! API_WORKERS={API_WORKERS} recusado:")
+            for problem in problems:
+                print(f"    - {problem}")
+            raise SystemExit(1)
+        # Vários workers exigem o app por caminho de importação (sem reload)
+        uvicorn.run("main:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
+    else:
+        uvicorn.run(app, host=API_HOST, port=API_PORT, reload=API_DEBUG)
\ No newline at end of file
@@ -13,6 +13,58 @@ MAX_RETRIES = 3
 RETRY_BACKOFF_FACTOR = 1
 RETRY_DELAY_BASE = 2
 
+# Conexões HTTP reaproveitadas (keep-alive) com o Ollama
+OLLAMA_POOL_SIZE = 10
+
+# Monitor de saúde em segundo plano (segundos)
+HEALTH_CHECK_INTERVAL = 15
+HEALTH_CHECK_TIMEOUT = 3
+
+# Agendador de gerações (ai_connector.scheduler)
+LLM_MAX_IN_FLIGHT = 1   # gerações simultâneas enviadas ao Ollama
+LLM_MAX_QUEUE = 16      # acima disso novas requisições são recusadas na hora
+LLM_RETRY_AFTER = 10    # segundos sugeridos ao cliente recusado
+# Mantenha igual ao OLLAMA_NUM_PARALLEL do servidor Ollama. Com API_WORKERS > 1
+# cada worker tem o próprio agendador: a API só sobe com vários workers se
+# API_WORKERS * LLM_MAX_IN_FLIGHT couber nesse limite
+OLLAMA_NUM_PARALLEL = 1
+
+# Prioridades (menor = atendido primeiro)
+PRIORITY_CHAT = 0
+PRIORITY_TIPS = 1
+PRIORITY_TITLE = 2
+
+# Cache de respostas (response_cache.py)
+TIPS_CACHE_SIZE = 512
+TIPS_CACHE_TTL = 24 * 3600      # segundos
+# Cache semântico do chat (por jogador, só perguntas sem histórico)
+CHAT_SEMANTIC_CACHE = False
+CHAT_CACHE_SIZE = 256
+CHAT_CACHE_TTL = 600            # segundos (a resposta usa o solo atual)
+CHAT_CACHE_THRESHOLD = 0.92     # similaridade de cosseno mínima
+
+# Orçamento de tokens do prompt do chat (prompt_builder.py)
+# O contexto padrão do Ollama é 2048 tokens, dos quais num_predict (500) ficam para a resposta
+PROMPT_TOKEN_BUDGET = 1500
+CHARS_PER_TOKEN = 3.5           # estimativa para português (sem o tokenizer do modelo)
+PROMPT_BUDGETS = {
+    "player_context": 200,
+    "local_context": 400,
+    "web_context": 200,
+    "weather_context": 150,
+    "history": 300,
+    "history_message": 80,      # cada mensagem do histórico
+    "user_message": 250
+}
+# Quem recebe primeiro a cota não usada pelas outras seções
+PROMPT_BUDGET_PRIORITY = ["local_context", "history", "web_context", "player_context"]
+
+# Conversas no servidor (conversations.py)
+KEEP_VERBATIM_MESSAGES = 6      # últimas mensagens mantidas na íntegra
+SUMMARY_BATCH_MESSAGES = 6      # resumir quando houver este tanto além das mantidas
+SUMMARY_MAX_WORDS = 120
+PRIORITY_SUMMARY = 3            # abaixo dos títulos: roda quando a IA está livre
+
 # Parâmetros do modelo
 MODEL_OPTIONS = {
     "num_predict": 500,
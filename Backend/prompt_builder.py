@@ -0,0 +1,159 @@
+"""
+Montagem do Prompt - EKKO
+Preenche o MASTER_PROMPT respeitando um orçamento de tokens por seção
+
+Cada fonte (fazenda, base local, web, clima, histórico) tem uma cota em
+PROMPT_BUDGETS. Trechos da base local e da web são ranqueados pela
+sobreposição de termos com a pergunta e cortados na cota; o histórico guarda
+as mensagens mais recentes. A cota que uma seção não usa vai para as seções
+que foram cortadas, na ordem de PROMPT_BUDGET_PRIORITY.
+
+Sem o tokenizer do llama3.2 aqui, os tokens são estimados por caracteres
+(CHARS_PER_TOKEN); a contagem real vem do Ollama em prompt_eval_count.
+"""
+
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+import prompts
+from ollama_config import CHARS_PER_TOKEN, PROMPT_TOKEN_BUDGET, PROMPT_BUDGETS, PROMPT_BUDGET_PRIORITY
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Linha de OUTRAS FONTES sem conteúdo (ex.: "- Web: ")
+_EMPTY_SOURCE = re.compile(r"^- [^:\n]+:\s*$")
+# Palavras frequentes que não ajudam a ranquear trechos
+_STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "é", "em", "no", "na", "nos", "nas",
+    "um", "uma", "para", "por", "com", "que", "qual", "quais", "como", "meu", "minha", "se", "ao",
+    "mais", "sobre", "ser", "está", "the", "of"
+}
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Corta no limite de palavras mais próximo que cabe na cota"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    limit = max(int(tokens * CHARS_PER_TOKEN) - 3, 0)
+    cut = text[:limit].rsplit(" ", 1)[0] if " " in text[:limit] else text[:limit]
+    return cut + "..." if cut else ""
+
+def terms(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS and len(word) > 2}
+
+def rank_passages(passages: List[str], query: str) -> List[str]:
+    """Ordena por termos da pergunta presentes no trecho (estável em empates)"""
+    query_terms = terms(query)
+    scored = [(len(query_terms & terms(passage)), -i, passage) for i, passage in enumerate(passages)]
+    return [passage for _, _, passage in sorted(scored, reverse=True)]
+
+def fit_passages(passages: List[str], query: str, tokens: int, separator: str = "\n") -> str:
+    """Melhores trechos que cabem na cota; o primeiro é truncado se sozinho não couber"""
+    chosen, used = [], 0
+    sep_tokens = estimate_tokens(separator)
+    for passage in rank_passages([p for p in passages if p.strip()], query):
+        cost = estimate_tokens(passage) + (sep_tokens if chosen else 0)
+        if used + cost <= tokens:
+            chosen.append(passage)
+            used += cost
+        elif not chosen:
+            chosen.append(truncate_to_tokens(passage, tokens))
+            break
+    return separator.join(chosen)
+
+def split_local_context(local_context: str) -> List[str]:
+    """Resultado de tool.local_database_search -> parágrafos dos documentos"""
+    body = local_context.split(":\n", 1)[1] if local_context.startswith("Resultados") else local_context
+    passages = []
+    for document in body.split("\n---\n"):
+        passages.extend(paragraph.strip() for paragraph in re.split(r"\n\s*\n", document))
+    return passages
+
+def split_list(context: str) -> Tuple[str, List[str]]:
+    """Cabeçalho + itens '- ...' (web, memórias)"""
+    lines = context.splitlines()
+    header = [line for line in lines if not line.startswith("- ")][:1]
+    items = [line for line in lines if line.startswith("- ")]
+    return (header[0] if header else ""), items
+
+def fit_list(context: str, query: str, tokens: int) -> str:
+    header, items = split_list(context)
+    if not items:
+        return truncate_to_tokens(context, tokens)
+    body = fit_passages(items, query, max(tokens - estimate_tokens(header), 0))
+    return f"{header}\n{body}" if header and body else body
+
+def fit_history(history: List[str], tokens: int, message_tokens: int) -> str:
+    """Mensagens mais recentes primeiro; cada uma limitada a message_tokens"""
+    kept, used = [], 0
+    for message in reversed(history or []):
+        message = truncate_to_tokens(" ".join(str(message).split()), message_tokens)
+        cost = estimate_tokens(message) + 1
+        if used + cost > tokens:
+            break
+        kept.append(message)
+        used += cost
+    omitted = len(history or []) - len(kept)
+    lines = list(reversed(kept))
+    if omitted:
+        lines.insert(0, f"({omitted} mensagens anteriores omitidas)")
+    return "\n".join(lines)
+
+def _fit(section: str, value, query: str, tokens: int) -> str:
+    if section == "local_context":
+        return fit_passages(split_local_context(value), query, tokens, separator="\n\n")
+    if section == "web_context":
+        return fit_list(value, query, tokens)
+    if section == "history":
+        return fit_history(value, tokens, PROMPT_BUDGETS["history_message"])
+    return truncate_to_tokens(value, tokens)
+
+def _needed(section: str, value) -> int:
+    if section == "history":
+        return sum(estimate_tokens(str(message)) + 1 for message in value or [])
+    return estimate_tokens(value)
+
+def build_master_prompt(user_message: str, player_context: str = "", local_context: str = "",
+                        web_context: str = "", weather_context: str = "",
+                        history: Optional[List[str]] = None,
+                        total_budget: int = PROMPT_TOKEN_BUDGET) -> Tuple[str, Dict[str, int]]:
+    """
+    Retorna (prompt, relatório) com os tokens estimados por seção e o total.
+    A pergunta nunca é descartada, só truncada em PROMPT_BUDGETS["user_message"].
+    """
+    values = {
+        "player_context": player_context or "",
+        "local_context": local_context or "",
+        "web_context": web_context or "",
+        "weather_context": weather_context or "",
+        "history": history or [],
+    }
+    user_message = truncate_to_tokens(user_message, PROMPT_BUDGETS["user_message"])
+    template_tokens = estimate_tokens(prompts.MASTER_PROMPT.format(
+        user_message=user_message, history="", **{k: "" for k in values if k != "history"}))
+
+    # Cotas: cada seção usa o que precisa até a sua cota; a sobra do total
+    # vai para as seções cortadas, na ordem de prioridade
+    available = max(total_budget - template_tokens, 0)
+    needed = {section: _needed(section, value) for section, value in values.items()}
+    quota = {section: min(needed[section], PROMPT_BUDGETS[section]) for section in values}
+    spare = max(available - sum(quota.values()), 0)
+    for section in PROMPT_BUDGET_PRIORITY:
+        extra = min(needed[section] - quota[section], spare)
+        if extra > 0:
+            quota[section] += extra
+            spare -= extra
+
+    fitted = {section: _fit(section, value, user_message, quota[section]) if value else ""
+              for section, value in values.items()}
+    prompt = prompts.MASTER_PROMPT.format(user_message=user_message, **fitted)
+    # Fonte vazia não vira linha "- Web: " sem conteúdo no prompt
+    prompt = "\n".join(line for line in prompt.split("\n") if not _EMPTY_SOURCE.match(line))
+
+    report = {section: estimate_tokens(text) for section, text in fitted.items()}
+    report["user_message"] = estimate_tokens(user_message)
+    report["total"] = estimate_tokens(prompt)
+    report["budget"] = total_budget
+    return prompt, report
@@ -0,0 +1,93 @@
+"""
+Embeddings de Perguntas - EKKO
+Cache LRU + micro-lotes para os encodes do RAG e do cache semântico
+
+- Pergunta normalizada (minúsculas, espaços) já vista: embedding sai do cache
+- Perguntas que chegam juntas (dentro de QUERY_BATCH_WINDOW_MS) viram uma
+  única chamada a encode; em CPU o custo fixo de cada chamada ao modelo é
+  dividido entre os usuários que estão conversando ao mesmo tempo
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from response_cache import ResponseCache, normalize_text
+
+QUERY_CACHE_SIZE = 1024
+# Quanto o primeiro pedido de um lote espera por outros
+QUERY_BATCH_WINDOW_MS = 5
+QUERY_BATCH_MAX = 32
+
+class QueryEncoder:
+    """
+    encode(texto) é chamado a partir de threads (asyncio.to_thread); quem
+    perde no cache espera o resultado do lote numa Future.
+    """
+
+    def __init__(self, encode_batch: Callable[[List[str]], Any], cache_size: int = QUERY_CACHE_SIZE,
+                 window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch: int = QUERY_BATCH_MAX):
+        self.encode_batch = encode_batch
+        # Embedding não expira: só muda se o modelo mudar (e aí o processo reinicia)
+        self.cache = ResponseCache(cache_size, float("inf"))
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, Future]] = []
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self.batches = 0
+        self.encoded = 0
+
+    def encode(self, text: str) -> np.ndarray:
+        key = normalize_text(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+        future = Future()
+        with self._cond:
+            self._pending.append((key, future))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return future.result()
+
+    def _next_batch(self) -> List[Tuple[str, Future]]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Primeiro pedido chegou: espera a janela (ou o lote encher)
+            if len(self._pending) < self.max_batch:
+                self._cond.wait_for(lambda: len(self._pending) >= self.max_batch, timeout=self.window)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Mesma pergunta duas vezes no lote: um encode só
+            texts = list(dict.fromkeys(key for key, _ in batch))
+            try:
+                vectors = np.asarray(self.encode_batch(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            by_text: Dict[str, np.ndarray] = dict(zip(texts, vectors))
+            for text, vector in by_text.items():
+                self.cache.set(text, vector)
+            for key, future in batch:
+                future.set_result(by_text[key])
+            self.batches += 1
+            self.encoded += len(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            # ttl infinito fica de fora: não é serializável em JSON
+            "cache": {key: value for key, value in self.cache.stats().items() if key != "ttl"},
+            "batches": self.batches,
+            "encoded": self.encoded,
+            "avg_batch": round(self.encoded / self.batches, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,152 @@
+"""
+Cache de Respostas da IA - EKKO
+Evita chamar o Ollama para perguntas que já foram respondidas
+
+- ResponseCache: chave exata, com TTL e despejo LRU (dicas de solo)
+- SemanticCache: perguntas livres do chat, por similaridade de embeddings
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from ai_analyzer import determine_status
+from constants import SOIL_RANGES
+
+class ResponseCache:
+    """Dicionário LRU com expiração; seguro para uso a partir de threads"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._items), "max_size": self.max_size, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+class SemanticCache:
+    """
+    Respostas indexadas pelo embedding da pergunta, dentro de um escopo
+    (ex.: unity_id). Um acerto exige similaridade de cosseno >= threshold.
+    Busca linear: o cache é pequeno e o custo dominante é o encode.
+    """
+
+    def __init__(self, encode: Callable[[str], Any], max_size: int, ttl: float, threshold: float):
+        self.encode = encode
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.encode(normalize_text(text)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, scope: str, vector: np.ndarray) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._entries = [entry for entry in self._entries if entry["expires"] >= now]
+            best, best_score = None, self.threshold
+            for entry in self._entries:
+                if entry["scope"] != scope:
+                    continue
+                score = float(np.dot(entry["vector"], vector))
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self.misses += 1
+                return None
+            best["used"] = now
+            self.hits += 1
+            return best["value"]
+
+    def add(self, scope: str, vector: np.ndarray, value: Any):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.append({"scope": scope, "vector": vector, "value": value,
+                                  "expires": now + self.ttl, "used": now})
+            if len(self._entries) > self.max_size:
+                # LRU: descarta a entrada usada há mais tempo
+                self._entries.remove(min(self._entries, key=lambda entry: entry["used"]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "max_size": self.max_size, "ttl": self.ttl,
+                "threshold": self.threshold, "hits": self.hits, "misses": self.misses}
+
+def normalize_text(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+# Nome exibido no dashboard (ex.: "pH do Solo") ou chave -> chave de SOIL_RANGES
+_PARAM_ALIASES = {normalize_text(key): key for key in SOIL_RANGES}
+_PARAM_ALIASES.update({normalize_text(ranges["name"]): key for key, ranges in SOIL_RANGES.items()})
+
+def normalize_param(parametro: str) -> Optional[str]:
+    return _PARAM_ALIASES.get(normalize_text(parametro))
+
+# Lado da faixa ideal; "atencao" abaixo e acima pedem dicas opostas
+SIDE_LOW, SIDE_OK, SIDE_HIGH = "abaixo", "ideal", "acima"
+_SIDE_TEXT = {SIDE_LOW: "abaixo da faixa ideal", SIDE_OK: "dentro da faixa ideal", SIDE_HIGH: "acima da faixa ideal"}
+
+def value_side(param: str, valor: float) -> str:
+    """Abaixo/dentro/acima da faixa, com os mesmos limites de determine_status"""
+    ranges = SOIL_RANGES[param]
+    # atividadeMicrobiana só tem mínimo em determine_status
+    if "min" in ranges and valor < ranges["min"]:
+        return SIDE_LOW
+    if param != "atividadeMicrobiana" and "max" in ranges and valor > ranges["max"]:
+        return SIDE_HIGH
+    return SIDE_OK
+
+def tips_cache_key(parametro: str, cultivo: str, valor: float) -> Tuple[str, ...]:
+    """
+    (parâmetro, cultivo, faixa de status, lado): valores na mesma faixa de
+    ai_analyzer.determine_status e do mesmo lado recebem as mesmas dicas.
+    """
+    param = normalize_param(parametro)
+    if param is None:
+        # Parâmetro fora de SOIL_RANGES: só reaproveita o mesmo valor
+        return normalize_text(parametro), normalize_text(cultivo), f"valor:{round(valor, 1)}"
+    return param, normalize_text(cultivo), determine_status(param, valor, SOIL_RANGES[param]), value_side(param, valor)
+
+def tips_value_context(parametro: str, valor: float) -> str:
+    """
+    Situação do valor para o prompt das dicas. Sem o valor exato quando a chave
+    é a faixa: a resposta em cache serve para todos os valores dela.
+    """
+    param = normalize_param(parametro)
+    if param is None:
+        return f"Valor atual: {valor}."
+    ranges = SOIL_RANGES[param]
+    limits = [f"{label} {ranges[bound]}{ranges['unit']}" for bound, label in (("min", "mínimo"), ("max", "máximo")) if bound in ranges]
+    status = determine_status(param, valor, ranges)
+    return f"Valor atual {_SIDE_TEXT[value_side(param, valor)]} ({', '.join(limits)}), status: {status}."
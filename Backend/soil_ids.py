@@ -0,0 +1,41 @@
+"""
+IDs de Leituras de Solo - EKKO
+IDs ordenáveis e sem colisão (estilo ObjectId/ULID)
+
+Leituras com chave de idempotência também usam new_soil_id: a chave fica no
+campo idempotency_key, com índice único por jogador (soil_store.py).
+"""
+
+import os
+import threading
+import time
+
+# Identificador aleatório do processo: evita colisão entre workers no mesmo ms
+_NODE = os.urandom(3).hex()
+_MAX_SEQ = 0xFFFF
+
+_lock = threading.Lock()
+_last_ms = 0
+_seq = 0
+
+def _next_tick():
+    """Retorna (ms, sequência) estritamente crescente dentro do processo"""
+    global _last_ms, _seq
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms > _last_ms:
+            _last_ms, _seq = now_ms, 0
+        else:
+            _seq += 1
+            if _seq > _MAX_SEQ:
+                # Sequência esgotada no mesmo ms: avança o relógio lógico
+                _last_ms, _seq = _last_ms + 1, 0
+        return _last_ms, _seq
+
+def new_soil_id(unity_id: str) -> str:
+    """
+    Gera `soil_{unity_id}_{ms:13}{seq:4}{node:6}`. Largura fixa, então a ordem
+    lexicográfica dos IDs de um jogador segue a ordem de criação.
+    """
+    ms, seq = _next_tick()
+    return f"soil_{unity_id}_{ms:013d}{seq:04x}{_NODE}"
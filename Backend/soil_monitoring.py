@@ -0,0 +1,104 @@
+"""
+Monitoramento de Solo - EKKO
+Conversão das leituras para o formato do monitoring.js e downsampling no servidor
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+import soil_store
+from constants import STATUS_IDEAL, STATUS_ATENCAO, STATUS_CRITICO
+
+# Chave no frontend -> (campo no documento, valor padrão se ausente)
+MONITORING_FIELDS = {
+    "ph": ("soil_parameters.ph", None),
+    "umidade": ("soil_parameters.umidade", None),
+    "temp": ("soil_parameters.temperatura", None),
+    "salinidade": ("soil_parameters.salinidade", None),
+    "condutividade": ("soil_parameters.condutividade", None),
+    "drenagem": ("soil_parameters.drenagem", 50),
+    "aeracao": ("soil_parameters.aeracao", 50),
+    "compactacao": ("soil_parameters.compactacao", 50),
+    "atividadeMicrobiana": ("soil_parameters.atividadeMicrobiana", 50),
+    "n": ("nutrients.nitrogenio", None),
+    "p": ("nutrients.fosforo", None),
+    "k": ("nutrients.potassio", None),
+}
+
+# Ordem de gravidade: o pior status do bucket é o de maior índice
+STATUS_ORDER = [STATUS_IDEAL, STATUS_ATENCAO, STATUS_CRITICO]
+
+# Limite de pontos aceitos em ?max_points=
+MAX_POINTS_LIMIT = 2000
+
+def ph_status(ph: float) -> str:
+    """Status da leitura usado no monitoramento (baseado no pH)"""
+    return STATUS_IDEAL if 6.0 <= ph <= 7.0 else STATUS_ATENCAO if 5.5 <= ph <= 7.5 else STATUS_CRITICO
+
+def get_path(doc: Dict[str, Any], path: str, default=None):
+    value = doc
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    return value
+
+def reading_to_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Leitura bruta -> linha do monitoramento"""
+    row = {"hora": item["timestamp"].strftime("%H:%M"), "inicio": item["timestamp"].isoformat()}
+    for key, (path, default) in MONITORING_FIELDS.items():
+        row[key] = float(get_path(item, path, default))
+    row["status"] = ph_status(item["soil_parameters"]["ph"])
+    return row
+
+def _severity_expr():
+    """Expressão de agregação equivalente a ph_status, como índice em STATUS_ORDER"""
+    ph = "$soil_parameters.ph"
+    return {"$switch": {
+        "branches": [
+            {"case": {"$and": [{"$gte": [ph, 6.0]}, {"$lte": [ph, 7.0]}]}, "then": 0},
+            {"case": {"$and": [{"$gte": [ph, 5.5]}, {"$lte": [ph, 7.5]}]}, "then": 1},
+        ],
+        "default": 2
+    }}
+
+def downsample_pipeline(unity_id: str, since: datetime, until: datetime, max_points: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Agrupa a janela em `max_points` buckets de largura fixa com $group
+    (sem ordenação em memória das leituras brutas) e ordena só os buckets.
+    """
+    bucket_ms = max(1, int((until - since).total_seconds() * 1000 / max_points))
+    group = {
+        # Índice do bucket, limitado ao último (leituras no instante `until`)
+        "_id": {"$min": [{"$floor": {"$divide": [{"$subtract": ["$timestamp", since]}, bucket_ms]}}, max_points - 1]},
+        "count": {"$sum": 1},
+        "severity": {"$max": _severity_expr()},
+    }
+    for key, (path, default) in MONITORING_FIELDS.items():
+        value = f"${path}" if default is None else {"$ifNull": [f"${path}", default]}
+        group[f"{key}_min"] = {"$min": value}
+        group[f"{key}_avg"] = {"$avg": value}
+        group[f"{key}_max"] = {"$max": value}
+    return [
+        {"$match": soil_store.soil_filter(unity_id, since=since)},
+        {"$group": group},
+        {"$sort": {"_id": -1}},
+    ], bucket_ms
+
+def bucket_to_row(bucket: Dict[str, Any], since: datetime, bucket_ms: int) -> Dict[str, Any]:
+    """Bucket agregado -> linha do monitoramento (média + min/max por parâmetro)"""
+    start = since + timedelta(milliseconds=int(bucket["_id"]) * bucket_ms)
+    row = {"hora": start.strftime("%H:%M"), "inicio": start.isoformat(), "leituras": bucket["count"]}
+    row["min"], row["max"] = {}, {}
+    for key in MONITORING_FIELDS:
+        row[key] = round(float(bucket[f"{key}_avg"]), 2)
+        row["min"][key] = float(bucket[f"{key}_min"])
+        row["max"][key] = float(bucket[f"{key}_max"])
+    # Pior status do bucket: alertas não são suavizados pela média
+    row["status"] = STATUS_ORDER[int(bucket["severity"])]
+    return row
+
+async def downsample(unity_id: str, since: datetime, until: datetime, max_points: int) -> List[Dict[str, Any]]:
+    pipeline, bucket_ms = downsample_pipeline(unity_id, since, until, max_points)
+    buckets = await soil_store.soil_collection().aggregate(pipeline).to_list(length=None)
+    return [bucket_to_row(bucket, since, bucket_ms) for bucket in buckets]
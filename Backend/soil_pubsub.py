@@ -0,0 +1,88 @@
+"""
+Pub/Sub de Leituras de Solo - EKKO
+Entrega as leituras gravadas aos assinantes de cada unity_id (SSE em /unity/stream)
+
+Em processo: cada assinante tem uma asyncio.Queue limitada. Um assinante lento
+perde os eventos mais antigos em vez de segurar a ingestão. Opcionalmente
+(SOIL_CHANGE_STREAMS=true) os eventos vêm de um change stream do MongoDB,
+o que cobre leituras gravadas por outros processos da API.
+"""
+
+import asyncio
+from typing import Any, Dict, Set
+
+import soil_store
+from soil_monitoring import reading_to_row
+
+class SoilPubSub:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, unity_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(unity_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, unity_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(unity_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[unity_id]
+
+    def has_subscribers(self, unity_id: str) -> bool:
+        return unity_id in self._subscribers
+
+    def publish(self, unity_id: str, event: Dict[str, Any]):
+        """Entrega sem bloquear; fila cheia descarta o evento mais antigo"""
+        for queue in self._subscribers.get(unity_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+        self.published += 1
+
+    def publish_reading(self, doc: Dict[str, Any]):
+        """Leitura gravada (formato clássico) -> evento com a linha do monitoramento"""
+        unity_id = doc["unity_id"]
+        if not self.has_subscribers(unity_id):
+            return
+        self.publish(unity_id, reading_event(doc))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "unity_ids": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+def reading_event(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "reading",
+        "soil_id": doc["_id"],
+        "timestamp": doc["timestamp"].isoformat(),
+        "row": reading_to_row(doc)
+    }
+
+async def watch_soil_inserts(pubsub: SoilPubSub, retry_seconds: float = 5.0):
+    """
+    Publica as inserções vistas no change stream (exige replica set).
+    Collections time-series não suportam change streams.
+    """
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    while True:
+        try:
+            async with soil_store.soil_collection().watch(pipeline) as stream:
+                print("-> Change stream de leituras de solo ativo")
+                async for change in stream:
+                    pubsub.publish_reading(soil_store.from_storage(change["fullDocument"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"!!! ERRO no change stream de solo: {e} (nova tentativa em {retry_seconds}s)")
+            await asyncio.sleep(retry_seconds)
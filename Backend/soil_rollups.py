@@ -0,0 +1,180 @@
+"""
+Rollups de Solo - EKKO
+Agregados incrementais por jogador, por hora e por dia (count, sum, sumsq, min, max)
+
+Atualizados na ingestão com upserts $inc/$min/$max, então consultas de
+janelas longas leem O(buckets) documentos em vez de O(leituras).
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import async_unity_soil_rollups
+from soil_monitoring import MONITORING_FIELDS, STATUS_ORDER, get_path, ph_status
+
+# Nome canônico (último trecho do caminho) -> (caminho, valor padrão)
+ROLLUP_FIELDS = {path.split(".")[-1]: (path, default) for path, default in MONITORING_FIELDS.values()}
+# Score do jogo, usado pela tendência em ai_analyzer
+ROLLUP_FIELDS["score"] = ("game_metrics.score", None)
+
+# Chave do monitoring.js -> nome canônico
+MONITORING_KEYS = {key: path.split(".")[-1] for key, (path, _) in MONITORING_FIELDS.items()}
+
+GRANULARITIES = {
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+# Rótulo da linha do monitoramento: hora do bucket ou data do dia
+ROW_LABELS = {"hour": "%H:%M", "day": "%d/%m"}
+
+# Períodos do monitoramento servidos pelos rollups
+ROLLUP_PERIODS = {"7d": "hour", "30d": "day"}
+
+# Falhas de rollup não derrubam a ingestão, mas ficam contadas (/unity/ingest/stats):
+# buckets com falha ficam defasados até tools/reconstruir_rollups.py
+_counters = {"applied_ops": 0, "failed_ops": 0, "failed_batches": 0}
+
+def rollup_id(unity_id: str, granularity: str, start: datetime) -> str:
+    return f"{unity_id}:{granularity}:{start:%Y%m%d%H}"
+
+def build_rollup_updates(docs: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Combina as leituras por bucket em memória e gera (filtro, atualização) por
+    bucket (um lote de 500 leituras do mesmo jogador vira ~2 operações).
+    """
+    buckets = {}
+    for doc in docs:
+        severity = STATUS_ORDER.index(ph_status(doc["soil_parameters"]["ph"]))
+        for granularity, truncate in GRANULARITIES.items():
+            start = truncate(doc["timestamp"])
+            key = rollup_id(doc["unity_id"], granularity, start)
+            bucket = buckets.setdefault(key, {
+                "unity_id": doc["unity_id"],
+                "granularity": granularity,
+                "bucket_start": start,
+                "count": 0,
+                "severity": 0,
+                "params": {}
+            })
+            bucket["count"] += 1
+            bucket["severity"] = max(bucket["severity"], severity)
+            for name, (path, default) in ROLLUP_FIELDS.items():
+                value = get_path(doc, path, default)
+                if value is None:
+                    continue
+                value = float(value)
+                stats = bucket["params"].setdefault(name, {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": value, "max": value})
+                stats["count"] += 1
+                stats["sum"] += value
+                stats["sumsq"] += value * value
+                stats["min"] = min(stats["min"], value)
+                stats["max"] = max(stats["max"], value)
+
+    updates = []
+    for key, bucket in buckets.items():
+        inc = {"count": bucket["count"]}
+        mins, maxs = {}, {"severity": bucket["severity"]}
+        for name, stats in bucket["params"].items():
+            inc[f"params.{name}.count"] = stats["count"]
+            inc[f"params.{name}.sum"] = stats["sum"]
+            inc[f"params.{name}.sumsq"] = stats["sumsq"]
+            mins[f"params.{name}.min"] = stats["min"]
+            maxs[f"params.{name}.max"] = stats["max"]
+        updates.append(({"_id": key}, {
+            "$setOnInsert": {
+                "unity_id": bucket["unity_id"],
+                "granularity": bucket["granularity"],
+                "bucket_start": bucket["bucket_start"]
+            },
+            "$inc": inc,
+            "$min": mins,
+            "$max": maxs
+        }))
+    return updates
+
+def build_rollup_ops(docs: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """Upserts de build_rollup_updates prontos para bulk_write"""
+    return [UpdateOne(query, update, upsert=True) for query, update in build_rollup_updates(docs)]
+
+async def apply_rollups(docs: List[Dict[str, Any]]):
+    """Atualiza os rollups das leituras gravadas (falha não derruba a ingestão)"""
+    if not docs:
+        return
+    ops = build_rollup_ops(docs)
+    try:
+        await async_unity_soil_rollups.bulk_write(ops, ordered=False)
+        _counters["applied_ops"] += len(ops)
+    except BulkWriteError as e:
+        failed = len(e.details.get("writeErrors", []))
+        _counters["applied_ops"] += len(ops) - failed
+        _counters["failed_ops"] += failed
+        _counters["failed_batches"] += 1
+        first = e.details["writeErrors"][0].get("errmsg") if failed else e
+        print(f"!!! ERRO ao atualizar rollups: {failed}/{len(ops)} buckets falharam ({first})")
+    except Exception as e:
+        _counters["failed_ops"] += len(ops)
+        _counters["failed_batches"] += 1
+        print(f"!!! ERRO ao atualizar rollups: {len(ops)} buckets não atualizados ({e})")
+
+def rollup_stats() -> Dict[str, int]:
+    return dict(_counters)
+
+async def find_rollups(unity_id: str, granularity: str, since: Optional[datetime] = None, limit: int = 0) -> List[Dict[str, Any]]:
+    """Buckets do jogador, mais recentes primeiro"""
+    query = {"unity_id": unity_id, "granularity": granularity}
+    if since is not None:
+        query["bucket_start"] = {"$gte": GRANULARITIES[granularity](since)}
+    cursor = async_unity_soil_rollups.find(query).sort("bucket_start", -1)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(length=None)
+
+def param_mean(bucket: Dict[str, Any], name: str) -> Optional[float]:
+    stats = bucket.get("params", {}).get(name)
+    if not stats or not stats.get("count"):
+        return None
+    return stats["sum"] / stats["count"]
+
+def merge_buckets(buckets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Soma buckets vizinhos (para caber em max_points)"""
+    merged = {"bucket_start": buckets[-1]["bucket_start"], "count": 0, "severity": 0, "params": {}}
+    for bucket in buckets:
+        merged["count"] += bucket["count"]
+        merged["severity"] = max(merged["severity"], bucket.get("severity", 0))
+        for name, stats in bucket.get("params", {}).items():
+            acc = merged["params"].setdefault(name, {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": stats["min"], "max": stats["max"]})
+            acc["count"] += stats["count"]
+            acc["sum"] += stats["sum"]
+            acc["sumsq"] += stats["sumsq"]
+            acc["min"] = min(acc["min"], stats["min"])
+            acc["max"] = max(acc["max"], stats["max"])
+    return merged
+
+def rollup_to_row(bucket: Dict[str, Any], granularity: str) -> Dict[str, Any]:
+    """Bucket de rollup -> linha do monitoramento (mesmo formato do downsampling)"""
+    start = bucket["bucket_start"]
+    row = {"hora": start.strftime(ROW_LABELS[granularity]), "inicio": start.isoformat(), "leituras": bucket["count"]}
+    row["min"], row["max"], row["desvio"] = {}, {}, {}
+    for key, name in MONITORING_KEYS.items():
+        stats = bucket["params"].get(name)
+        if not stats or not stats["count"]:
+            continue
+        mean = stats["sum"] / stats["count"]
+        row[key] = round(mean, 2)
+        row["min"][key] = stats["min"]
+        row["max"][key] = stats["max"]
+        row["desvio"][key] = round(math.sqrt(max(stats["sumsq"] / stats["count"] - mean * mean, 0.0)), 3)
+    row["status"] = STATUS_ORDER[int(bucket.get("severity", 0))]
+    return row
+
+async def monitoring_rows(unity_id: str, granularity: str, since: datetime, max_points: Optional[int] = None) -> List[Dict[str, Any]]:
+    buckets = await find_rollups(unity_id, granularity, since=since)
+    if max_points and len(buckets) > max_points:
+        size = math.ceil(len(buckets) / max_points)
+        buckets = [merge_buckets(buckets[i:i + size]) for i in range(0, len(buckets), size)]
+    return [rollup_to_row(bucket, granularity) for bucket in buckets]
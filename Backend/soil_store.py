@@ -0,0 +1,281 @@
+"""
+Armazenamento de Leituras de Solo - EKKO
+Acesso único às leituras, na collection clássica ou time-series (SOIL_STORAGE_MODE)
+
+No modo time-series, `unity_id` e `cultivo_atual` ficam no metaField `meta`
+e `timestamp` é o timeField. As funções daqui convertem filtros e documentos,
+então as rotas leem sempre o formato clássico.
+
+Toda leitura tem um _id ordenável (soil_ids.new_soil_id); a chave de
+idempotência fica no campo `idempotency_key`. No modo clássico o índice único
+parcial (unity_id, idempotency_key) rejeita o reenvio. Time-series não tem
+índice único: as chaves são reservadas antes na collection Unity_soilKeys
+(_id derivado de jogador + chave, TTL de SOIL_IDEMPOTENCY_WINDOW_H), o que
+vale entre workers e processos. Uma reserva
+sem leitura gravada (processo caiu entre a reserva e o insert) expira após
+CLAIM_LEASE_S e é assumida pelo próximo reenvio.
+"""
+
+import hashlib
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+from database import (SOIL_IDEMPOTENCY_WINDOW_H, SOIL_STORAGE_MODE, SOIL_TS_COLLECTION, async_db,
+                      async_unity_soil_data, async_unity_soil_keys, async_unity_soil_ts,
+                      unity_soil_data, unity_soil_ts)
+
+TIMESERIES = SOIL_STORAGE_MODE == "timeseries"
+
+# Campos do documento clássico que viram metaField no modo time-series
+META_FIELDS = ("unity_id", "cultivo_atual")
+
+# Histórico: _id desempata leituras com o mesmo timestamp (paginação por keyset)
+HISTORY_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# Reserva de chave sem leitura gravada depois disso é considerada órfã
+CLAIM_LEASE_S = 60
+
+TIMESERIES_OPTIONS = {
+    "timeField": "timestamp",
+    "metaField": "meta",
+    "granularity": "seconds"
+}
+
+def write_dead_letter(path: str, docs: List[Dict[str, Any]]) -> None:
+    """
+    Anexa leituras que não puderam ser gravadas a um arquivo JSON Lines
+    (Extended JSON, formato clássico; reimportável com mongoimport)
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json_util.dumps(doc) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def soil_collection():
+    """Collection assíncrona (Motor) do modo configurado"""
+    return async_unity_soil_ts if TIMESERIES else async_unity_soil_data
+
+def sync_soil_collection():
+    """Collection síncrona do modo configurado (scripts)"""
+    return unity_soil_ts if TIMESERIES else unity_soil_data
+
+def unity_field() -> str:
+    return "meta.unity_id" if TIMESERIES else "unity_id"
+
+def soil_filter(unity_id: Optional[str] = None, since=None, before=None, before_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Filtro por jogador e janela de tempo no layout configurado.
+    Com `before_id`, o cursor é (before, before_id) na ordem de HISTORY_SORT.
+    """
+    query = {}
+    if unity_id is not None:
+        query[unity_field()] = unity_id
+    if since is not None or (before is not None and before_id is None):
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+        if before is not None and before_id is None:
+            query["timestamp"]["$lt"] = before
+    if before is not None and before_id is not None:
+        query["$or"] = [
+            {"timestamp": {"$lt": before}},
+            {"timestamp": before, "_id": {"$lt": before_id}},
+        ]
+    return query
+
+def to_timeseries(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Documento clássico -> documento time-series (campos de meta no metaField)"""
+    stored = {k: v for k, v in doc.items() if k not in META_FIELDS}
+    stored["meta"] = {k: doc.get(k) for k in META_FIELDS}
+    return stored
+
+def to_storage(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Documento clássico -> documento gravado no modo configurado"""
+    return to_timeseries(doc) if TIMESERIES else doc
+
+def from_storage(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Documento gravado -> formato clássico lido pelas rotas"""
+    if not doc or "meta" not in doc:
+        return doc
+    classic = {k: v for k, v in doc.items() if k != "meta"}
+    for field in META_FIELDS:
+        classic[field] = doc["meta"].get(field)
+    return classic
+
+def storage_projection(fields: Optional[List[str]]) -> Optional[Dict[str, int]]:
+    """Lista de campos clássicos -> projeção no layout configurado"""
+    if not fields:
+        return None
+    if TIMESERIES:
+        fields = ["meta" if field in META_FIELDS else field for field in fields]
+    return {field: 1 for field in fields}
+
+async def find_latest(unity_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    doc = await soil_collection().find_one(soil_filter(unity_id), storage_projection(fields), sort=[("timestamp", -1)])
+    return from_storage(doc)
+
+async def find_history(unity_id: str, limit: int = 0, since=None, before=None, before_id: Optional[str] = None,
+                       fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Leituras mais recentes primeiro (limit=0: sem limite).
+    (`before`, `before_id`) é o cursor da paginação por keyset (exclusivo);
+    só `before` continua aceito, mas pula leituras empatadas no timestamp.
+    """
+    query = soil_filter(unity_id, since=since, before=before, before_id=before_id)
+    cursor = soil_collection().find(query, storage_projection(fields)).sort(HISTORY_SORT)
+    if limit:
+        cursor = cursor.limit(limit)
+    return [from_storage(doc) for doc in await cursor.to_list(length=None)]
+
+def claim_id(unity_id: str, idempotency_key: str) -> str:
+    """_id da reserva em Unity_soilKeys (largura fixa, qualquer que seja a chave)"""
+    digest = hashlib.sha256(f"{unity_id}:{idempotency_key}".encode("utf-8")).hexdigest()[:24]
+    return f"{unity_id}_k{digest}"
+
+def _claim_row(doc: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    return {"_id": claim_id(doc["unity_id"], doc["idempotency_key"]), "unity_id": doc["unity_id"],
+            "soil_id": doc["_id"], "created_at": now}
+
+async def find_ids_by_key(unity_id: str, keys: List[str]) -> Dict[str, str]:
+    """Chave de idempotência -> _id da leitura já gravada (resposta a reenvios)"""
+    if not keys:
+        return {}
+    if TIMESERIES:
+        claims = {claim_id(unity_id, key): key for key in keys}
+        rows = await async_unity_soil_keys.find({"_id": {"$in": list(claims)}}).to_list(length=None)
+        return {claims[row["_id"]]: row["soil_id"] for row in rows}
+    docs = await async_unity_soil_data.find(
+        {"unity_id": unity_id, "idempotency_key": {"$in": keys}}, {"idempotency_key": 1}
+    ).to_list(length=None)
+    return {doc["idempotency_key"]: doc["_id"] for doc in docs}
+
+async def _claim_keys(docs: List[Dict[str, Any]]) -> Set[int]:
+    """
+    Reserva jogador + chave de cada leitura com chave de idempotência no índice
+    único de Unity_soilKeys. Retorna os índices cuja chave já estava reservada (reenvios).
+    """
+    keyed = [i for i, doc in enumerate(docs) if doc.get("idempotency_key")]
+    if not keyed:
+        return set()
+    now = datetime.utcnow()
+    rows = [_claim_row(docs[i], now) for i in keyed]
+    try:
+        await async_unity_soil_keys.insert_many(rows, ordered=False)
+    except BulkWriteError as e:
+        taken = set()
+        for write_error in e.details.get("writeErrors", []):
+            if write_error.get("code") != 11000:
+                raise
+            taken.add(keyed[write_error["index"]])
+        return {i for i in taken if not await _take_over_orphan(docs[i], now)}
+    return set()
+
+async def _take_over_orphan(doc: Dict[str, Any], now: datetime) -> bool:
+    """
+    Chave já reservada: se a leitura não existe e a reserva passou do lease,
+    o processo que reservou caiu antes do insert. Assume a reserva (True).
+    """
+    row = _claim_row(doc, now)
+    claim = await async_unity_soil_keys.find_one({"_id": row["_id"]})
+    if claim is None:
+        # Liberada entre o insert e a consulta (insert anterior falhou)
+        try:
+            await async_unity_soil_keys.insert_one(row)
+            return True
+        except DuplicateKeyError:
+            return False
+    if (now - claim["created_at"]).total_seconds() < CLAIM_LEASE_S:
+        return False  # outro insert em andamento
+    if await async_unity_soil_ts.find_one({"meta.unity_id": doc["unity_id"], "_id": claim.get("soil_id")}, {"_id": 1}):
+        return False  # reenvio de leitura já gravada
+    # Compare-and-set em created_at: só um reenvio concorrente assume a reserva
+    result = await async_unity_soil_keys.update_one(
+        {"_id": row["_id"], "created_at": claim["created_at"]},
+        {"$set": {"soil_id": doc["_id"], "created_at": now}}
+    )
+    if result.modified_count:
+        print(f"-> Reserva órfã da chave de idempotência assumida: {row['_id']}")
+    return result.modified_count == 1
+
+async def _release_keys(docs: List[Dict[str, Any]], positions) -> None:
+    """Libera as chaves de leituras que não foram gravadas, para o reenvio funcionar"""
+    keyed = [docs[i] for i in positions if docs[i].get("idempotency_key")]
+    if keyed:
+        # soil_id: só as reservas deste insert (não a de um reenvio que já as assumiu)
+        await async_unity_soil_keys.delete_many({
+            "_id": {"$in": [claim_id(doc["unity_id"], doc["idempotency_key"]) for doc in keyed]},
+            "soil_id": {"$in": [doc["_id"] for doc in keyed]}
+        })
+
+async def insert_soil_docs(docs: List[Dict[str, Any]], ordered: bool = False) -> Tuple[Set[int], Dict[int, str]]:
+    """
+    Grava as leituras em um único bulk write.
+    Retorna (índices duplicados, {índice: erro}) relativos a `docs`.
+    """
+    duplicates, errors = set(), {}
+    positions = list(range(len(docs)))
+
+    if TIMESERIES:
+        # Chave repetida no próprio lote: só a primeira ocorrência é reservada
+        seen = set()
+        for i, doc in enumerate(docs):
+            key = doc.get("idempotency_key")
+            if not key:
+                continue
+            if (doc["unity_id"], key) in seen:
+                duplicates.add(i)
+            seen.add((doc["unity_id"], key))
+        candidates = [i for i in positions if i not in duplicates]
+        claimed = await _claim_keys([docs[i] for i in candidates])
+        duplicates |= {candidates[j] for j in claimed}
+        positions = [i for i in positions if i not in duplicates]
+        if not positions:
+            return duplicates, errors
+
+    try:
+        await soil_collection().insert_many([to_storage(docs[i]) for i in positions], ordered=ordered)
+    except BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            i = positions[write_error["index"]]
+            if write_error.get("code") == 11000:
+                # Chave de idempotência já gravada: não conta como falha
+                duplicates.add(i)
+            else:
+                errors[i] = write_error.get("errmsg", "Erro de escrita")
+        if ordered:
+            # Com ordered=True, itens após o primeiro erro não são tentados
+            failed_at = [positions.index(i) for i in set(errors) | duplicates if i in positions]
+            for i in positions[min(failed_at) + 1:] if failed_at else []:
+                errors.setdefault(i, "Não processado (lote ordenado interrompido)")
+        if TIMESERIES:
+            await _release_keys(docs, errors)
+    except Exception:
+        if TIMESERIES:
+            await _release_keys(docs, positions)
+        raise
+    return duplicates, errors
+
+async def ensure_timeseries_collection():
+    """Cria a collection time-series, o índice secundário por jogador e o TTL das chaves"""
+    try:
+        await async_db.create_collection(SOIL_TS_COLLECTION, timeseries=TIMESERIES_OPTIONS)
+        print(f"-> Collection time-series '{SOIL_TS_COLLECTION}' criada")
+    except CollectionInvalid:
+        pass  # já existe
+    await async_unity_soil_ts.create_indexes([
+        IndexModel([("meta.unity_id", ASCENDING), ("timestamp", DESCENDING)], name="meta_unity_id_timestamp"),
+        IndexModel([("meta.unity_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="meta_unity_id_timestamp_id")
+    ])
+    await async_unity_soil_keys.create_indexes([
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                   expireAfterSeconds=int(SOIL_IDEMPOTENCY_WINDOW_H * 3600))
+    ])
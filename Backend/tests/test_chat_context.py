@@ -0,0 +1,33 @@
+"""
+Testes do contexto do chat (chat_context.py)
+
+Uso:
+    python -m pytest tests -q   (na pasta Backend)
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("motor")
+pytest.importorskip("numpy")
+pytest.importorskip("ddgs")
+from chat_context import player_crop
+
+def test_cultivo_da_leitura_tem_prioridade():
+    perfil = {"propriedade": {"cultivos_principais": ["Café"]}}
+    assert player_crop(perfil, {"cultivo_atual": "Milho"}) == "Milho"
+
+def test_perfil_com_lista_de_cultivos_principais():
+    perfil = {"propriedade": {"cultivos_principais": ["Soja", "Milho"]}}
+    assert player_crop(perfil, None) == "Soja"
+    assert player_crop(perfil, {"cultivo_atual": None}) == "Soja"
+
+def test_perfil_com_campo_antigo_cultivo_principal():
+    assert player_crop({"propriedade": {"cultivo_principal": "Milho"}}, None) == "Milho"
+
+def test_sem_cultivo_retorna_none():
+    assert player_crop({"propriedade": {"cultivos_principais": []}}, None) is None
+    assert player_crop(None, None) is None
@@ -0,0 +1,104 @@
+"""
+Testes do SoilWriteBuffer (ingest_buffer.py)
+
+Uso:
+    python -m pytest tests -q   (na pasta Backend)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_buffer import SoilWriteBuffer
+
+def leituras(n: int):
+    return [{"_id": f"soil_{i}", "unity_id": "jogador"} for i in range(n)]
+
+def test_lote_que_falha_e_regravado():
+    gravados, chamadas = [], []
+
+    async def writer(docs):
+        chamadas.append(len(docs))
+        if len(chamadas) == 1:
+            raise ConnectionError("primary indisponível")
+        gravados.extend(docs)
+        return set(), {}
+
+    async def cenario():
+        buffer = SoilWriteBuffer(writer, max_size=10, flush_ms=10, flush_docs=10, retry_ms=1)
+        buffer.start()
+        for doc in leituras(3):
+            await buffer.put(doc)
+        await buffer.stop(timeout=5)
+        return buffer.stats()
+
+    stats = asyncio.run(cenario())
+    assert [d["_id"] for d in gravados] == ["soil_0", "soil_1", "soil_2"]
+    assert chamadas[0] == 3
+    assert stats["flushed"] == 3
+    assert stats["retried"] == 3
+    assert stats["failed"] == 0
+
+def test_apenas_documentos_rejeitados_sao_regravados():
+    chamadas = []
+
+    async def writer(docs):
+        chamadas.append([d["_id"] for d in docs])
+        if len(chamadas) == 1:
+            return {0}, {2: "timeout"}
+        return set(), {}
+
+    async def cenario():
+        buffer = SoilWriteBuffer(writer, max_size=10, flush_ms=10, flush_docs=10, retry_ms=1)
+        buffer.start()
+        for doc in leituras(3):
+            await buffer.put(doc)
+        await buffer.stop(timeout=5)
+        return buffer.stats()
+
+    stats = asyncio.run(cenario())
+    assert chamadas == [["soil_0", "soil_1", "soil_2"], ["soil_2"]]
+    assert stats["flushed"] == 2
+    assert stats["duplicates"] == 1
+
+def test_tentativas_esgotadas_vao_para_o_dead_letter():
+    mortos = []
+
+    async def writer(docs):
+        raise ConnectionError("sem rede")
+
+    async def cenario():
+        buffer = SoilWriteBuffer(writer, max_size=10, flush_ms=10, flush_docs=10,
+                                 max_retries=2, retry_ms=1, dead_letter=mortos.extend)
+        buffer.start()
+        for doc in leituras(2):
+            await buffer.put(doc)
+        await buffer.stop(timeout=5)
+        return buffer.stats()
+
+    stats = asyncio.run(cenario())
+    assert [d["_id"] for d in mortos] == ["soil_0", "soil_1"]
+    assert stats["failed"] == 2
+    assert stats["dead_lettered"] == 2
+
+def test_shutdown_com_prazo_estourado_preserva_pendentes():
+    mortos = []
+
+    async def writer(docs):
+        await asyncio.sleep(60)
+        return set(), {}
+
+    async def cenario():
+        buffer = SoilWriteBuffer(writer, max_size=10, flush_ms=10, flush_docs=2,
+                                 dead_letter=mortos.extend)
+        buffer.start()
+        for doc in leituras(5):
+            await buffer.put(doc)
+        await asyncio.sleep(0.05)
+        await buffer.stop(timeout=0.1)
+        return buffer.stats()
+
+    stats = asyncio.run(cenario())
+    assert sorted(d["_id"] for d in mortos) == [f"soil_{i}" for i in range(5)]
+    assert stats["dead_lettered"] == 5
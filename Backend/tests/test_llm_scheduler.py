@@ -0,0 +1,64 @@
+"""
+Testes do LLMScheduler (ai_connector.py)
+
+Uso:
+    python -m pytest tests -q   (na pasta Backend)
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("requests")
+from ai_connector import LLMScheduler
+
+async def proxima(gen, timeout: float = 1.0):
+    """Próximo valor do wait_turn; None quando ele termina (vaga recebida)"""
+    try:
+        return await asyncio.wait_for(gen.__anext__(), timeout)
+    except StopAsyncIteration:
+        return None
+
+def test_vaga_concedida_durante_o_yield_nao_se_perde():
+    async def cenario():
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=5)
+        atual = scheduler.enter(0)
+        esperando = scheduler.enter(0)
+        gen = scheduler.wait_turn(esperando)
+
+        assert await proxima(gen) == 1
+        # Consumidor ainda parado no yield (ex.: enviando o evento SSE)
+        scheduler.release(atual)
+        assert esperando.granted
+        assert await proxima(gen) is None
+
+    asyncio.run(cenario())
+
+def test_posicao_alterada_durante_o_yield_e_reportada():
+    async def cenario():
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=5)
+        atual = scheduler.enter(0)
+        primeiro = scheduler.enter(1)
+        segundo = scheduler.enter(1)
+        gen = scheduler.wait_turn(segundo)
+
+        assert await proxima(gen) == 2
+        # O primeiro desiste enquanto o segundo processa a posição anterior
+        scheduler.release(primeiro)
+        assert await proxima(gen) == 1
+
+        scheduler.release(atual)
+        assert await proxima(gen) is None
+
+    asyncio.run(cenario())
+
+def test_ticket_com_vaga_imediata_nao_reporta_posicao():
+    async def cenario():
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=5)
+        ticket = scheduler.enter(0)
+        assert await proxima(scheduler.wait_turn(ticket)) is None
+
+    asyncio.run(cenario())
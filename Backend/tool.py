@@ -5,72 +5,170 @@ import requests
 import math
 import json
 import os
-import faiss
+import threading
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from ddgs import DDGS
 from datetime import datetime
+import knowledge_index
+import embedding_backends
+from database import EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR, RAG_INDEX_TYPE
+from query_encoder import QueryEncoder, QUERY_BATCH_MAX
 
 # --- CONFIGURAÇÃO DA BUSCA LOCAL (RAG) ---
-# Tenta carregar o modelo de embeddings. Se falhar, a busca local será desativada.
-try:
-    print("-> Carregando modelo de embeddings para busca local...")
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("-> Modelo de embeddings carregado com sucesso.")
-except Exception as e:
-    print(f"!!! ERRO ao carregar modelo de embeddings: {e}. A busca local estará desativada.")
-    embedding_model = None
-
-doc_path = "data/dados_plantacoes" 
-documents = []
-index = None
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Mesmo arquivo para init_memory_db, save_memory e recall_memories, qualquer que seja o cwd
+MEMORY_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ekko_memory.db")
+# Modelo e índice são carregados por warm_up() em segundo plano, depois que o
+# servidor sobe; até lá a busca local retorna vazio (etapa em /api/ready).
+embedding_model = None
+# Backend efetivamente carregado (torch se o ONNX configurado falhar)
+embedding_backend = None
+# Embeddings das perguntas: cache LRU + micro-lotes (query_encoder.py)
+query_encoder = None
+
+doc_path = knowledge_index.DOC_PATH
+# Índice em trechos, persistido em data/rag_index (knowledge_index.py)
+knowledge = None
+
+# Progresso do aquecimento (GET /api/ready)
+rag_ready = threading.Event()
+warmup_state = {"stage": "pending", "error": None, "started_at": None, "finished_at": None}
+# Motivo da última falha ao carregar o modelo ou o índice (as funções não lançam)
+load_error = None
+
+def load_embedding_model():
+    """Tenta carregar o modelo de embeddings. Se falhar, a busca local será desativada."""
+    global embedding_model, embedding_backend, query_encoder, load_error
+    try:
+        print(f"-> Carregando modelo de embeddings para busca local (backend {EMBEDDING_BACKEND})...")
+        try:
+            embedding_model = embedding_backends.load_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR)
+            embedding_backend = EMBEDDING_BACKEND
+        except Exception as e:
+            if EMBEDDING_BACKEND == "torch":
+                raise
+            print(f"!!! Backend {EMBEDDING_BACKEND} indisponível ({e}); usando torch")
+            embedding_model = embedding_backends.load_backend("torch", EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR)
+            embedding_backend = "torch"
+        query_encoder = QueryEncoder(lambda texts: embedding_model.encode(texts, batch_size=QUERY_BATCH_MAX))
+        load_error = None
+        print("-> Modelo de embeddings carregado com sucesso.")
+    except Exception as e:
+        print(f"!!! ERRO ao carregar modelo de embeddings: {e}. A busca local estará desativada.")
+        embedding_model = None
+        load_error = f"Modelo de embeddings: {e}"
+
+def encode_query(text: str):
+    """Embedding de uma pergunta (chat e cache semântico); use a partir de threads"""
+    return query_encoder.encode(text)
+
+def warm_up():
+    """Modelo de embeddings + índice da base local (chamada numa thread após o startup)"""
+    warmup_state.update(stage="model", started_at=time.time())
+    try:
+        # As funções de carga registram o erro em load_error em vez de lançar
+        load_embedding_model()
+        if embedding_model is None:
+            warmup_state.update(stage="failed", error=load_error)
+            return
+        warmup_state["stage"] = "index"
+        load_and_index_local_database()
+        if knowledge is None:
+            warmup_state.update(stage="failed", error=load_error)
+            return
+        warmup_state["stage"] = "ready"
+    except Exception as e:
+        print(f"!!! ERRO no aquecimento da busca local: {e}")
+        warmup_state.update(stage="failed", error=str(e))
+    finally:
+        warmup_state["finished_at"] = time.time()
+        rag_ready.set()
+
+def warmup_status() -> dict:
+    started, finished = warmup_state["started_at"], warmup_state["finished_at"]
+    return {
+        "ready": rag_ready.is_set(),
+        "stage": warmup_state["stage"],
+        "error": warmup_state["error"],
+        "elapsed_s": round((finished or time.time()) - started, 1) if started else None,
+        "embedding_model": embedding_model is not None,
+        "embedding_backend": embedding_backend,
+        "index": knowledge.stats() if knowledge else None
+    }
 
 def load_and_index_local_database():
     """
-    Lê todos os ficheiros .txt da pasta dados_plantacoes, cria os vetores (embeddings)
-    e indexa-os usando FAISS para busca rápida. É chamada na inicialização do servidor.
+    Abre o índice da base local salvo em disco (mmap) e re-embeda só os .txt
+    de dados_plantacoes novos ou alterados. É chamada na inicialização do servidor.
     """
-    global documents, index
-    if not (os.path.exists(doc_path) and embedding_model):
-        print("-> AVISO: Busca local desativada. Pasta 'dados_plantacoes' não encontrada ou vazia.")
+    global knowledge, load_error
+    if embedding_model is None:
+        load_error = load_error or "Modelo de embeddings não carregado"
+        print(f"-> AVISO: Busca local desativada. {load_error}.")
+        return
+    if not os.path.exists(doc_path):
+        load_error = f"Pasta '{doc_path}' não encontrada"
+        print(f"-> AVISO: Busca local desativada. {load_error}.")
         return
 
-    print("-> Lendo e indexando a base de conhecimento local...")
-    for root, _, files in os.walk(doc_path):
-        for filename in files:
-            if filename.endswith(".txt"):
-                filepath = os.path.join(root, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    documents.append(f.read())
-    
-    if documents:
-        doc_embeddings = embedding_model.encode(documents)
-        index = faiss.IndexFlatL2(doc_embeddings.shape[1])
-        index.add(np.array(doc_embeddings, dtype=np.float32))
-        print(f"-> Indexação de {len(documents)} documentos locais concluída!")
+    base = knowledge_index.KnowledgeBase(
+        lambda texts: embedding_model.encode(texts, batch_size=32),
+        embedding_backends.model_id(EMBEDDING_MODEL_NAME, embedding_backend),
+        index_type=RAG_INDEX_TYPE
+    )
+    try:
+        base.load()
+        knowledge = base
+        load_error = None
+    except Exception as e:
+        print(f"!!! ERRO ao carregar o índice da base local: {e}. A busca local estará desativada.")
+        knowledge = None
+        load_error = f"Índice da base local: {e}"
+
+def reindex_local_database() -> dict:
+    """Aplica mudanças da pasta dados_plantacoes sem reiniciar o servidor"""
+    if knowledge is None:
+        load_and_index_local_database()
+        return knowledge.stats() if knowledge else {"error": f"Busca local desativada: {load_error}"}
+    return knowledge.update()
 
 # ======================================================
 #  A CAIXA DE FERRAMENTAS DO AGENTE EKKO
 # ======================================================
 
-def local_database_search(query: str) -> str:
-    """Ferramenta para buscar na base de conhecimento local (ficheiros .txt)."""
-    print(f"--- Ferramenta Acionada: Busca na Base de Dados Local para '{query}' ---")
-    if index is None or not documents:
-        return "A base de dados local não está ativa ou está vazia."
+def local_database_search(query: str, crop: str = None) -> str:
+    """
+    Ferramenta para buscar na base de conhecimento local (trechos dos ficheiros .txt).
+    Com `crop`, só entram trechos desse cultivo e das pastas gerais; sem
+    trechos acima de RAG_MIN_SCORE retorna vazio e nada vai para o prompt.
+    Carregando ou desativada também retorna vazio: o estado fica no log e em
+    /api/ready, não no prompt.
+    """
+    print(f"--- Ferramenta Acionada: Busca na Base de Dados Local para '{query}' (cultivo: {crop or 'todos'}) ---")
+    if not rag_ready.is_set():
+        print("-> Busca local ignorada: base ainda carregando")
+        return ""
+    if knowledge is None or knowledge.current is None:
+        print(f"-> Busca local ignorada: base desativada ou vazia ({load_error or 'sem trechos'})")
+        return ""
     
-    query_embedding = embedding_model.encode([query])
-    # Busca os 3 trechos mais relevantes da biblioteca
-    _, indices = index.search(np.array(query_embedding, dtype=np.float32), 3)
+    query_embedding = encode_query(query)
+    # Busca híbrida (cosseno + BM25) pelos trechos mais relevantes da biblioteca
+    results = knowledge.search(query_embedding, knowledge_index.RAG_TOP_K, query=query, crop=crop)
+    if not results:
+        return ""
     
-    context = "\n---\n".join([documents[i] for i in indices[0]])
+    context = "\n---\n".join(
+        f"[{chunk['crop']} / {os.path.basename(chunk['file'])} / {chunk['section']}]\n{chunk['text']}" for chunk in results
+    )
     return f"Resultados da busca na base de dados local:\n{context}"
 
 def save_memory(information: str) -> str:
     """Ferramenta para salvar um fato na memória de longo prazo (SQLite)."""
     print(f"--- Ferramenta Acionada: Gravar na Memória -> '{information}' ---")
     try:
-        conn = sqlite3.connect("ekko_memory.db")
+        conn = sqlite3.connect(MEMORY_DB_PATH)
         cursor = conn.cursor()
         cursor.execute("INSERT OR IGNORE INTO memories (content) VALUES (?)", (information,))
         conn.commit()
@@ -80,17 +178,22 @@ def save_memory(information: str) -> str:
         return f"Erro ao tentar guardar a informação: {e}"
 
 def recall_memories() -> str:
-    """Função auxiliar para ler todas as memórias salvas."""
+    """
+    Função auxiliar para ler todas as memórias salvas ("" se não houver ou
+    em caso de erro, para a seção ficar fora do prompt).
+    As memórias são globais, não por unity_id: por isso o /api/chat não as usa.
+    """
     try:
-        conn = sqlite3.connect("ekko_memory.db")
+        conn = sqlite3.connect(MEMORY_DB_PATH)
         cursor = conn.cursor()
         cursor.execute("SELECT content FROM memories")
         memories = [row[0] for row in cursor.fetchall()]
         conn.close()
-        if not memories: return "Nenhuma memória de longo prazo encontrada."
+        if not memories: return ""
         return "Memórias de Longo Prazo (Fatos sobre o usuário):\n- " + "\n- ".join(memories)
     except Exception as e:
-        return f"Erro ao aceder às memórias: {e}"
+        print(f"!!! ERRO ao aceder às memórias: {e}")
+        return ""
 
 def focused_web_search(query: str, location_string: str = "") -> str:
     """Ferramenta para buscar na web, restrita a fontes confiáveis."""
@@ -158,7 +261,7 @@ def get_inmet_forecast(lat: float, lon: float) -> str:
 
 def init_memory_db():
     """Cria a tabela de memória na base de dados se ela não existir."""
-    conn = sqlite3.connect("data/ekko_memory.db")
+    conn = sqlite3.connect(MEMORY_DB_PATH)
     cursor = conn.cursor()
     cursor.execute('CREATE TABLE IF NOT EXISTS memories (id INTEGER PRIMARY KEY, content TEXT NOT NULL UNIQUE)')
     conn.commit()
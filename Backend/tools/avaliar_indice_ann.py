@@ -0,0 +1,80 @@
+"""
+Avaliação dos Tipos de Índice FAISS - EKKO
+Recall@k, tempo de construção, latência e tamanho de hnsw/ivfpq contra o flat
+
+Uso:
+    python tools/avaliar_indice_ann.py [--k 10] [--consultas 200] [--sintetico 100000]
+    python tools/avaliar_indice_ann.py --tipos hnsw --param ef_search=32 --param m=16
+
+Usa os vetores da versão atual do índice (data/rag_index/<CURRENT>/vectors.npy).
+--sintetico acrescenta N vetores perturbados a partir dos reais, para simular
+uma base muito maior antes de carregar os boletins. As consultas são trechos
+sorteados com ruído, comparadas ao vizinho exato (flat).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import ann_index
+from knowledge_index import CURRENT_FILE, IDS_FILE, INDEX_DIR, VECTORS_FILE
+
+def carregar_vetores(index_dir: str):
+    with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+        version_dir = os.path.join(index_dir, f.read().strip())
+    vetores = np.load(os.path.join(version_dir, VECTORS_FILE)).astype(np.float32)
+    ids = np.load(os.path.join(version_dir, IDS_FILE)).astype(np.int64)
+    return vetores, ids
+
+def perturbar(base: np.ndarray, n: int, ruido: float, rng) -> np.ndarray:
+    amostra = base[rng.integers(0, len(base), n)] + rng.normal(0, ruido, (n, base.shape[1])).astype(np.float32)
+    faiss.normalize_L2(amostra)
+    return amostra
+
+def avaliar(tipo: str, vetores: np.ndarray, ids: np.ndarray, consultas: np.ndarray, k: int, params: dict):
+    index, meta = ann_index.build(tipo, vetores, ids, params)
+    recall = ann_index.recall_at_k(index, ids, vetores, consultas, k)
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        index.search(consulta.reshape(1, -1), k)
+    latencia = (time.perf_counter() - inicio) / len(consultas) * 1000
+    tamanho = faiss.serialize_index(index).nbytes / 1e6
+    efetivo = meta["type"] if meta["type"] == tipo else f"{meta['type']} (pedido {tipo})"
+    print(f"{efetivo:<22} recall@{k} {recall:6.3f}   construção {meta['build_s']:7.2f}s   "
+          f"busca {latencia:6.2f} ms   {tamanho:8.1f} MB   {meta['params']}")
+
+def ler_params(pares):
+    params = {}
+    for par in pares or []:
+        chave, valor = par.split("=", 1)
+        params[chave] = int(valor)
+    return params
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara flat, hnsw e ivfpq na base de conhecimento")
+    parser.add_argument("--index-dir", default=os.path.join(BACKEND_DIR, INDEX_DIR))
+    parser.add_argument("--tipos", nargs="+", default=list(ann_index.INDEX_TYPES), choices=ann_index.INDEX_TYPES)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--sintetico", type=int, default=0, help="Vetores sintéticos a acrescentar")
+    parser.add_argument("--ruido", type=float, default=0.05, help="Desvio do ruído dos vetores sintéticos")
+    parser.add_argument("--param", action="append", help="Sobrescreve um parâmetro (ex.: nprobe=16)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vetores, ids = carregar_vetores(args.index_dir)
+    if args.sintetico:
+        vetores = np.vstack([vetores, perturbar(vetores, args.sintetico, args.ruido, rng)])
+        ids = np.arange(len(vetores), dtype=np.int64)
+    consultas = perturbar(vetores, args.consultas, args.ruido, rng)
+    print(f"{len(vetores)} vetores de dimensão {vetores.shape[1]}, {len(consultas)} consultas\n")
+
+    for tipo in args.tipos:
+        avaliar(tipo, vetores, ids, consultas, args.k, ler_params(args.param))
@@ -0,0 +1,60 @@
+"""
+Exportação do Modelo de Embeddings para ONNX - EKKO
+Gera model.onnx (fp32), model_int8.onnx (quantizado) e tokenizer.json
+
+Uso:
+    python tools/exportar_embeddings_onnx.py [--saida data/models/all-MiniLM-L6-v2-onnx]
+
+Roda uma vez numa máquina com torch + transformers + onnxruntime; os
+servidores só precisam de onnxruntime + tokenizers (EMBEDDING_BACKEND=onnx
+ou onnx-int8). Depois confira com tools/paridade_embeddings.py.
+"""
+
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from database import EMBEDDING_ONNX_DIR
+from embedding_backends import ONNX_FILES, TOKENIZER_FILE
+
+HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def exportar(saida: str, opset: int = 14):
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(saida, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL)
+    model = AutoModel.from_pretrained(HF_MODEL).eval()
+    tokenizer.backend_tokenizer.save(os.path.join(saida, TOKENIZER_FILE))
+
+    exemplo = tokenizer(["exemplo de pergunta"], return_tensors="pt")
+    fp32 = os.path.join(saida, ONNX_FILES["onnx"])
+    dinamicos = {0: "batch", 1: "tokens"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (exemplo["input_ids"], exemplo["attention_mask"], exemplo["token_type_ids"]),
+            fp32,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dinamicos, "attention_mask": dinamicos,
+                          "token_type_ids": dinamicos, "last_hidden_state": dinamicos},
+            opset_version=opset
+        )
+    print(f"fp32: {fp32} ({os.path.getsize(fp32) / 1e6:.1f} MB)")
+
+    int8 = os.path.join(saida, ONNX_FILES["onnx-int8"])
+    # Quantização dinâmica: pesos em int8, ativações quantizadas em tempo de execução
+    quantize_dynamic(fp32, int8, weight_type=QuantType.QInt8)
+    print(f"int8: {int8} ({os.path.getsize(int8) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta o all-MiniLM-L6-v2 para ONNX (fp32 e int8)")
+    parser.add_argument("--saida", default=os.path.join(BACKEND_DIR, EMBEDDING_ONNX_DIR), help="Pasta de destino")
+    parser.add_argument("--opset", type=int, default=14, help="Versão do opset ONNX")
+    args = parser.parse_args()
+    exportar(args.saida, args.opset)
@@ -0,0 +1,98 @@
+"""
+Migração para Time-Series - EKKO Unity
+Copia Unity_soilData para a collection time-series em lotes
+
+Uso:
+    python tools/migrar_timeseries.py [--lote 1000] [--desde <_id>]
+
+A cópia é feita em ordem de _id e pode ser retomada com --desde usando o
+último _id exibido. Rodar de novo (com ou sem --desde) é seguro: cada lote
+pula os _id que já estão na time-series, que não tem índice único em _id.
+Depois de migrar, configure SOIL_STORAGE_MODE=timeseries.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Reutiliza a conexão síncrona de database.py (pasta Backend)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from database import db, unity_soil_data, unity_soil_ts, SOIL_COLLECTION, SOIL_TS_COLLECTION
+from soil_store import TIMESERIES_OPTIONS, to_timeseries
+
+def criar_collection_timeseries():
+    """Cria a collection time-series (mesmas opções usadas pela API)"""
+    try:
+        db.create_collection(SOIL_TS_COLLECTION, timeseries=TIMESERIES_OPTIONS)
+        print(f"Collection time-series '{SOIL_TS_COLLECTION}' criada")
+    except CollectionInvalid:
+        print(f"Collection '{SOIL_TS_COLLECTION}' já existe")
+    unity_soil_ts.create_indexes([
+        IndexModel([("meta.unity_id", ASCENDING), ("timestamp", DESCENDING)], name="meta_unity_id_timestamp"),
+        IndexModel([("timestamp", DESCENDING)], name="timestamp")
+    ])
+
+def migrar(tamanho_lote: int = 1000, desde=None):
+    criar_collection_timeseries()
+
+    query = {"timestamp": {"$exists": True}}
+    if desde:
+        query["_id"] = {"$gt": desde}
+
+    total = unity_soil_data.count_documents(query)
+    print(f"Migrando {total} leituras de {SOIL_COLLECTION} -> {SOIL_TS_COLLECTION} (lote: {tamanho_lote})")
+
+    copiados = falhas = pulados = 0
+    inicio = time.time()
+    lote = []
+    ultimo_id = desde
+    for doc in unity_soil_data.find(query).sort("_id", ASCENDING).batch_size(tamanho_lote):
+        lote.append(to_timeseries(doc))
+        ultimo_id = doc["_id"]
+        if len(lote) >= tamanho_lote:
+            ok, erro, pulo = gravar_lote(lote)
+            copiados, falhas, pulados = copiados + ok, falhas + erro, pulados + pulo
+            lote = []
+            print(f"  {copiados + pulados}/{total} processados ({pulados} já migrados) | último _id: {ultimo_id}")
+    if lote:
+        ok, erro, pulo = gravar_lote(lote)
+        copiados, falhas, pulados = copiados + ok, falhas + erro, pulados + pulo
+
+    print(f"\nMigração concluída em {time.time() - inicio:.1f}s")
+    print(f"Copiados: {copiados} | Já migrados: {pulados} | Falhas: {falhas} | Último _id: {ultimo_id}")
+
+def ja_migrados(lote):
+    """
+    _id do lote que já estão na time-series. A busca fica restrita aos
+    jogadores e à faixa de timestamp do lote (índice meta_unity_id_timestamp).
+    """
+    timestamps = [doc["timestamp"] for doc in lote]
+    query = {
+        "meta.unity_id": {"$in": list({doc["meta"]["unity_id"] for doc in lote})},
+        "timestamp": {"$gte": min(timestamps), "$lte": max(timestamps)},
+        "_id": {"$in": [doc["_id"] for doc in lote]}
+    }
+    return {doc["_id"] for doc in unity_soil_ts.find(query, {"_id": 1})}
+
+def gravar_lote(lote):
+    """(copiados, falhas, já migrados) do lote"""
+    existentes = ja_migrados(lote)
+    novos = [doc for doc in lote if doc["_id"] not in existentes]
+    if not novos:
+        return 0, 0, len(existentes)
+    try:
+        unity_soil_ts.insert_many(novos, ordered=False)
+        return len(novos), 0, len(existentes)
+    except BulkWriteError as e:
+        erros = len(e.details.get("writeErrors", []))
+        return len(novos) - erros, erros, len(existentes)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra leituras de solo para time-series")
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos por insert_many")
+    parser.add_argument("--desde", default=None, help="Retomar após este _id")
+    args = parser.parse_args()
+    migrar(args.lote, args.desde)
@@ -4,24 +4,18 @@ Versão simplificada para monitoramento básico
 """
 
 import os
+import sys
 import time
 from datetime import datetime
-from pymongo import MongoClient
-from dotenv import load_dotenv
 
-# Carregar .env
-load_dotenv()
+# Reutiliza a conexão síncrona de database.py (pasta Backend)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import DB_NAME
+from soil_store import from_storage, sync_soil_collection
 
-# MongoDB Atlas
-MONGO_URI = os.getenv("UNITY_MONGO_URI")
-DB_NAME = os.getenv("UNITY_MONGO_DB_NAME", "EKKOnUnity")
-
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-
-# Collection de dados de solo
-unity_soil_data = db["Unity_soilData"]
-print("Usando collection: Unity_soilData")
+# Collection de dados de solo (clássica ou time-series, conforme SOIL_STORAGE_MODE)
+unity_soil_data = sync_soil_collection()
+print(f"Usando collection: {unity_soil_data.name}")
 
 def monitor_simple():
     """Monitor simples que mostra apenas novos dados"""
@@ -43,7 +37,7 @@ def monitor_simple():
                 new_records = current_count - last_count
                 
                 # Buscar dados mais recentes
-                latest = unity_soil_data.find_one(sort=[("timestamp", -1)])
+                latest = from_storage(unity_soil_data.find_one(sort=[("timestamp", -1)]))
                 
                 print(f"\nNOVO DADO RECEBIDO! ({datetime.now().strftime('%H:%M:%S')})")
                 print(f"Unity ID: {latest.get('unity_id', 'N/A')}")
@@ -0,0 +1,88 @@
+"""
+Paridade entre Backends de Embeddings - EKKO
+Confere se um backend ONNX devolve os mesmos trechos que o torch
+
+Uso:
+    python tools/paridade_embeddings.py --backend onnx-int8 [--k 3] [--min-overlap 0.9]
+
+Embeda todos os trechos de data/dados_plantacoes e as perguntas de teste com
+os dois backends e compara:
+- cosseno entre o vetor torch e o do backend, por trecho
+- sobreposição do top-k da busca vetorial para cada pergunta
+Sai com código 1 se ficar abaixo dos limites.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from database import EMBEDDING_ONNX_DIR
+from embedding_backends import load_backend
+from knowledge_index import DOC_PATH, chunk_file, list_source_files
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+PERGUNTAS = [
+    "Qual o pH ideal para o milho?",
+    "Como controlar a cigarrinha do milho?",
+    "Quando fazer a calagem do solo?",
+    "Quanto nitrogênio aplicar em cobertura?",
+    "Como saber se falta potássio na lavoura?",
+    "O que é plantio direto?",
+    "Como reduzir a compactação do solo?",
+    "Qual a umidade ideal do solo para o plantio?",
+    "Como funciona a agricultura de precisão?",
+    "Quais os sinais de deficiência de fósforo?",
+]
+
+def top_k(consultas: np.ndarray, trechos: np.ndarray, k: int) -> np.ndarray:
+    # Vetores já normalizados: produto interno = cosseno
+    return np.argsort(-(consultas @ trechos.T), axis=1)[:, :k]
+
+def comparar(backend: str, onnx_dir: str, k: int, perguntas_arquivo: str = None):
+    doc_path = os.path.join(BACKEND_DIR, DOC_PATH)
+    textos = [chunk["text"] for rel in list_source_files(doc_path) for chunk in chunk_file(rel, doc_path)]
+    perguntas = PERGUNTAS
+    if perguntas_arquivo:
+        with open(perguntas_arquivo, "r", encoding="utf-8") as f:
+            perguntas = [linha.strip() for linha in f if linha.strip()]
+    print(f"{len(textos)} trechos, {len(perguntas)} perguntas, k={k}")
+
+    referencia = load_backend("torch", MODEL_NAME, onnx_dir)
+    candidato = load_backend(backend, MODEL_NAME, onnx_dir)
+
+    trechos_ref, trechos_cand = referencia.encode(textos), candidato.encode(textos)
+    consultas_ref, consultas_cand = referencia.encode(perguntas), candidato.encode(perguntas)
+
+    cossenos = np.sum(trechos_ref * trechos_cand, axis=1)
+    print(f"Cosseno torch x {backend}: mínimo {cossenos.min():.4f}, médio {cossenos.mean():.4f}")
+
+    # Cenário real: índice e perguntas embedados pelo mesmo backend
+    top_ref = top_k(consultas_ref, trechos_ref, k)
+    top_cand = top_k(consultas_cand, trechos_cand, k)
+    sobreposicoes = [len(set(a) & set(b)) / k for a, b in zip(top_ref, top_cand)]
+    top1 = sum(a[0] == b[0] for a, b in zip(top_ref, top_cand)) / len(perguntas)
+    for pergunta, sobreposicao in zip(perguntas, sobreposicoes):
+        if sobreposicao < 1:
+            print(f"  top-{k} diferente ({sobreposicao:.2f}): {pergunta}")
+    print(f"Sobreposição média do top-{k}: {np.mean(sobreposicoes):.3f}; top-1 igual: {top1:.3f}")
+    return float(cossenos.min()), float(np.mean(sobreposicoes))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara a busca do backend ONNX com a do torch")
+    parser.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    parser.add_argument("--onnx-dir", default=os.path.join(BACKEND_DIR, EMBEDDING_ONNX_DIR))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--perguntas", default=None, help="Arquivo com uma pergunta por linha")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Cosseno mínimo por trecho")
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="Sobreposição média mínima do top-k")
+    args = parser.parse_args()
+
+    cosseno_min, sobreposicao = comparar(args.backend, args.onnx_dir, args.k, args.perguntas)
+    if cosseno_min < args.min_cosine or sobreposicao < args.min_overlap:
+        print("FALHOU: resultados do backend divergem do torch")
+        sys.exit(1)
+    print("OK: busca equivalente")
@@ -0,0 +1,105 @@
+"""
+Reconstrução de Rollups - EKKO Unity
+Recalcula Unity_soilRollups a partir das leituras brutas
+
+Uso:
+    python tools/reconstruir_rollups.py [--unity-id <id>] [--lote 2000]
+
+Necessário uma vez para leituras gravadas antes dos rollups existirem
+(depois disso eles são mantidos na ingestão).
+
+Pode rodar com a API no ar: os buckets são recalculados numa collection de
+staging com as leituras recebidas até o início da reconstrução (received_at),
+que então substitui a atual (renameCollection, ou troca dos buckets do jogador
+com --unity-id). Em seguida as leituras recebidas durante a reconstrução, cujo
+$inc foi para a collection antiga, são reaplicadas. Só uma leitura gravada no
+exato instante da troca pode ficar contada duas vezes.
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# Reutiliza a conexão síncrona de database.py (pasta Backend)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from database import db, unity_soil_rollups, SOIL_ROLLUPS_COLLECTION
+from indexes import ROLLUP_INDEXES
+from soil_rollups import build_rollup_ops
+from soil_store import from_storage, soil_filter, sync_soil_collection
+
+STAGING_COLLECTION = f"{SOIL_ROLLUPS_COLLECTION}_rebuild"
+
+def aplicar(destino, leituras, tamanho_lote: int):
+    """Aplica os rollups das leituras em lotes -> (lidas, buckets com falha)"""
+    lidos = falhas = 0
+    lote = []
+    for doc in leituras:
+        lote.append(from_storage(doc))
+        if len(lote) >= tamanho_lote:
+            falhas += gravar_lote(destino, lote)
+            lidos += len(lote)
+            lote = []
+            print(f"  {lidos} leituras processadas")
+    if lote:
+        falhas += gravar_lote(destino, lote)
+        lidos += len(lote)
+    return lidos, falhas
+
+def gravar_lote(destino, lote) -> int:
+    try:
+        destino.bulk_write(build_rollup_ops(lote), ordered=False)
+        return 0
+    except BulkWriteError as e:
+        erros = e.details.get("writeErrors", [])
+        print(f"  !!! {len(erros)} buckets falharam: {erros[0].get('errmsg') if erros else e}")
+        return len(erros)
+
+def trocar(staging, unity_id=None):
+    """Substitui os rollups atuais pelos recalculados"""
+    if unity_id is None:
+        staging.rename(SOIL_ROLLUPS_COLLECTION, dropTarget=True)
+        return
+    # Substitui bucket a bucket (sem janela em que o jogador fica sem rollups)
+    buckets = list(staging.find({}))
+    if buckets:
+        unity_soil_rollups.bulk_write([ReplaceOne({"_id": b["_id"]}, b, upsert=True) for b in buckets], ordered=False)
+    unity_soil_rollups.delete_many({"unity_id": unity_id, "_id": {"$nin": [b["_id"] for b in buckets]}})
+    staging.drop()
+
+def reconstruir(unity_id=None, tamanho_lote: int = 2000):
+    corte = datetime.utcnow()
+    collection = sync_soil_collection()
+    base = soil_filter(unity_id) if unity_id else {}
+    # Leituras antigas não têm received_at: entram na reconstrução
+    antes = {"$and": [base, {"$or": [{"received_at": {"$lt": corte}}, {"received_at": {"$exists": False}}]}]}
+    depois = {"$and": [base, {"received_at": {"$gte": corte}}]}
+
+    staging = db[STAGING_COLLECTION]
+    staging.drop()
+    staging.create_indexes(ROLLUP_INDEXES)
+    print(f"Recalculando em {STAGING_COLLECTION} (leituras recebidas até {corte.isoformat()})")
+    lidos, falhas = aplicar(staging, collection.find(antes).batch_size(tamanho_lote), tamanho_lote)
+    if falhas:
+        print(f"\n{falhas} buckets falharam; rollups atuais mantidos (staging em {STAGING_COLLECTION})")
+        return False
+
+    trocar(staging, unity_id)
+    print(f"Rollups substituídos: {lidos} leituras")
+
+    # Leituras que chegaram durante a reconstrução
+    extras, falhas = aplicar(unity_soil_rollups, collection.find(depois).batch_size(tamanho_lote), tamanho_lote)
+    total = unity_soil_rollups.count_documents({"unity_id": unity_id} if unity_id else {})
+    print(f"\nConcluído: {lidos + extras} leituras ({extras} recebidas durante a reconstrução) -> {total} buckets")
+    if falhas:
+        print(f"!!! {falhas} buckets falharam ao reaplicar as leituras recentes")
+    return not falhas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula os rollups de solo")
+    parser.add_argument("--unity-id", default=None, help="Apenas este jogador")
+    parser.add_argument("--lote", type=int, default=2000, help="Leituras por bulk_write")
+    args = parser.parse_args()
+    sys.exit(0 if reconstruir(args.unity_id, args.lote) else 1)
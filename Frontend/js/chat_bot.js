@@ -175,6 +175,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const handleConfirm = () => {
             console.log(`Sessão "${sessionTitle}" apagada.`);
             delete sessions[sessionIdToDelete];
+            fetch(`${API_URL_CHAT}/conversations/${sessionIdToDelete}`, { method: 'DELETE' })
+                .catch(error => console.warn('Não foi possível apagar a conversa no servidor:', error));
 
             if (activeSessionId === sessionIdToDelete) {
                 activeSessionId = Object.keys(sessions).sort((a, b) => b.localeCompare(a))[0];
@@ -270,21 +272,31 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         isLoading = true;
+        // Histórico anterior à pergunta (ela vai em `message`), com quem falou
+        const tempDiv = document.createElement('div');
+        tempDiv.innerHTML = sessions[activeSessionId].history;
+        const chatHistoryText = Array.from(tempDiv.querySelectorAll('.message'))
+            .map(m => `${m.classList.contains('user-message') ? 'Agricultor' : 'Ekko'}: ${m.innerText}`)
+            .slice(-8);
+        
         console.log('Adicionando mensagem do usuário...');
         addUserMessage(question);
         userInput.value = '';
         userInput.focus();
         showStatusMessage("A processar...");
-        
-        const tempDiv = document.createElement('div');
-        tempDiv.innerHTML = sessions[activeSessionId].history;
-        const chatHistoryText = Array.from(tempDiv.querySelectorAll('.message')).map(m => m.innerText).slice(-8);
 
         try {
             const response = await fetch(API_URL_CHAT, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: question, history: chatHistoryText, coordinates: userCoordinates }),
+                // O servidor guarda o histórico por conversa; ele só é enviado
+                // até o servidor confirmar (evento "saved") que a conversa foi gravada
+                body: JSON.stringify({
+                    message: question,
+                    conversation_id: activeSessionId,
+                    history: sessions[activeSessionId].serverHistory ? [] : chatHistoryText,
+                    coordinates: userCoordinates
+                }),
             });
             
             removeStatusMessage();
@@ -311,9 +323,16 @@ document.addEventListener('DOMContentLoaded', () => {
                             const jsonData = JSON.parse(line.substring(6));
                             if (jsonData.type === 'status') {
                                 showStatusMessage(jsonData.message);
-                            } else if (jsonData.type === 'chunk') {
+                            } else if (jsonData.type === 'chunk' || jsonData.type === 'error') {
                                 removeStatusMessage();
                                 updateBotMessage(botMessageElement, jsonData.message);
+                            } else if (jsonData.type === 'saved' && sessions[jsonData.conversation_id]) {
+                                // Pergunta e resposta gravadas: o servidor já tem o histórico desta conversa
+                                sessions[jsonData.conversation_id].serverHistory = true;
+                            } else if (jsonData.type === 'busy') {
+                                // Fila da IA cheia: o servidor recusou sem gerar resposta
+                                removeStatusMessage();
+                                addBotInfoMessage(jsonData.message);
                             }
                         } catch (e) { /* Ignora erros de parsing */ }
                     }
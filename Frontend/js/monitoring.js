@@ -4,16 +4,34 @@ const MonitoringModule = {
     // Configurações
     config: {
         updateInterval: 30000, // 30 segundos
-        baseUrl: "http://127.0.0.1:8002"
+        baseUrl: "http://127.0.0.1:8002",
+        // Períodos longos são agregados no servidor (max_points buckets)
+        maxPoints: { '7d': 336 },
+        // Duração de cada período (ms): linhas ao vivo fora da janela são descartadas
+        periodWindows: {
+            '1h': 3600000,
+            '6h': 21600000,
+            '24h': 86400000,
+            '7d': 604800000,
+            '30d': 2592000000
+        },
+        // Com o stream conectado, o polling vira só uma ressincronização
+        resyncInterval: 300000 // 5 minutos
     },
     
     // Estado atual
     state: {
         currentPeriod: '24h',
         isUpdating: false,
-        lastUpdate: null
+        lastUpdate: null,
+        streamConnected: false,
+        lastFullUpdate: 0,
+        refreshTimer: null
     },
     
+    // Conexão SSE (/unity/stream)
+    eventSource: null,
+    
     // Dados reais do banco de dados
     realData: [],
     
@@ -49,6 +67,7 @@ const MonitoringModule = {
                                         <option value="6h">Últimas 6 horas</option>
                                         <option value="24h" selected>Últimas 24 horas</option>
                                         <option value="7d">Últimos 7 dias</option>
+                                        <option value="30d">Últimos 30 dias</option>
                                     </select>
                                 </div>
                             </div>
@@ -411,7 +430,9 @@ const MonitoringModule = {
             console.log('Buscando dados para Unity ID:', unityId);
             console.log('Período selecionado:', this.state.currentPeriod);
             
-            const apiUrl = `${this.config.baseUrl}/unity/monitoring/${unityId}?period=${this.state.currentPeriod}`;
+            const maxPoints = this.config.maxPoints[this.state.currentPeriod];
+            const apiUrl = `${this.config.baseUrl}/unity/monitoring/${unityId}?period=${this.state.currentPeriod}` +
+                (maxPoints ? `&max_points=${maxPoints}` : '');
             console.log('URL da API:', apiUrl);
             
             const response = await fetch(apiUrl);
@@ -434,6 +455,7 @@ const MonitoringModule = {
                 this.realData = [];
             }
             
+            this.state.lastFullUpdate = Date.now();
             this.updateMetrics();
             this.updateTable();
             this.updateLastUpdateTime();
@@ -708,13 +730,84 @@ const MonitoringModule = {
             this.updateData();
         }, 1000); // Aguardar 1 segundo para garantir que tudo esteja carregado
         
+        this.connectStream();
+        
+        // Polling só quando o stream não está disponível
         setInterval(() => {
-            if (!this.state.isUpdating) {
+            if (this.state.isUpdating) return;
+            const elapsed = Date.now() - this.state.lastFullUpdate;
+            if (!this.state.streamConnected || elapsed >= this.config.resyncInterval) {
                 this.updateData();
             }
         }, this.config.updateInterval);
     },
     
+    // Atualizações ao vivo via Server-Sent Events (fallback: polling)
+    connectStream() {
+        if (!window.EventSource) {
+            console.warn('EventSource não suportado, mantendo polling');
+            return;
+        }
+        
+        const unityId = this.getCurrentUserId();
+        const source = new EventSource(`${this.config.baseUrl}/unity/stream/${unityId}`);
+        this.eventSource = source;
+        
+        source.addEventListener('ready', () => {
+            const reconnected = this.state.streamConnected === false && this.state.lastFullUpdate > 0;
+            this.state.streamConnected = true;
+            console.log('Stream de monitoramento conectado');
+            // Leituras perdidas enquanto desconectado
+            if (reconnected) this.updateData();
+        });
+        
+        source.addEventListener('reading', (e) => {
+            this.handleLiveReading(JSON.parse(e.data));
+        });
+        
+        source.onerror = () => {
+            // O EventSource reconecta sozinho; até lá o polling assume
+            if (this.state.streamConnected) {
+                console.warn('Stream de monitoramento desconectado, voltando ao polling');
+            }
+            this.state.streamConnected = false;
+        };
+    },
+    
+    // Nova leitura recebida pelo stream
+    handleLiveReading(event) {
+        if (['7d', '30d'].includes(this.state.currentPeriod)) {
+            // Períodos agregados: uma recarga agrupada em vez de uma por leitura
+            if (!this.state.refreshTimer) {
+                this.state.refreshTimer = setTimeout(() => {
+                    this.state.refreshTimer = null;
+                    this.updateData();
+                }, this.config.updateInterval);
+            }
+            return;
+        }
+        
+        this.insertLiveRow(event.row);
+        this.updateMetrics();
+        this.updateTable();
+        this.updateLastUpdateTime();
+    },
+    
+    // Insere a linha na ordem (mais recentes primeiro) e remove o que saiu da janela
+    insertLiveRow(row) {
+        const windowStart = Date.now() - (this.config.periodWindows[this.state.currentPeriod] || this.config.periodWindows['24h']);
+        const rowTime = (r) => r.inicio ? Date.parse(r.inicio.endsWith('Z') ? r.inicio : `${r.inicio}Z`) : NaN;
+        
+        const time = rowTime(row);
+        if (time < windowStart) return;
+        
+        // Leituras enviadas depois (timestamp do cliente) entram na posição certa
+        const position = isNaN(time) ? 0 : this.realData.findIndex(r => rowTime(r) <= time);
+        this.realData.splice(position === -1 ? this.realData.length : position, 0, row);
+        // Linhas sem horário completo ficam até a próxima ressincronização
+        this.realData = this.realData.filter(r => !(rowTime(r) < windowStart));
+    },
+    
     // Atualizar correlações
     updateCorrelations() {
         console.log('Iniciando updateCorrelations...');
@@ -54,9 +54,7 @@ const UnityDashboard = {
         this.showLoading('monitoring-content', 'Carregando monitoramento...');
 
         try {
-            // Adicionar timestamp para evitar cache
-            const timestamp = new Date().getTime();
-            const response = await fetch(`${this.baseUrl}/unity/dashboard/${unityId}?t=${timestamp}`);
+            const response = await fetch(`${this.baseUrl}/unity/dashboard/${unityId}`, { cache: 'no-store' });
             
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
@@ -940,12 +938,15 @@ const UnityDashboard = {
         this.showLoading('dashboard-content', 'Atualizando...');
         
         try {
-            // Recarregar dados do dashboard
-            const timestamp = new Date().getTime();
-            const response = await fetch(`${this.baseUrl}/unity/dashboard/${this.currentUnityId}?t=${timestamp}`);
+            // Recarregar só o resumo (sem perfil completo e histórico)
+            const response = await fetch(`${this.baseUrl}/unity/dashboard/${this.currentUnityId}?summary=true`, { cache: 'no-store' });
             
             if (response.ok) {
-                const data = await response.json();
+                const summary = await response.json();
+                const data = Object.assign(this.currentUserData || {}, {
+                    latest_soil_data: summary.latest_soil_data,
+                    dashboard_data: summary.dashboard_data
+                });
                 this.currentUserData = data;
                 
                 // Atualizar seções